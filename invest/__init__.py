@@ -3,8 +3,18 @@ Investment related utilities.
 """
 
 from invest.base import *
-from invest.dacc import proj_root_dir, TickerData
 from invest.util import (
     all_info,
     all_info_printable_string,
 )
+
+_lazy_dacc_names = ('proj_root_dir', 'TickerData')
+
+
+def __getattr__(name):
+    # invest.dacc (and what it imports) is only loaded when it's needed
+    if name in _lazy_dacc_names:
+        from invest import dacc
+
+        return getattr(dacc, name)
+    raise AttributeError(f"module 'invest' has no attribute '{name}'")
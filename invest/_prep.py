@@ -1,12 +1,22 @@
 """
 Data prep tools for invest.
+
+The keys of a ``Ticker`` are the (public) attributes of ``yfinance.Ticker``.
+Finding them requires importing, and reflecting on, ``yfinance``, which is slow,
+so they are read from a precomputed manifest (``data/ticker_keys.json``) instead.
+After upgrading ``yfinance``, check ``ticker_keys_manifest_is_current()`` and,
+if needed, call ``regenerate_ticker_keys_manifest()``.
 """
+import os
+import json
 from inspect import signature, Parameter
 
-import yfinance as yf
-
 _empty_parameter_value = Parameter.empty
 
+TICKER_KEYS_MANIFEST_PATH = os.path.join(
+    os.path.dirname(__file__), 'data', 'ticker_keys.json'
+)
+
 _known_duplicate_pairs = (
     ('balance_sheet', 'balancesheet'),
     ('quarterly_balance_sheet', 'quarterly_balancesheet'),
@@ -34,17 +44,62 @@ def _method_has_defaults_for_all_arguments(func):
             return False
 
 
-_ticker_attrs_that_are_properties = {a for a in dir(yf.Ticker)
-                                     if not a.startswith('_')
-                                     and not callable(getattr(yf.Ticker, a))}
+def _reflect_ticker_attrs():
+    """Get the property and callable attribute names of ``yf.Ticker`` by reflection."""
+    import yfinance as yf
+
+    properties = {a for a in dir(yf.Ticker)
+                  if not a.startswith('_')
+                  and not callable(getattr(yf.Ticker, a))}
+
+    callables = {a for a in dir(yf.Ticker)
+                 if not a.startswith('_')
+                 and callable(getattr(yf.Ticker, a))
+                 and _method_has_defaults_for_all_arguments}
+
+    _remove_some_known_duplicates(properties)
+    _remove_some_known_duplicates(callables)
+    return properties, callables
+
+
+def _yfinance_version():
+    from importlib.metadata import version
+
+    return version('yfinance')
+
+
+def regenerate_ticker_keys_manifest(filepath=TICKER_KEYS_MANIFEST_PATH):
+    """Reflect on the installed ``yfinance`` to (re)write the ticker keys manifest."""
+    properties, callables = _reflect_ticker_attrs()
+    manifest = {
+        'yfinance_version': _yfinance_version(),
+        'properties': sorted(properties),
+        'callables': sorted(callables),
+    }
+    with open(filepath, 'w') as fp:
+        json.dump(manifest, fp, indent=1)
+    return manifest
+
+
+def load_ticker_keys_manifest(filepath=TICKER_KEYS_MANIFEST_PATH):
+    with open(filepath) as fp:
+        return json.load(fp)
+
+
+def ticker_keys_manifest_is_current(filepath=TICKER_KEYS_MANIFEST_PATH):
+    """Whether the manifest was made with the installed version of ``yfinance``."""
+    return load_ticker_keys_manifest(filepath)['yfinance_version'] == _yfinance_version()
+
+
+def _ticker_attrs():
+    try:
+        manifest = load_ticker_keys_manifest()
+    except FileNotFoundError:
+        return _reflect_ticker_attrs()
+    return set(manifest['properties']), set(manifest['callables'])
 
-_ticker_attrs_that_are_callable = {a for a in dir(yf.Ticker)
-                                   if not a.startswith('_')
-                                   and callable(getattr(yf.Ticker, a))
-                                   and _method_has_defaults_for_all_arguments}
 
-_remove_some_known_duplicates(_ticker_attrs_that_are_properties)
-_remove_some_known_duplicates(_ticker_attrs_that_are_callable)
+_ticker_attrs_that_are_properties, _ticker_attrs_that_are_callable = _ticker_attrs()
 
 # remove those callable attrs that start with "get_"
 
@@ -0,0 +1,82 @@
+"""
+Asyncio tools for invest.
+
+The data access of invest (yfinance, local files) is blocking, so the async
+accessors run it in threads, with a bounded concurrency.
+(``asyncio`` itself is imported on first use, to keep ``import invest`` fast.)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+
+DFLT_MAX_CONCURRENCY = 16
+
+
+async def run_blocking(func: Callable, *args, executor=None):
+    """Run ``func(*args)`` in ``executor`` (default: the loop's) and await its result."""
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func, *args)
+
+
+async def amap_unordered(
+    func: Callable,
+    items: Iterable,
+    *,
+    max_concurrency: int = DFLT_MAX_CONCURRENCY,
+    executor=None,
+    return_exceptions: bool = False,
+):
+    """Asynchronously yield ``(item, func(item))`` pairs, in the order they complete.
+
+    At most ``max_concurrency`` calls run at a time (in ``executor``, or, if not
+    given, in a thread pool of ``max_concurrency`` threads made for the occasion).
+    ``items`` is consumed lazily, so it can be large.
+
+    :param return_exceptions: If ``True``, an exception raised by ``func(item)`` is
+        yielded as the value of ``item``. If ``False`` (default), it is raised
+        (and the remaining calls are cancelled).
+
+    >>> import asyncio
+    >>> async def squares():
+    ...     return sorted([x async for x in amap_unordered(lambda x: x * x, range(4))])
+    >>> asyncio.run(squares())
+    [(0, 0), (1, 1), (2, 4), (3, 9)]
+    """
+    import asyncio
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    item_of_task = dict()
+
+    async def call(item):
+        return await run_blocking(func, item, executor=executor)
+
+    items = iter(items)
+    try:
+        while True:
+            for item in items:
+                item_of_task[asyncio.ensure_future(call(item))] = item
+                if len(item_of_task) >= max_concurrency:
+                    break
+            if not item_of_task:
+                break
+            done, _ = await asyncio.wait(
+                item_of_task, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                item = item_of_task.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    result = e
+                yield item, result
+    finally:
+        for task in item_of_task:
+            task.cancel()
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
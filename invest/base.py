@@ -4,13 +4,19 @@ Base functionality for the invest package.
 
 from inspect import signature
 from importlib.resources import files
-from functools import lru_cache, cached_property
+from functools import lru_cache
 from typing import Iterable, Optional, Callable, Union
+from collections import OrderedDict
+from weakref import WeakValueDictionary
+import threading
 import os
 
 from dol import KvReader, add_ipython_key_completions
 
-import yfinance as yf
+from invest import metrics
+from invest.net import yfinance_session
+from invest.aio import DFLT_MAX_CONCURRENCY
+
 from invest._prep import (
     _ticker_attrs_that_are_properties,
     _ticker_attrs_that_are_methods,
@@ -24,8 +30,15 @@ DFLT_TICKER_SYMBOLS_FILENAME = 'default_ticker_symbols.csv'
 faang_tickers = list(('FB', 'AMZN', 'AAPL', 'NFLX', 'GOOG'))
 
 
+def _yf():
+    """The ``yfinance`` module, imported on first use (it's slow to import)"""
+    import yfinance
+
+    return yfinance
+
+
 def help_me_with(item: str):
-    attr = getattr(yf.Ticker, item)
+    attr = getattr(_yf().Ticker, item)
     print(
         f"{attr.__name__}\nwraps {attr}, whose signature is:\n{signature(attr)}\n{attr.__doc__}\n"
     )
@@ -101,8 +114,18 @@ class Tickers(KvReader):
     >>> assert 'NFLX' not in tickers
     >>> # and yet we have access to NFLX info
     >>> assert tickers['NFLX']['info']['shortName'] == 'Netflix, Inc.'
+
+    ``Ticker`` handles are interned: as long as a handle is alive (and the
+    ``intern_pool_size`` most recently used ones are kept alive), asking for the
+    same symbol again gives the same handle (and the same underlying ``yf.Ticker``,
+    with whatever it cached).
+
+    >>> tickers['NFLX'] is tickers['NFLX']
+    True
     """
 
+    intern_pool_size = 1024  # number of recently used Ticker handles kept alive
+
     def __init__(
         self,
         ticker_symbols: Union[str, Iterable] = 'local_list',
@@ -149,16 +172,79 @@ class Tickers(KvReader):
         assert isinstance(
             self.ticker_symbols, Iterable
         ), "self.ticker_symbols should be iterable at this point"
+        self._interned = WeakValueDictionary()
+        self._recently_used = OrderedDict()  # strong references to the last handles
+        self._intern_lock = threading.Lock()
 
     def __iter__(self):
         yield from self.ticker_symbols
 
     def __getitem__(self, k):
-        return Ticker(k, **self.kwargs_for_method_keys)
+        with self._intern_lock:
+            ticker = self._interned.get(k)
+            if ticker is None:
+                ticker = Ticker(k, **self.kwargs_for_method_keys)
+                self._interned[k] = ticker
+            if self.intern_pool_size:
+                self._recently_used[k] = ticker
+                self._recently_used.move_to_end(k)
+                if len(self._recently_used) > self.intern_pool_size:
+                    self._recently_used.popitem(last=False)
+        return ticker
 
     def __contains__(self, k):
         return k in self.ticker_symbols
 
+    async def aget(self, ticker_symbol, key, *, executor=None):
+        """Asynchronously get ``self[ticker_symbol][key]`` (fetched in a thread).
+
+        >>> import asyncio
+        >>> info = asyncio.run(Tickers().aget('NFLX', 'info'))  # doctest: +SKIP
+        >>> info['shortName']  # doctest: +SKIP
+        'Netflix, Inc.'
+        """
+        from invest.aio import run_blocking
+
+        ticker = self[ticker_symbol]
+        return await run_blocking(ticker.__getitem__, key, executor=executor)
+
+    async def aitems(
+        self,
+        key,
+        ticker_symbols=None,
+        *,
+        max_concurrency=DFLT_MAX_CONCURRENCY,
+        return_exceptions=False,
+    ):
+        """Asynchronously iterate over ``(ticker_symbol, self[ticker_symbol][key])``
+        pairs, in the order the values arrive (not the order of the symbols).
+
+        :param key: The ticker key to get (e.g. ``'info'``)
+        :param ticker_symbols: The symbols to get it for (default: all of ``self``)
+        :param max_concurrency: The maximum number of concurrent fetches
+        :param return_exceptions: If ``True``, the exception raised for a symbol is
+            yielded as its value, instead of being raised.
+
+        >>> import asyncio
+        >>> async def market_caps(tickers):
+        ...     return {
+        ...         symbol: info.get('marketCap')
+        ...         async for symbol, info in tickers.aitems('info', max_concurrency=8)
+        ...     }
+        >>> caps = asyncio.run(market_caps(Tickers(['AAPL', 'GOOG'])))  # doctest: +SKIP
+        """
+        from invest.aio import amap_unordered
+
+        if ticker_symbols is None:
+            ticker_symbols = self
+        async for ticker_symbol, value in amap_unordered(
+            lambda ticker_symbol: self[ticker_symbol][key],
+            ticker_symbols,
+            max_concurrency=max_concurrency,
+            return_exceptions=return_exceptions,
+        ):
+            yield ticker_symbol, value
+
     def __len__(self):
         return len(self.ticker_symbols)
 
@@ -182,6 +268,11 @@ class Ticker(KvReader):
     # Note: Subclasses could define this to get sub-stores of base Ticker
     _property_keys = _ticker_attrs_that_are_properties
     _method_keys = _ticker_attrs_that_are_methods
+    _valid_keys = frozenset(_property_keys | _method_keys)  # shared by all instances
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._valid_keys = frozenset(cls._property_keys | cls._method_keys)
 
     def __init__(self, ticker_symbol: str, **kwargs_for_method_keys):
         """
@@ -197,17 +288,34 @@ class Ticker(KvReader):
 
         >>> ticker = Ticker('GOOG', history=dict(period='1d', interval='15m'))
 
+        The underlying ``yfinance.Ticker`` is only made when data is first accessed.
 
         """
         self.ticker_symbol = ticker_symbol
-        self.ticker = yf.Ticker(ticker_symbol)
-        self._valid_keys = self._property_keys | self._method_keys
         self.kwargs_for_method_keys = kwargs_for_method_keys
+        self._yf_ticker = None
+
+    @property
+    def ticker(self):
+        """The underlying ``yfinance.Ticker`` (made on first access)"""
+        if self._yf_ticker is None:
+            self._yf_ticker = _yf().Ticker(
+                self.ticker_symbol, session=yfinance_session()
+            )
+        return self._yf_ticker
 
     def __iter__(self):
         yield from self._valid_keys
 
     def __getitem__(self, k):
+        m = metrics.registry
+        if m is None:
+            return self._get(k)
+        field = k if k in self._valid_keys else 'other'  # bound the label's values
+        with m.timer('invest_ticker_seconds', field=field):
+            return self._get(k)
+
+    def _get(self, k):
         try:
             attr = getattr(self.ticker, k)
         except AttributeError:
@@ -308,17 +416,136 @@ class TickersWithSpecificInfo(Tickers):
     help_me_with = staticmethod(help_me_with)
 
 
+def _yf_bulk_history(ticker_symbols, **history_kwargs):
+    """The histories of ``ticker_symbols``, in one ``yf.Tickers(...).history`` call,
+    as a frame whose columns are ``(ticker, price_field)`` pairs."""
+    yf_tickers = _yf().Tickers(list(ticker_symbols), session=yfinance_session())
+    return yf_tickers.history(**dict(history_kwargs, group_by='ticker'))
+
+
+DFLT_BULK_CHUNK_SIZE = 100
+
+
 class BulkHistory(Tickers):
+    """
+    The histories of a (possibly large) universe of tickers, downloaded in bulk.
+
+    The ticker symbols are split in chunks of ``chunk_size`` symbols, and the
+    histories of a chunk are downloaded (in a single bulk call) and written to
+    ``store`` the first time one of its tickers is asked for. Only one chunk is
+    held in memory at a time.
+
+    :param ticker_symbols: The ticker symbols (see ``Tickers``)
+    :param chunk_size: The number of ticker symbols to download in one call
+    :param store: Where to keep the downloaded chunks. By default, a ``dict``
+        (i.e. in memory). For large universes, give a local store, such as
+        ``invest.dacc.LocalTickerData()``, so that the chunks are on disk. The chunks
+        are kept under hidden keys (see ``invest.stores.is_hidden_key``), so they don't
+        show up as a ticker in the keys (or manifest) of such a store.
+    :param source: The ``(ticker_symbols, **history_kwargs) -> frame`` function
+        downloading the histories of a chunk, as a frame whose columns are
+        ``(ticker, price_field)`` pairs (default: ``yfinance``'s bulk API)
+    :param history_kwargs: The arguments of the history (``start``, ``interval``...)
+
+    >>> from invest.fakes import fake_bulk_history
+    >>> bulk = BulkHistory(['AAPL', 'GOOG', 'NVDA'], chunk_size=2,
+    ...                    source=fake_bulk_history, start='2024-01-01')
+    >>> bulk.symbol_chunks
+    [('AAPL', 'GOOG'), ('NVDA',)]
+    >>> list(bulk['NVDA'].columns)
+    ['Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits']
+    >>> len(bulk.store)  # only the chunk of NVDA was downloaded
+    1
+    >>> [ticker for ticker, df in bulk.chunk_items()]
+    ['AAPL', 'GOOG', 'NVDA']
+    >>> len(bulk.store)
+    2
+    """
+
     def __init__(
-        self, ticker_symbols: Union[str, Iterable] = faang_tickers, **history_kwargs
+        self,
+        ticker_symbols: Union[str, Iterable] = faang_tickers,
+        *,
+        chunk_size: int = DFLT_BULK_CHUNK_SIZE,
+        store=None,
+        source: Callable = _yf_bulk_history,
+        **history_kwargs,
     ):
         super().__init__(ticker_symbols=ticker_symbols, history=history_kwargs)
-        self.yf_tickers = yf.Tickers(ticker_symbols)
         self.history_kwargs = history_kwargs
+        self.chunk_size = chunk_size
+        self.store = dict() if store is None else store
+        self.source = source
+        symbols = self.ticker_symbols
+        if isinstance(symbols, (set, frozenset)):
+            symbols = sorted(symbols)  # so that chunks are the same from run to run
+        symbols = list(symbols)
+        self.symbol_chunks = [
+            tuple(symbols[i : i + chunk_size])
+            for i in range(0, len(symbols), chunk_size)
+        ]
+        self._chunk_idx_of_symbol = {
+            symbol: i
+            for i, chunk in enumerate(self.symbol_chunks)
+            for symbol in chunk
+        }
+        self._loaded_chunk = (None, None)  # (chunk_idx, frame) of the last chunk read
+        self._chunk_lock = threading.Lock()
+
+    def chunk_key(self, chunk_idx):
+        """The key of the ``chunk_idx``-th chunk in ``self.store``.
+
+        It depends on the symbols of the chunk and the history arguments, so that
+        a store can be shared by several ``BulkHistory`` instances. Its "ticker" part,
+        ``.bulk_history``, can't be taken for a ticker symbol (see ``stores.is_hidden_key``).
+        """
+        import hashlib
+
+        symbols = self.symbol_chunks[chunk_idx]
+        spec = repr((symbols, sorted(self.history_kwargs.items())))
+        digest = hashlib.md5(spec.encode()).hexdigest()[:12]
+        return f'.bulk_history{os.path.sep}{chunk_idx:05d}_{digest}'
+
+    def chunk(self, chunk_idx):
+        """The histories of the ``chunk_idx``-th chunk, downloaded (and stored)
+        if not already in the store."""
+        with self._chunk_lock:
+            loaded_idx, frame = self._loaded_chunk
+            if loaded_idx == chunk_idx:
+                return frame
+            k = self.chunk_key(chunk_idx)
+            if k in self.store:
+                frame = self.store[k]
+            else:
+                frame = self.source(self.symbol_chunks[chunk_idx], **self.history_kwargs)
+                self.store[k] = frame
+            self._loaded_chunk = (chunk_idx, frame)
+            return frame
 
-    @cached_property
-    def data(self):
-        return self.yf_tickers.history(**self.history_kwargs).stack(level=0).unstack()
+    @staticmethod
+    def _ticker_history(chunk, ticker_symbol):
+        return chunk[ticker_symbol].dropna(how='all')
 
     def __getitem__(self, k):
-        return self.data[k]
+        chunk_idx = self._chunk_idx_of_symbol.get(k)
+        if chunk_idx is None:
+            raise KeyError(f'{k} is not one of the ticker symbols of {self}')
+        return self._ticker_history(self.chunk(chunk_idx), k)
+
+    def chunk_items(self):
+        """Generate the ``(ticker_symbol, history)`` pairs, chunk by chunk."""
+        for chunk_idx, symbols in enumerate(self.symbol_chunks):
+            chunk = self.chunk(chunk_idx)
+            for ticker_symbol in symbols:
+                yield ticker_symbol, self._ticker_history(chunk, ticker_symbol)
+
+    @property
+    def data(self):
+        """The histories of all the tickers, in one frame, with ``(ticker, price_field)``
+        columns. Note that this holds all chunks in memory: prefer ``chunk_items``
+        for large universes."""
+        import pandas as pd
+
+        return pd.concat(
+            [self.chunk(i) for i in range(len(self.symbol_chunks))], axis=1
+        )
@@ -0,0 +1,575 @@
+"""
+Benchmarks for the invest data layer.
+
+These run offline, on synthetic data (see ``invest.fakes``), or on the data you
+give them.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+from typing import Mapping, Iterable, Optional
+
+DFLT_STORAGES = ('pickle', 'parquet', 'arrow')
+DFLT_IMPORT_TIME_BUDGET = 0.5  # seconds (dol, that invest needs, takes ~0.15s)
+HEAVY_MODULES = ('yfinance', 'pandas', 'requests', 'invest.dacc')
+
+
+def timeit(func, n_repeats=3):
+    """The best (minimum) time, in seconds, of ``n_repeats`` calls to ``func``."""
+    best = float('inf')
+    for _ in range(n_repeats):
+        tic = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - tic)
+    return best
+
+
+def synthetic_ticker_data(n_tickers=50, fields=('history', 'balance_sheet', 'info')):
+    """A ``{'{ticker}/{field}': value, ...}`` dict of synthetic data."""
+    from invest.fakes import fake_field_value
+
+    tickers = [f'T{i:05.0f}' for i in range(n_tickers)]
+    return {
+        f'{ticker}{os.path.sep}{field}': fake_field_value(ticker, field)
+        for field in fields
+        for ticker in tickers
+    }
+
+
+def storage_benchmark(
+    data: Optional[Mapping] = None,
+    storages: Iterable[str] = DFLT_STORAGES,
+    *,
+    columns=('Close',),
+    n_repeats: int = 3,
+    rootdir: Optional[str] = None,
+):
+    """Compare the storage formats of ``LocalTickerData`` on write time, (full and
+    column-projected) load time, and disk footprint.
+
+    :param data: A mapping of ``'{ticker}/{field}'`` keys to values (for example,
+        an existing ``LocalTickerData``). Default: ``synthetic_ticker_data()``.
+    :param storages: The storage formats to compare
+    :param columns: The columns to read in the projected read benchmark (only the
+        ``history`` keys are used for this one)
+    :param n_repeats: The number of times to repeat (reads) to get the best time of
+    :param rootdir: Where to write the benchmark stores (default: a temp dir,
+        deleted afterwards)
+    :return: A ``DataFrame`` with one row per storage format
+
+    >>> df = storage_benchmark(synthetic_ticker_data(5), ['pickle'], n_repeats=1)
+    >>> list(df.columns)
+    ['write_s', 'read_s', 'column_read_s', 'disk_bytes']
+    """
+    import pandas as pd
+    from invest.stores import TickerFiles, disk_usage
+
+    if data is None:
+        data = synthetic_ticker_data()
+    data = dict(data.items())
+    history_keys = [k for k in data if k.endswith(os.path.sep + 'history')]
+    columns = list(columns)
+
+    tmp_rootdir = rootdir is None
+    rootdir = rootdir or tempfile.mkdtemp()
+    rows = dict()
+    try:
+        for storage in storages:
+            store = TickerFiles(os.path.join(rootdir, storage), storage=storage)
+
+            def write():
+                for k, v in data.items():
+                    store[k] = v
+
+            def read():
+                for k in data:
+                    store.read(k)
+
+            def column_read():
+                for k in history_keys:
+                    store.read(k, columns=columns)
+
+            rows[storage] = dict(
+                write_s=timeit(write, 1),
+                read_s=timeit(read, n_repeats),
+                column_read_s=timeit(column_read, n_repeats),
+                disk_bytes=disk_usage(store.rootdir),
+            )
+    finally:
+        if tmp_rootdir:
+            shutil.rmtree(rootdir, ignore_errors=True)
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+_import_time_script = """
+import sys, time, json
+tic = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - tic
+print(json.dumps({{
+    'seconds': elapsed,
+    'heavy_modules': [m for m in {heavy_modules!r} if m in sys.modules],
+}}))
+"""
+
+
+def import_time(module='invest', n_repeats=3, heavy_modules=HEAVY_MODULES):
+    """The best time (in seconds) to import ``module`` in a fresh interpreter,
+    along with the list of ``heavy_modules`` that importing it loaded.
+
+    The interpreter is run with a temporary ``HOME`` and no stdin, so that any
+    filesystem side effect or interactive prompt would show (as an error).
+    """
+    script = _import_time_script.format(module=module, heavy_modules=heavy_modules)
+    best = None
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home)
+        env.pop('INVEST_ROOTDIR', None)
+        for _ in range(n_repeats):
+            result = json.loads(
+                subprocess.run(
+                    [sys.executable, '-c', script],
+                    env=env,
+                    stdin=subprocess.DEVNULL,
+                    capture_output=True,
+                    check=True,
+                    text=True,
+                ).stdout
+            )
+            if best is None or result['seconds'] < best['seconds']:
+                best = result
+        best['side_effect_files'] = os.listdir(home)
+    return best
+
+
+def check_import_time(budget=DFLT_IMPORT_TIME_BUDGET, module='invest'):
+    """Assert that importing ``module`` takes less than ``budget`` seconds, doesn't
+    load heavy modules (like ``yfinance`` or ``pandas``), and doesn't create files.
+
+    >>> result = check_import_time()  # doctest: +SKIP
+    """
+    result = import_time(module)
+    assert result['seconds'] < budget, (
+        f"Importing {module} took {result['seconds']:.3f}s (budget: {budget}s)"
+    )
+    assert not result['heavy_modules'], (
+        f"Importing {module} imported {result['heavy_modules']}"
+    )
+    assert not result['side_effect_files'], (
+        f"Importing {module} created {result['side_effect_files']} in HOME"
+    )
+    return result
+
+
+def ticker_handles_benchmark(ticker_symbols='local_list', n_passes=3):
+    """Measure the time and memory taken by getting ``Ticker`` handles for a whole
+    universe of tickers (by default, the ~4000 of the default list), ``n_passes`` times.
+
+    Returns the time per pass, the memory allocated (and still held) per handle,
+    the peak memory, and how many distinct handles and ``yf.Ticker`` objects were made.
+
+    >>> r = ticker_handles_benchmark(['AAPL', 'GOOG'], n_passes=2)
+    >>> r['n_distinct_handles'], r['n_yf_tickers']
+    (2, 0)
+    """
+    import tracemalloc
+    from invest.base import Tickers
+
+    tickers = Tickers(ticker_symbols)
+    seen = dict()
+    tracemalloc.start()
+    try:
+        tic = time.perf_counter()
+        for _ in range(n_passes):
+            handles = [tickers[s] for s in tickers]
+            for handle in handles:
+                seen[id(handle)] = handle
+        elapsed = time.perf_counter() - tic
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    n_tickers = len(handles)
+    return dict(
+        n_tickers=n_tickers,
+        n_passes=n_passes,
+        seconds_per_pass=elapsed / n_passes,
+        bytes_per_handle=current_bytes / max(n_tickers, 1),
+        peak_bytes=peak_bytes,
+        n_distinct_handles=len(seen),
+        n_yf_tickers=sum(h._yf_ticker is not None for h in seen.values()),
+    )
+
+
+DFLT_STATEMENT_ITEMS = (
+    'Total Assets', 'Total Liab', 'Cash', 'Net Income', 'Total Revenue', 'Inventory'
+)
+
+
+def synthetic_quarterly_collections(
+    n_tickers=1000, n_quarters=4, items=DFLT_STATEMENT_ITEMS, *, seed=0
+):
+    """Synthetic quarterly collections, shaped like the ones ``DbDf`` reads from
+    Mongo (see ``invest.misc.yf_prep``): a ``{kind: df, ...}`` dict where the
+    ``quarterly_earnings`` frame has a ``records`` column (of lists of dicts) and
+    the statement frames have one (dict) cell per ticker and quarter.
+    """
+    import numpy as np
+    import pandas as pd
+    from invest.util import DFLT_DATE_FORMAT
+
+    rng = np.random.default_rng(seed)
+    tickers = [f'T{i:05.0f}' for i in range(n_tickers)]
+    quarter_ends = pd.date_range(end='2020-12-31', periods=n_quarters, freq='QE')
+
+    def statement_cell(date):
+        values = rng.normal(1e9, 2e8, len(items))
+        return dict(zip(items, values), Date=date)
+
+    statements = pd.DataFrame(
+        {
+            date.strftime(DFLT_DATE_FORMAT): [statement_cell(date) for _ in tickers]
+            for date in quarter_ends
+        },
+        index=pd.Index(tickers, name='ticker'),
+    )
+    earnings = pd.DataFrame(
+        {
+            'records': [
+                [
+                    {
+                        'Quarter': f'{date.quarter}Q{date.year}',
+                        'Revenue': rng.normal(1e9, 2e8),
+                        'Earnings': rng.normal(1e8, 2e7),
+                    }
+                    for date in quarter_ends
+                ]
+                for _ in tickers
+            ]
+        },
+        index=pd.Index(tickers, name='ticker'),
+    )
+    return {
+        'quarterly_earnings': earnings,
+        'quarterly_balance_sheet': statements,
+    }
+
+
+def quarterly_prep_benchmark(collections: Optional[Mapping] = None, n_repeats=1):
+    """Compare the per-ticker prep of quarterly collections (``prep_quarterly_*``,
+    used by the ``Dacc.quarterly_*`` properties of ``invest.misc.quarterly_features``)
+    with the bulk (long table) prep.
+
+    :param collections: A ``{kind: df, ...}`` dict of collections, as ``DbDf`` gives
+        them. Default: ``synthetic_quarterly_collections()``.
+
+    Returns a frame with, for each kind, the time of the per-ticker prep, of the
+    bulk prep (the long table), and of the bulk prep followed by making all the
+    per-ticker views.
+    """
+    import pandas as pd
+    from invest.misc import quarterly_features as qf
+
+    if collections is None:
+        collections = synthetic_quarterly_collections()
+    cols = qf.Dacc.quarterly_earnings_cols
+    rows = dict()
+    for kind, df in collections.items():
+        if kind == 'quarterly_earnings':
+            per_ticker = lambda: qf.prep_quarterly_earnings(df, cols)
+            bulk = lambda: qf.long_quarterly_earnings(df, cols)
+        else:
+            per_ticker = lambda: qf.prep_quarterly_from_df(df)
+            bulk = lambda: qf.long_quarterly_from_df(df)
+        rows[kind] = dict(
+            n_tickers=len(df),
+            per_ticker_s=timeit(per_ticker, n_repeats),
+            bulk_s=timeit(bulk, n_repeats),
+            bulk_and_views_s=timeit(
+                lambda: list(qf.QuarterlyViews(bulk()).values()), n_repeats
+            ),
+        )
+    return pd.DataFrame(rows).T
+
+
+DFLT_SUITE_SIZES = (100, 1000, 10000)
+DFLT_SUITE_FIELDS = ('info', 'history')
+
+
+def synthetic_ticker_symbols(n_tickers):
+    return [f'T{i:05.0f}' for i in range(n_tickers)]
+
+
+def _count_errors(func, items):
+    """Call ``func`` on all ``items``, returning the number of (simulated) failures."""
+    from invest.fakes import FakeRemoteError
+
+    n_errors = 0
+    for item in items:
+        try:
+            func(item)
+        except FakeRemoteError:
+            n_errors += 1
+    return n_errors
+
+
+def _timed(func):
+    tic = time.perf_counter()
+    n_errors = func()
+    return dict(seconds=time.perf_counter() - tic, n_errors=n_errors or 0)
+
+
+def _bench_tickers_iteration(ticker_symbols, fields, rootdir, max_workers):
+    from invest.base import Tickers
+
+    tickers = Tickers(ticker_symbols)
+
+    def iterate():
+        for ticker_symbol in tickers:
+            tickers[ticker_symbol]
+
+    return {'tickers_iteration': _timed(iterate)}
+
+
+def _bench_ticker_getitem(ticker_symbols, fields, rootdir, max_workers):
+    from invest.base import Ticker
+
+    keys = [(s, field) for field in fields for s in ticker_symbols]
+    return {
+        'ticker_getitem': _timed(
+            lambda: _count_errors(lambda k: Ticker(k[0])[k[1]], keys)
+        )
+    }
+
+
+def _bench_ticker_data(ticker_symbols, fields, rootdir, max_workers):
+    from invest.dacc import TickerData
+    from invest.download import ticker_field_keys
+
+    td = TickerData(os.path.join(rootdir, 'ticker_data'))
+    keys = list(ticker_field_keys(ticker_symbols, fields))
+    read_all = lambda: _count_errors(td.__getitem__, keys)
+    return {'ticker_data_cold': _timed(read_all), 'ticker_data_warm': _timed(read_all)}
+
+
+def _bench_bulk_history(ticker_symbols, fields, rootdir, max_workers):
+    from invest.base import BulkHistory
+
+    bulk = BulkHistory(ticker_symbols)
+    return {
+        'bulk_history': _timed(
+            lambda: sum(len(h) == 0 for _, h in bulk.chunk_items())  # failed: empty
+        )
+    }
+
+
+def _bench_download_script(ticker_symbols, fields, rootdir, max_workers):
+    import io
+    from contextlib import redirect_stdout
+    from invest.dacc import LocalTickerData, NegativeCache
+    from invest.scripts.download_yf_data import download_yf_data
+
+    def download():
+        with redirect_stdout(io.StringIO()):
+            stats = download_yf_data(
+                LocalTickerData(os.path.join(rootdir, 'download')),
+                ticker_symbols,
+                fields,
+                negative_cache=NegativeCache(),
+                max_workers=max_workers,
+                checkpoint_filepath=os.path.join(rootdir, 'checkpoint.jsonl'),
+            )
+        return stats.n_failed
+
+    return {'download_script': _timed(download)}
+
+
+def _bench_quarterly_features(ticker_symbols, fields, rootdir, max_workers):
+    from invest.misc import quarterly_features as qf
+
+    collections = synthetic_quarterly_collections(len(ticker_symbols))
+    cols = qf.Dacc.quarterly_earnings_cols
+
+    def features():
+        features_dfs = []
+        for kind, df in collections.items():
+            if kind == 'quarterly_earnings':
+                long, kind_cols = qf.long_quarterly_earnings(df, cols), cols
+            else:
+                long, kind_cols = qf.long_quarterly_from_df(df), None
+            quarter_items = qf.QuarterlyViews(long).items()
+            features_dfs.append(qf.quarter_features_df(quarter_items, kind_cols))
+        qf.concat_features_dfs(features_dfs)
+
+    return {'quarterly_features': _timed(features)}
+
+
+suite_benchmarks = {
+    'tickers_iteration': _bench_tickers_iteration,
+    'ticker_getitem': _bench_ticker_getitem,
+    'ticker_data': _bench_ticker_data,
+    'bulk_history': _bench_bulk_history,
+    'download_script': _bench_download_script,
+    'quarterly_features': _bench_quarterly_features,
+}
+
+
+def _suite_meta(**params):
+    import platform
+    from datetime import datetime, timezone
+    from importlib.metadata import version, PackageNotFoundError
+
+    try:
+        invest_version = version('invest')
+    except PackageNotFoundError:
+        invest_version = None
+    return dict(
+        invest_version=invest_version,
+        python_version=platform.python_version(),
+        platform=platform.platform(),
+        started_at=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        params=params,
+    )
+
+
+def offline_benchmark_suite(
+    sizes: Iterable[int] = DFLT_SUITE_SIZES,
+    *,
+    benchmarks: Optional[Iterable[str]] = None,
+    fields: Iterable[str] = DFLT_SUITE_FIELDS,
+    latency: float = 0,
+    failure_rate: float = 0,
+    max_workers: int = 8,
+    seed: int = 0,
+    verbose: bool = False,
+):
+    """Benchmark the data layer on universes of ``sizes`` tickers, offline: ``yfinance``
+    is replaced by a ``FakeYfinance`` (seeded synthetic data, with a simulated
+    ``latency`` per call, and a ``failure_rate`` of failing tickers).
+
+    :param benchmarks: The names of the ``suite_benchmarks`` to run (default: all):
+        ``Tickers`` iteration, ``Ticker[field]``, ``TickerData`` cold and warm reads,
+        ``BulkHistory``, the download script (``download_yf_data``), and the quarterly
+        feature pipeline (which needs the dependencies of ``invest.misc``)
+    :param fields: The fields that the benchmarks read
+    :return: A (json-serializable) ``{'meta': {...}, 'results': [...]}`` dict,
+        with one ``{'benchmark', 'n_tickers', 'seconds', 'n_errors', 'us_per_ticker'}``
+        result per benchmark and size (or a ``skipped`` reason instead of the timings).
+        See ``compare_benchmark_results`` to compare two of them.
+
+    >>> suite = offline_benchmark_suite([10], benchmarks=['ticker_data'], failure_rate=0.2)
+    >>> [(r['benchmark'], r['n_tickers'], r['n_errors']) for r in suite['results']]
+    [('ticker_data_cold', 10, 8), ('ticker_data_warm', 10, 8)]
+    """
+    from invest.fakes import FakeYfinance, patch_yfinance, seeded_failures
+
+    fields = list(fields)
+    names = list(suite_benchmarks) if benchmarks is None else list(benchmarks)
+    meta = _suite_meta(
+        sizes=list(sizes), benchmarks=names, fields=fields, latency=latency,
+        failure_rate=failure_rate, max_workers=max_workers, seed=seed,
+    )
+    fake_yf = FakeYfinance(latency=latency, fail_tickers=seeded_failures(failure_rate, seed=seed))
+    results = []
+    with patch_yfinance(fake_yf):
+        for n_tickers in sizes:
+            ticker_symbols = synthetic_ticker_symbols(n_tickers)
+            for name in names:
+                rootdir = tempfile.mkdtemp()
+                try:
+                    rows = suite_benchmarks[name](ticker_symbols, fields, rootdir, max_workers)
+                except ImportError as e:
+                    rows = {name: dict(skipped=f'{type(e).__name__}: {e}')}
+                finally:
+                    shutil.rmtree(rootdir, ignore_errors=True)
+                for benchmark, row in rows.items():
+                    row = dict(benchmark=benchmark, n_tickers=n_tickers, **row)
+                    if 'seconds' in row:
+                        row['us_per_ticker'] = 1e6 * row['seconds'] / n_tickers
+                    results.append(row)
+                    if verbose:
+                        print(json.dumps(row))
+    return dict(meta=meta, results=results)
+
+
+def compare_benchmark_results(old: dict, new: dict, *, tolerance=0.2):
+    """Compare two ``offline_benchmark_suite`` outputs: one row per benchmark and size
+    they both have timings for, with the ``ratio`` of the new to the old time, and
+    whether it's a ``regression`` (slower by more than ``tolerance``).
+
+    >>> old = {'results': [{'benchmark': 'b', 'n_tickers': 10, 'seconds': 1.0}]}
+    >>> new = {'results': [{'benchmark': 'b', 'n_tickers': 10, 'seconds': 1.5}]}
+    >>> compare_benchmark_results(old, new)
+    [{'benchmark': 'b', 'n_tickers': 10, 'old_seconds': 1.0, 'new_seconds': 1.5, 'ratio': 1.5, 'regression': True}]
+    """
+    def timings(suite):
+        return {
+            (r['benchmark'], r['n_tickers']): r['seconds']
+            for r in suite['results']
+            if 'seconds' in r
+        }
+
+    old_timings, new_timings = timings(old), timings(new)
+    rows = []
+    for key, new_seconds in new_timings.items():
+        if key in old_timings:
+            ratio = new_seconds / max(old_timings[key], 1e-12)
+            rows.append(
+                dict(
+                    benchmark=key[0],
+                    n_tickers=key[1],
+                    old_seconds=old_timings[key],
+                    new_seconds=new_seconds,
+                    ratio=ratio,
+                    regression=ratio > 1 + tolerance,
+                )
+            )
+    return rows
+
+
+def main(argv=None):
+    """Run the ``offline_benchmark_suite`` and write its results (json) to a file, or
+    to stdout: ``python -m invest.benchmarks --sizes 100 1000 --output results.json``.
+    With ``--compare old.json``, also print the comparison with a previous run."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DFLT_SUITE_SIZES)
+    parser.add_argument('--benchmarks', nargs='+', choices=list(suite_benchmarks))
+    parser.add_argument('--fields', nargs='+', default=DFLT_SUITE_FIELDS)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0)
+    parser.add_argument('--max-workers', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='The file to write the results to')
+    parser.add_argument('--compare', help='The results file of a previous run')
+    args = parser.parse_args(argv)
+
+    suite = offline_benchmark_suite(
+        args.sizes,
+        benchmarks=args.benchmarks,
+        fields=args.fields,
+        latency=args.latency,
+        failure_rate=args.failure_rate,
+        max_workers=args.max_workers,
+        seed=args.seed,
+        verbose=args.output is not None,
+    )
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(suite, fp, indent=1)
+    else:
+        print(json.dumps(suite, indent=1))
+    if args.compare:
+        with open(args.compare) as fp:
+            for row in compare_benchmark_results(json.load(fp), suite):
+                print(json.dumps(row), file=sys.stderr)
+    return suite
+
+
+if __name__ == '__main__':
+    main()
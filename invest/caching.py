@@ -0,0 +1,354 @@
+"""
+Caching policies for the invest data layer.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Callable, Optional, Union, Mapping
+
+path_sep = os.path.sep
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+Seconds = Union[int, float, timedelta, None]
+
+DFLT_TTL_OF_FIELD = {
+    # intraday: goes stale within hours (or less)
+    'info': 6 * HOUR,
+    'fast_info': 15 * MINUTE,
+    'option_chain': HOUR,
+    'options': HOUR,
+    'news': HOUR,
+    # daily
+    'history': DAY,
+    'actions': DAY,
+    'dividends': DAY,
+    'splits': DAY,
+    'calendar': DAY,
+    'earnings_dates': DAY,
+    'recommendations': DAY,
+    'upgrades_downgrades': DAY,
+    'analyst_price_targets': DAY,
+    # holders change slowly
+    'institutional_holders': 7 * DAY,
+    'mutualfund_holders': 7 * DAY,
+    'major_holders': 7 * DAY,
+    # quarterly filings
+    'quarterly_balance_sheet': 30 * DAY,
+    'quarterly_cashflow': 30 * DAY,
+    'quarterly_cash_flow': 30 * DAY,
+    'quarterly_financials': 30 * DAY,
+    'quarterly_income_stmt': 30 * DAY,
+    'quarterly_earnings': 30 * DAY,
+    # annual filings
+    'balance_sheet': 90 * DAY,
+    'cashflow': 90 * DAY,
+    'cash_flow': 90 * DAY,
+    'financials': 90 * DAY,
+    'income_stmt': 90 * DAY,
+    'earnings': 90 * DAY,
+}
+
+
+def _seconds(ttl: Seconds) -> Optional[float]:
+    if isinstance(ttl, timedelta):
+        return ttl.total_seconds()
+    return ttl
+
+
+class FreshnessPolicy:
+    """Says when a cached ``'{ticker}/{field}'`` value is stale.
+
+    :param ttl_of_field: The time-to-live (seconds or ``timedelta``) of each field.
+    :param ttl: The time-to-live of fields not listed in ``ttl_of_field``
+        (``None``, the default, means they never go stale)
+    :param ttl_of_ticker: Overrides for specific tickers: maps a ticker to a ttl (for all
+        its fields) or to a ``{field: ttl, ...}`` dict.
+    :param mode: What to do with stale values: ``'sync'`` to refetch them before
+        returning them, or ``'background'`` to return the stale value right away,
+        and refresh it in the background.
+
+    >>> policy = FreshnessPolicy(ttl_of_ticker={'GME': {'info': 60}})
+    >>> policy.ttl_for('NVDA/info'), policy.ttl_for('GME/info')
+    (21600, 60)
+    >>> policy.is_stale('GME/info', fetched_at=time.time() - 120)
+    True
+    >>> policy.is_stale('NVDA/info', fetched_at=time.time() - 120)
+    False
+    >>> policy.is_stale('NVDA/some_unknown_field', fetched_at=0)  # no ttl: never stale
+    False
+    """
+
+    modes = ('sync', 'background')
+
+    def __init__(
+        self,
+        ttl_of_field: Mapping[str, Seconds] = DFLT_TTL_OF_FIELD,
+        *,
+        ttl: Seconds = None,
+        ttl_of_ticker: Optional[Mapping[str, Union[Seconds, Mapping]]] = None,
+        mode: str = 'sync',
+    ):
+        if mode not in self.modes:
+            raise ValueError(f"mode should be one of {self.modes}. Was {mode}")
+        self.ttl_of_field = {k: _seconds(v) for k, v in ttl_of_field.items()}
+        self.ttl = _seconds(ttl)
+        self.ttl_of_ticker = dict(ttl_of_ticker or {})
+        self.mode = mode
+
+    def ttl_for(self, k) -> Optional[float]:
+        """The ttl (in seconds) of key ``k``, or ``None`` if it never goes stale."""
+        ticker, field = k.split(path_sep)
+        if ticker in self.ttl_of_ticker:
+            override = self.ttl_of_ticker[ticker]
+            if not isinstance(override, Mapping):
+                return _seconds(override)
+            if field in override:
+                return _seconds(override[field])
+        return self.ttl_of_field.get(field, self.ttl)
+
+    def is_stale(self, k, fetched_at: float, now: Optional[float] = None) -> bool:
+        ttl = self.ttl_for(k)
+        if ttl is None:
+            return False
+        if now is None:
+            now = time.time()
+        return now - fetched_at > ttl
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(ttl={self.ttl}, mode='{self.mode}', "
+            f"ttl_of_ticker={self.ttl_of_ticker})"
+        )
+
+
+class MemoryTier:
+    """An in-memory LRU cache whose size is bounded by a number of bytes (not items).
+
+    :param max_bytes: The byte budget. Least recently used items are evicted to stay
+        within it. Items larger than the whole budget are not cached.
+    :param sizeof: The function estimating the size of a value (by default,
+        ``memory_usage(deep=True)`` for pandas objects, see ``invest.util.approx_nbytes``)
+
+    >>> tier = MemoryTier(max_bytes=100, sizeof=len)
+    >>> tier.put('a', 'x' * 60)
+    >>> tier.put('b', 'y' * 30)
+    >>> tier.get('a') is not None  # 'a' is now the most recently used
+    True
+    >>> tier.put('c', 'z' * 30)  # over budget: evicts the least recently used, 'b'
+    >>> sorted(tier)
+    ['a', 'c']
+    >>> tier.invalidate('a')
+    >>> tier.get('a') is None
+    True
+    >>> tier.stats()
+    {'hits': 1, 'misses': 1, 'evictions': 1, 'n_items': 1, 'n_bytes': 30, 'max_bytes': 100}
+    """
+
+    def __init__(self, max_bytes: int, *, sizeof=None):
+        if sizeof is None:
+            from invest.util import approx_nbytes as sizeof
+
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.n_bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self._items = OrderedDict()  # k -> (v, nbytes)
+        self._lock = threading.Lock()
+
+    def get(self, k, default=None):
+        with self._lock:
+            try:
+                v, _ = self._items[k]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items.move_to_end(k)
+            self.hits += 1
+            return v
+
+    def put(self, k, v, nbytes: Optional[int] = None):
+        """Cache ``v`` under ``k``. The size is ``sizeof(v)`` unless ``nbytes`` is given."""
+        if nbytes is None:
+            nbytes = self.sizeof(v)
+        with self._lock:
+            self._pop(k)
+            if nbytes > self.max_bytes:
+                return
+            self._items[k] = (v, nbytes)
+            self.n_bytes += nbytes
+            while self.n_bytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._items.popitem(last=False)
+                self.n_bytes -= evicted_nbytes
+                self.evictions += 1
+
+    def _pop(self, k):
+        item = self._items.pop(k, None)
+        if item is not None:
+            self.n_bytes -= item[1]
+
+    def invalidate(self, k):
+        """Forget ``k`` (if it was cached)."""
+        with self._lock:
+            self._pop(k)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.n_bytes = 0
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._items))
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, k):
+        return k in self._items
+
+    def stats(self):
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            n_items=len(self._items),
+            n_bytes=self.n_bytes,
+            max_bytes=self.max_bytes,
+        )
+
+    def __repr__(self):
+        return f'{type(self).__name__}(max_bytes={self.max_bytes})'
+
+
+try:
+    import fcntl
+
+    def _lock_file(fp):
+        fcntl.flock(fp, fcntl.LOCK_EX)
+
+    def _unlock_file(fp):
+        fcntl.flock(fp, fcntl.LOCK_UN)
+
+except ImportError:  # Windows
+    import msvcrt
+
+    def _lock_file(fp):
+        fp.seek(0)  # (lock the first byte, which may be beyond the end of the file)
+        while True:
+            try:
+                msvcrt.locking(fp.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:  # LK_LOCK gives up after about 10 seconds: try again
+                pass
+
+    def _unlock_file(fp):
+        fp.seek(0)
+        msvcrt.locking(fp.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(filepath):
+    """Hold an exclusive lock (``flock``, or ``msvcrt.locking`` on Windows) on
+    ``filepath`` (made if missing), which coordinates processes (and threads) on the
+    same machine.
+
+    >>> import tempfile
+    >>> filepath = os.path.join(tempfile.mkdtemp(), 'x.lock')
+    >>> with file_lock(filepath):
+    ...     os.path.isfile(filepath)
+    True
+    """
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    with open(filepath, 'a+') as fp:
+        _lock_file(fp)
+        try:
+            yield
+        finally:
+            _unlock_file(fp)
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key: while a ``do(k, func)`` call is in
+    flight, other ``do(k, ...)`` calls wait for it, and share its result (or exception),
+    instead of calling their own ``func``.
+
+    :param lock_filepath_of_key: If given, the ``k -> filepath`` of a lock file, held
+        during the calls for ``k``, so that calls for the same key are also serialized
+        across processes. (A process that waited for another should then check if it
+        still needs to do the work: ``func`` is called, not shared, in that case.)
+
+    Here, ``fetch`` is held until the 7 other calls are waiting on the first one:
+
+    >>> import threading
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> calls, started, release = [], threading.Event(), threading.Event()
+    >>> def fetch():
+    ...     calls.append(1)
+    ...     started.set()
+    ...     release.wait()
+    ...     return 42
+    >>> flight = SingleFlight()
+    >>> with ThreadPoolExecutor(8) as executor:
+    ...     first = executor.submit(flight.do, 'NVDA/info', fetch)
+    ...     _ = started.wait()
+    ...     others = [executor.submit(flight.do, 'NVDA/info', fetch) for _ in range(7)]
+    ...     while flight.stats()['n_coalesced'] < 7:
+    ...         _ = release.wait(0.001)
+    ...     release.set()
+    ...     results = [f.result() for f in [first, *others]]
+    >>> results, len(calls)
+    ([42, 42, 42, 42, 42, 42, 42, 42], 1)
+    >>> flight.stats()
+    {'n_calls': 1, 'n_coalesced': 7, 'n_in_flight': 0}
+    """
+
+    def __init__(self, lock_filepath_of_key: Optional[Callable] = None):
+        self.lock_filepath_of_key = lock_filepath_of_key
+        self.n_calls = self.n_coalesced = 0
+        self._flights = dict()  # k -> Future
+        self._lock = threading.Lock()
+
+    def do(self, k, func: Callable):
+        from concurrent.futures import Future
+
+        with self._lock:
+            flight = self._flights.get(k)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._flights[k] = Future()
+                self.n_calls += 1
+            else:
+                self.n_coalesced += 1
+        if not is_leader:
+            return flight.result()
+        try:
+            result = self._call(k, func)
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._flights[k]
+
+    def _call(self, k, func):
+        if self.lock_filepath_of_key is None:
+            return func()
+        with file_lock(self.lock_filepath_of_key(k)):
+            return func()
+
+    def stats(self):
+        return dict(
+            n_calls=self.n_calls,
+            n_coalesced=self.n_coalesced,
+            n_in_flight=len(self._flights),
+        )
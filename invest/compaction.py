@@ -0,0 +1,271 @@
+"""
+Write-time compaction of the tabular values (e.g. ``history`` frames) of a local store.
+
+Yahoo histories come as float64 prices, int64 volumes, and ``Dividends`` and
+``Stock Splits`` columns that are almost all zeros. A ``CompactionPolicy``, given to
+``TickerFiles`` (or ``LocalTickerData``, ``TickerData``), makes writes:
+
+- downcast float columns to float32, when it's lossless enough (``float_rtol``),
+- downcast integer (or whole float) columns to the smallest integer type that fits,
+- store mostly-zero columns as sparse columns (in pickles; the columnar formats
+  encode runs of zeros compactly anyway),
+- compress the files with ``zstd`` or ``lz4``.
+
+The original dtypes are kept with the value, and restored on read (unless
+``restore_dtypes=False``, to keep the compact frames in memory too).
+
+>>> import tempfile
+>>> import pandas as pd
+>>> from invest.stores import TickerFiles
+>>> from invest.fakes import FakeRemoteData
+>>> history = FakeRemoteData()['NVDA/history']
+>>> s = TickerFiles(tempfile.mkdtemp(), compaction=CompactionPolicy())
+>>> s['NVDA/history'] = history
+>>> s['NVDA/history'].dtypes.equals(history.dtypes)
+True
+>>> bool((s['NVDA/history'] - history).abs().max().max() < 1e-3)
+True
+>>> compact, info = CompactionPolicy().compact(history)
+>>> dict(compact.dtypes.astype(str))  # doctest: +NORMALIZE_WHITESPACE
+{'Open': 'float32', 'High': 'float32', 'Low': 'float32', 'Close': 'float32',
+ 'Volume': 'uint32', 'Dividends': 'Sparse[float32, 0]', 'Stock Splits': 'Sparse[uint8, 0]'}
+"""
+
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from invest.stores import COMPACTION_META_KEY, split_key
+
+DFLT_COMPACTED_FIELDS = frozenset({'history'})
+DFLT_FLOAT_RTOL = 1e-6
+DFLT_SPARSE_THRESHOLD = 0.9
+COMPRESSIONS = ('zstd', 'lz4')
+
+
+@dataclass(frozen=True)
+class CompactionPolicy:
+    """How to compact values on write (see the module's docs).
+
+    :param fields: The fields whose (``DataFrame``) values are compacted
+    :param float_rtol: Float columns are stored as float32 if no value changes by more
+        than this (relative) tolerance (``None``: never)
+    :param downcast_ints: Whether to store integer (and whole float) columns with the
+        smallest integer type that fits
+    :param sparse_threshold: Columns with at least this fraction of zeros are stored
+        sparse (``None``: never)
+    :param compression: ``'zstd'``, ``'lz4'`` or ``None``: the compression of the files
+        (of all the fields) written by the store
+    :param restore_dtypes: Whether reads give back the original dtypes (otherwise, they
+        give the compact frames)
+    """
+
+    fields: frozenset = DFLT_COMPACTED_FIELDS
+    float_rtol: Optional[float] = DFLT_FLOAT_RTOL
+    downcast_ints: bool = True
+    sparse_threshold: Optional[float] = DFLT_SPARSE_THRESHOLD
+    compression: Optional[str] = 'zstd'
+    restore_dtypes: bool = True
+
+    def __post_init__(self):
+        if self.compression is not None and self.compression not in COMPRESSIONS:
+            raise ValueError(
+                f"compression should be one of {COMPRESSIONS} (or None). "
+                f"Was {self.compression}"
+            )
+
+    def applies_to(self, field) -> bool:
+        return field in self.fields
+
+    def compact(self, v):
+        """The ``(compact_v, info)`` pair of ``v``, where ``info`` is what ``expand``
+        needs to restore it (``None`` if ``v`` isn't a ``DataFrame``, then left as is)."""
+        import pandas as pd
+
+        if not isinstance(v, pd.DataFrame) or not v.columns.is_unique:
+            return v, None
+        # a frame read with restore_dtypes=False carries the dtypes it was compacted from
+        original_dtypes = v.attrs.get(COMPACTION_META_KEY, {}).get('dtypes', {})
+        v = v.astype({name: dtype.subtype for name, dtype in _sparse_dtypes(v)})
+        dtypes = {
+            name: original_dtypes.get(name, dtype) for name, dtype in v.dtypes.items()
+        }
+        columns, sparse = dict(), []
+        for name, column in v.items():
+            column = self._downcast(column)
+            if self._is_sparse(column):
+                column = column.astype(pd.SparseDtype(column.dtype, 0))
+                sparse.append(name)
+            columns[name] = column
+        compact = pd.DataFrame(columns, index=v.index)
+        compact.columns = v.columns
+        compact.attrs = {}
+        return compact, {'dtypes': dtypes, 'sparse': sparse}
+
+    def _downcast(self, column):
+        import numpy as np
+        import pandas as pd
+
+        kind = column.dtype.kind if isinstance(column.dtype, np.dtype) else None
+        if kind not in ('i', 'u', 'f') or len(column) == 0:
+            return column
+        values = column.to_numpy()
+        if self.downcast_ints and _whole(values):
+            return pd.to_numeric(
+                column, downcast='unsigned' if values.min() >= 0 else 'integer'
+            )
+        if kind == 'f' and values.dtype.itemsize > 4 and self.float_rtol is not None:
+            with np.errstate(over='ignore'):
+                as_float32 = values.astype('float32')
+            if np.allclose(
+                as_float32, values, rtol=self.float_rtol, atol=0, equal_nan=True
+            ):
+                return column.astype('float32')
+        return column
+
+    def _is_sparse(self, column):
+        import numpy as np
+
+        if self.sparse_threshold is None or len(column) == 0:
+            return False
+        if not isinstance(column.dtype, np.dtype) or column.dtype.kind not in 'iuf':
+            return False
+        return (column.to_numpy() == 0).mean() >= self.sparse_threshold
+
+    def expand(self, v, info, *, restore_dtypes: Optional[bool] = None):
+        """Undo ``compact``: give ``v`` its original dtypes back (if ``restore_dtypes``,
+        default: the policy's), or else (only) make its sparse columns sparse again
+        (the columnar formats store them dense), and keep ``info`` in its ``attrs``, so
+        that compacting it again (e.g. to write it back) keeps the original dtypes.
+
+        >>> import tempfile
+        >>> from invest.stores import TickerFiles
+        >>> from invest.fakes import FakeRemoteData
+        >>> history = FakeRemoteData()['NVDA/history']
+        >>> s = TickerFiles(tempfile.mkdtemp(), compaction=CompactionPolicy())
+        >>> s['NVDA/history'] = history
+        >>> compact, meta = s.read_with_meta('NVDA/history', restore_dtypes=False)
+        >>> str(compact['Volume'].dtype)
+        'uint32'
+        >>> s.write('NVDA/history', compact, meta)  # written back as is...
+        >>> s['NVDA/history'].dtypes.equals(history.dtypes)  # ... still int64, float64...
+        True
+        """
+        import pandas as pd
+
+        if restore_dtypes is None:
+            restore_dtypes = self.restore_dtypes
+        if not info or not isinstance(v, pd.DataFrame):
+            return v
+        if restore_dtypes:
+            dtypes = info['dtypes']
+            columns = {
+                name: _dense(column).astype(dtypes[name])
+                if name in dtypes
+                else column
+                for name, column in v.items()
+            }
+        else:
+            sparse = set(info['sparse'])
+            columns = {
+                name: column.astype(pd.SparseDtype(column.dtype, 0))
+                if name in sparse and not isinstance(column.dtype, pd.SparseDtype)
+                else column
+                for name, column in v.items()
+            }
+        expanded = pd.DataFrame(columns, index=v.index)
+        expanded.columns = v.columns
+        expanded.attrs = {} if restore_dtypes else {COMPACTION_META_KEY: info}
+        return expanded
+
+
+def _whole(values):
+    """Whether the (numeric) ``values`` are all (finite) whole numbers."""
+    import numpy as np
+
+    if values.dtype.kind in 'iu':
+        return True
+    return bool(np.isfinite(values).all() and (values == np.round(values)).all())
+
+
+def _sparse_dtypes(df):
+    """The ``(name, dtype)`` pairs of the sparse columns of ``df`` (e.g. of a frame
+    read with ``restore_dtypes=False``, which is then compacted from its dense form)."""
+    import pandas as pd
+
+    return [(name, d) for name, d in df.dtypes.items() if isinstance(d, pd.SparseDtype)]
+
+
+def _dense(column):
+    import pandas as pd
+
+    if isinstance(column.dtype, pd.SparseDtype):
+        return column.sparse.to_dense()
+    return column
+
+
+def compaction_report(
+    store,
+    keys: Optional[Iterable] = None,
+    *,
+    policy: Optional[CompactionPolicy] = None,
+):
+    """A ``DataFrame`` of the bytes (on disk, and in memory) compaction saves, per field.
+
+    Each value of ``keys`` (default: all the keys of ``store``, a ``TickerFiles``, of the
+    fields of ``policy``) is written, with the format of ``store``, both as is and
+    compacted with ``policy`` (default: the store's, or a default ``CompactionPolicy``),
+    to measure the difference. So it can be used before turning compaction on.
+
+    >>> import tempfile
+    >>> from invest.stores import TickerFiles
+    >>> from invest.fakes import FakeRemoteData
+    >>> s = TickerFiles(tempfile.mkdtemp())
+    >>> for ticker in ('NVDA', 'AAPL'):
+    ...     s[f'{ticker}/history'] = FakeRemoteData()[f'{ticker}/history']
+    >>> report = compaction_report(s)
+    >>> list(report.columns)  # doctest: +NORMALIZE_WHITESPACE
+    ['n_keys', 'bytes', 'compacted_bytes', 'saved_bytes', 'saved_ratio',
+     'memory_bytes', 'compacted_memory_bytes']
+    >>> int(report.loc['history', 'n_keys']), bool(report.loc['history', 'saved_ratio'] > 0.3)
+    (2, True)
+    """
+    import pandas as pd
+    from invest.util import approx_nbytes
+
+    policy = policy or getattr(store, 'compaction', None) or CompactionPolicy()
+    if keys is None:
+        keys = (k for k in store if policy.applies_to(split_key(k)[1]))
+    totals = dict()
+    with tempfile.TemporaryDirectory() as dirpath:
+        filepath = os.path.join(dirpath, 'value')
+        for k in keys:
+            v, meta = store.read_with_meta(k, restore_dtypes=True)
+            meta = {key: x for key, x in meta.items() if key != COMPACTION_META_KEY}
+            codec = store._codec_to_write(k, v)
+            codec.write(filepath, v, meta)
+            n_bytes = os.path.getsize(filepath)
+            compact, info = policy.compact(v)
+            compact_meta = dict(meta, **{COMPACTION_META_KEY: info}) if info else meta
+            codec.write(filepath, compact, compact_meta, compression=policy.compression)
+            field = split_key(k)[1]
+            row = totals.setdefault(field, dict.fromkeys(_REPORT_COUNTS, 0))
+            row['n_keys'] += 1
+            row['bytes'] += n_bytes
+            row['compacted_bytes'] += os.path.getsize(filepath)
+            row['memory_bytes'] += approx_nbytes(v)
+            row['compacted_memory_bytes'] += approx_nbytes(compact)
+    report = pd.DataFrame.from_dict(totals, orient='index', columns=list(_REPORT_COUNTS))
+    report['saved_bytes'] = report['bytes'] - report['compacted_bytes']
+    report['saved_ratio'] = report['saved_bytes'] / report['bytes']
+    return report[
+        ['n_keys', 'bytes', 'compacted_bytes', 'saved_bytes', 'saved_ratio']
+        + ['memory_bytes', 'compacted_memory_bytes']
+    ]
+
+
+_REPORT_COUNTS = (
+    'n_keys', 'bytes', 'compacted_bytes', 'memory_bytes', 'compacted_memory_bytes'
+)
+
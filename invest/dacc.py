@@ -3,21 +3,29 @@ Data access components for the invest package.
 """
 
 import os
-from typing import Union, Tuple
+import json
+import time
+import threading
+from collections.abc import Mapping
+from typing import Union, Tuple, Optional
 
 from dol.filesys import ensure_slash_suffix
 from dol.caching import mk_sourced_store
 from dol.paths import str_template_key_trans
 from dol import (
     Pipe,
-    PickleFiles as LocalPickleStore,  # was from py2store
     add_ipython_key_completions,
     kv_wrap,
     wrap_kvs,
-    mk_dirs_if_missing,
 )
 
 from invest import Ticker
+from invest.stores import TickerFiles, TABULAR_FIELDS, split_key, _atomic_write
+from invest.caching import FreshnessPolicy, MemoryTier, SingleFlight
+from invest.compaction import CompactionPolicy
+from invest import metrics
+from invest.aio import DFLT_MAX_CONCURRENCY
+from invest.util import approx_nbytes
 from invest.util import handle_missing_dir
 
 ROOTDIR_ENVVAR = 'INVEST_ROOTDIR'
@@ -25,7 +33,6 @@ DFLT_ROOTDIR = os.environ.get(ROOTDIR_ENVVAR, os.path.expanduser('~/.invest'))
 DFLT_TICKER_DATA_DIR = os.path.join(DFLT_ROOTDIR, 'ticker_data')
 
 proj_root_dir = DFLT_ROOTDIR
-handle_missing_dir(proj_root_dir)
 
 
 def proj_file(*args):
@@ -34,6 +41,161 @@ def proj_file(*args):
 
 path_sep = os.path.sep
 
+DFLT_NEGATIVE_CACHE_FILEPATH = proj_file('negative_cache.jsonl')
+DFLT_RETRY_BASE_DELAY = 60 * 60  # seconds
+DFLT_RETRY_MAX_DELAY = 30 * 24 * 60 * 60
+
+
+class RecentlyFailedKeyError(KeyError):
+    """Raised, instead of fetching a key, when the key failed recently (and its retry
+    time, given by a ``NegativeCache``, hasn't come yet)."""
+
+
+class NegativeCache(Mapping):
+    """A persistent index of the keys whose fetches failed, so that they are not
+    fetched again (e.g. a delisted ticker) until their retry time.
+
+    The retry delay of a key grows exponentially with its number of consecutive
+    failures: ``base_delay * backoff_factor ** (n_failures - 1)``, up to ``max_delay``.
+    A success forgets the key.
+
+    Every change is appended (as a json line) to ``filepath``
+    (use ``filepath=None`` to only keep the index in memory).
+
+    >>> import tempfile
+    >>> filepath = os.path.join(tempfile.mkdtemp(), 'negative_cache.jsonl')
+    >>> negative_cache = NegativeCache(filepath, base_delay=60)
+    >>> negative_cache.record_failure('BAD/info', ValueError('no such ticker'))
+    >>> negative_cache.record_failure('BAD/info', ValueError('no such ticker'))
+    >>> negative_cache = NegativeCache(filepath, base_delay=60)  # reload it from file
+    >>> entry = negative_cache['BAD/info']
+    >>> entry['error'], entry['n_failures'], negative_cache.retry_delay(2)
+    ('ValueError', 2, 120)
+    >>> negative_cache.blocks('BAD/info'), negative_cache.blocks('AAPL/info')
+    (True, False)
+    >>> negative_cache.check('BAD/info')
+    Traceback (most recent call last):
+      ...
+    invest.dacc.RecentlyFailedKeyError: 'BAD/info failed 2 times (last: ValueError: no such ticker). Retrying in 120s'
+    """
+
+    def __init__(
+        self,
+        filepath: Optional[str] = None,
+        *,
+        base_delay: float = DFLT_RETRY_BASE_DELAY,
+        backoff_factor: float = 2,
+        max_delay: float = DFLT_RETRY_MAX_DELAY,
+        clock=time.time,
+    ):
+        self.filepath = filepath
+        self.base_delay = base_delay
+        self.backoff_factor = backoff_factor
+        self.max_delay = max_delay
+        self.clock = clock
+        self._entries = dict()
+        self._lock = threading.Lock()
+        if filepath is not None and os.path.isfile(filepath):
+            self._load()
+
+    def _load(self):
+        n_lines = 0
+        with open(self.filepath) as fp:
+            for line in fp:
+                n_lines += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a partially written last line
+                key = record.pop('key')
+                if record:
+                    self._entries[key] = record
+                else:
+                    self._entries.pop(key, None)
+        if n_lines > 2 * len(self._entries) + 100:
+            self.compact()
+
+    def _append(self, *records):
+        if self.filepath is not None:
+            os.makedirs(os.path.dirname(self.filepath) or '.', exist_ok=True)
+            with open(self.filepath, 'a') as fp:
+                fp.write(''.join(json.dumps(record) + '\n' for record in records))
+
+    def compact(self):
+        """Rewrite the file with only the current entries (one line per key)."""
+        if self.filepath is None:
+            return
+
+        def write(filepath):
+            with open(filepath, 'w') as fp:
+                for key, entry in self._entries.items():
+                    fp.write(json.dumps(dict(entry, key=key)) + '\n')
+
+        with self._lock:
+            _atomic_write(self.filepath, write)
+
+    def retry_delay(self, n_failures: int) -> float:
+        delay = self.base_delay * self.backoff_factor ** (n_failures - 1)
+        return min(delay, self.max_delay)
+
+    def record_failure(self, k, error: BaseException):
+        self.record_failures([k], error)
+
+    def record_failures(self, keys, error: BaseException, *, n_failures: int = 1):
+        """Record ``n_failures`` (more) failures of each of ``keys``, with one append
+        (e.g. to seed the cache with keys known to fail).
+
+        >>> negative_cache = NegativeCache(base_delay=60, max_delay=3600)
+        >>> negative_cache.record_failures(['A/info', 'B/info'], KeyError('gone'), n_failures=7)
+        >>> negative_cache['A/info']['n_failures'], negative_cache.retry_delay(7)
+        (7, 3600)
+        """
+        with self._lock:
+            failed_at = self.clock()
+            records = []
+            for k in keys:
+                n = self._entries.get(k, {}).get('n_failures', 0) + n_failures
+                entry = {
+                    'error': type(error).__name__,
+                    'message': str(error)[:500],
+                    'n_failures': n,
+                    'failed_at': failed_at,
+                    'retry_at': failed_at + self.retry_delay(n),
+                }
+                self._entries[k] = entry
+                records.append(dict(entry, key=k))
+            self._append(*records)
+
+    def record_success(self, k):
+        with self._lock:
+            if self._entries.pop(k, None) is not None:
+                self._append({'key': k})
+
+    def blocks(self, k) -> bool:
+        """Whether ``k`` failed, and its retry time hasn't come yet."""
+        entry = self._entries.get(k)
+        return entry is not None and self.clock() < entry['retry_at']
+
+    def check(self, k):
+        """Raise a ``RecentlyFailedKeyError`` if ``self.blocks(k)``."""
+        entry = self._entries.get(k)
+        if entry is not None and self.clock() < entry['retry_at']:
+            raise RecentlyFailedKeyError(
+                f"{k} failed {entry['n_failures']} times "
+                f"(last: {entry['error']}: {entry['message']}). "
+                f"Retrying in {entry['retry_at'] - self.clock():.0f}s"
+            )
+
+    def __getitem__(self, k):
+        return self._entries[k]
+
+    def __iter__(self):
+        yield from list(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+
 remote_field_trans = str_template_key_trans(
     '{ticker}' + path_sep + '{field}', str_template_key_trans.key_types.str
 )
@@ -45,21 +207,50 @@ class _RemoteYfDataReader:
         ticker_symbol, field = k.split(path_sep)
         return Ticker(ticker_symbol)[field]
 
+    def history(self, ticker_symbol, **history_kwargs):
+        """Get the history of a ticker, with specific arguments (e.g. ``start``)"""
+        return Ticker(ticker_symbol, history=history_kwargs)['history']
+
 
 remote_data = _RemoteYfDataReader()
 
-ticker_field_trans = str_template_key_trans(
-    '{ticker}' + path_sep + '{field}.p', str_template_key_trans.key_types.str
-)
+DFLT_STORAGE = 'pickle'
 
 
 @add_ipython_key_completions
-@kv_wrap(ticker_field_trans)
-@mk_dirs_if_missing
-class LocalTickerData(LocalPickleStore):
-    def __init__(self, ticker_data_dir=DFLT_TICKER_DATA_DIR):
+class LocalTickerData(TickerFiles):
+    """Local ticker data, in ``{ticker_data_dir}/{ticker}/{field}{ext}`` files.
+
+    :param ticker_data_dir: The root directory of the data
+    :param storage: The format to store tabular fields (``history``, ``balance_sheet``,
+        ``dividends``, ...) in: ``'pickle'`` (the default), ``'parquet'`` or ``'arrow'``.
+        Non-tabular values (like ``info``) are always pickled.
+        See ``invest.stores`` for details.
+    :param manifest: Whether to keep a manifest of the keys (see ``stores.KeyManifest``),
+        so that listing the keys, and checking if a key is there, don't need to scan
+        the directories (made from the files on first use; use ``rebuild_manifest()``
+        if the files are changed by something else than the store)
+    :param compaction: A ``CompactionPolicy`` to write (``history``, by default) frames
+        with smaller dtypes, sparse columns, and compressed
+        (see ``invest.compaction``, and its ``compaction_report``)
+    """
+
+    def __init__(
+        self,
+        ticker_data_dir=DFLT_TICKER_DATA_DIR,
+        storage=DFLT_STORAGE,
+        tabular_fields=TABULAR_FIELDS,
+        manifest=True,
+        compaction: Optional[CompactionPolicy] = None,
+    ):
         handle_missing_dir(ticker_data_dir)
-        super().__init__(ensure_slash_suffix(ticker_data_dir), max_levels=1)
+        super().__init__(
+            ensure_slash_suffix(ticker_data_dir),
+            storage=storage,
+            tabular_fields=tabular_fields,
+            manifest=manifest,
+            compaction=compaction,
+        )
 
 
 _YahooData = mk_sourced_store(
@@ -71,6 +262,84 @@ _YahooData = mk_sourced_store(
 )
 
 
+def _restated(cached, tail, rtol):
+    """Whether the bars ``cached`` and ``tail`` have in common differ, leaving out
+    the last cached bar (which may have been a partial, intraday, one)"""
+    import numpy as np
+
+    overlap = cached.index[:-1].intersection(tail.index)
+    columns = [c for c in ('Open', 'High', 'Low', 'Close') if c in cached.columns]
+    if len(overlap) == 0 or not columns:
+        return False
+    old = cached.loc[overlap, columns].to_numpy(dtype=float)
+    new = tail.loc[overlap, columns].to_numpy(dtype=float)
+    return not np.allclose(old, new, rtol=rtol, equal_nan=True)
+
+
+def _has_corporate_actions(df, columns=('Dividends', 'Stock Splits')):
+    return any((df[c].fillna(0) != 0).any() for c in columns if c in df.columns)
+
+
+def _new_corporate_actions(cached, tail, columns=('Dividends', 'Stock Splits')):
+    """Whether ``tail`` has splits or dividends that ``cached`` doesn't: on the bars
+    after the cached ones, or on the (replaced) last cached bar"""
+    last = cached.index[-1]
+    if _has_corporate_actions(tail.loc[tail.index > last], columns):
+        return True
+    if last not in tail.index:
+        return False
+    columns = [c for c in columns if c in tail.columns]
+    new = tail.loc[last, columns].fillna(0).to_numpy(dtype=float)
+    old = cached.loc[last, columns].fillna(0).to_numpy(dtype=float)
+    return bool((new != old).any())
+
+
+def merge_history_tail(cached, tail, *, restatement_rtol=1e-6):
+    """Merge the ``tail`` of a history into the ``cached`` history.
+
+    Overlapping bars are deduplicated (keeping the ``tail``'s).
+    Returns ``None`` if the tail shows that the cached history was restated
+    (since prices are adjusted for splits and dividends, this happens when a
+    new bar has a split or dividend, or when overlapping bars differ), in which
+    case the whole history should be fetched again.
+    The last cached bar is left out of that comparison, since it may have been
+    fetched before the session closed: the ``tail``'s bar simply replaces it.
+
+    >>> import pandas as pd
+    >>> cached = pd.DataFrame({'Close': [1.0, 2.0, 3.0], 'Stock Splits': 0.0},
+    ...                       index=pd.date_range('2025-01-01', periods=3))
+    >>> tail = pd.DataFrame({'Close': [2.0, 3.0, 4.0], 'Stock Splits': 0.0},
+    ...                     index=pd.date_range('2025-01-02', periods=3))
+    >>> merge_history_tail(cached, tail)['Close'].tolist()
+    [1.0, 2.0, 3.0, 4.0]
+
+    A partial last bar (here, ``3.0`` before the close at ``3.2``) is replaced:
+
+    >>> partial_close = tail.assign(Close=[2.0, 3.2, 4.0])
+    >>> merge_history_tail(cached, partial_close)['Close'].tolist()
+    [1.0, 2.0, 3.2, 4.0]
+
+    But a split, or a change in an earlier bar, means a restatement:
+
+    >>> split = tail.assign(**{'Stock Splits': [0.0, 0.0, 2.0]})
+    >>> merge_history_tail(cached, split) is None
+    True
+    >>> restated = tail.assign(Close=[1.5, 3.0, 4.0])
+    >>> merge_history_tail(cached, restated) is None
+    True
+    """
+    import pandas as pd
+
+    if tail is None or len(tail) == 0:
+        return cached
+    if _restated(cached, tail, restatement_rtol) or _new_corporate_actions(cached, tail):
+        return None
+    merged = pd.concat([cached.loc[~cached.index.isin(tail.index)], tail])
+    merged = merged.sort_index()
+    merged.attrs = dict(cached.attrs)  # e.g. the original dtypes of a compacted history
+    return merged
+
+
 def join_tuples_with_sep(k: Union[str, Tuple[str]]) -> str:
     if isinstance(k, tuple):
         return path_sep.join(k)
@@ -83,8 +352,11 @@ def default_to_history(k: str) -> str:
     return k
 
 
+normalize_key = Pipe(join_tuples_with_sep, default_to_history)
+
+
 @add_ipython_key_completions
-@wrap_kvs(key_encoder=Pipe(join_tuples_with_sep, default_to_history))
+@wrap_kvs(key_encoder=normalize_key)
 class TickerData(_YahooData):
     """
     A store that can get data from Yahoo Finance, and store it locally.
@@ -102,8 +374,342 @@ class TickerData(_YahooData):
     ...
     2025-01-31  123.779999  127.849998  119.190002  120.070000  390372900        0.0           0.0
     2025-02-03  114.750000  118.570000  113.010002  116.660004  369021900        0.0           0.0
+
+    Tabular fields can be stored in a columnar format (``storage='parquet'`` or
+    ``storage='arrow'``) instead of pickles, which also allows reading only
+    some columns:
+
+    >>> td = TickerData(storage='arrow')  # doctest: +SKIP
+    >>> td.read('NVDA/history', columns=['Close'])  # doctest: +SKIP
+
+    A cached history is never refreshed by reads. To bring it up to date,
+    fetching only the bars that are missing (since the last cached one), do:
+
+    >>> td.refresh_history('NVDA')  # doctest: +SKIP
+    'appended'
+
+    By default, a cached value is served forever. Give a ``freshness`` policy to
+    refetch values that are older than their field's time-to-live (see
+    ``invest.caching.FreshnessPolicy``). For example, to refetch stale values
+    in the background (while serving the stale value), with a one minute ``info``
+    ttl for ``GME``:
+
+    >>> td = TickerData(freshness=FreshnessPolicy(  # doctest: +SKIP
+    ...     mode='background', ttl_of_ticker={'GME': {'info': 60}}
+    ... ))
+
+    The fetch time (and params) of a value are stored in the same file as the value,
+    so checking for staleness doesn't cost any extra I/O.
+
+    To avoid reading (and unpickling) the same values from disk over and over,
+    give a ``memory_budget`` (in bytes): an in-memory LRU cache of that size will
+    be kept in front of the local store (see ``invest.caching.MemoryTier``).
+
+    >>> td = TickerData(memory_budget=2 * 1024**3)  # doctest: +SKIP
+    >>> td.memory_tier.stats()  # doctest: +SKIP
+    {'hits': 0, 'misses': 0, 'evictions': 0, 'n_items': 0, 'n_bytes': 0, 'max_bytes': 2147483648}
+
+    To not fetch keys that failed recently (e.g. delisted tickers) over and over, give
+    a ``negative_cache`` (a ``NegativeCache``, or ``True`` for the one, in
+    ``DFLT_NEGATIVE_CACHE_FILEPATH``, that ``download_yf_data`` also uses). Until their
+    retry time, such keys raise a ``RecentlyFailedKeyError`` instead of being fetched.
+
+    >>> td = TickerData(negative_cache=True)  # doctest: +SKIP
+
+    To store histories compactly (float32 prices, small integer volumes, sparse
+    dividends and splits, zstd compressed), give a ``compaction`` policy (see
+    ``invest.compaction``). Reads still give the original dtypes back.
+
+    >>> td = TickerData(compaction=CompactionPolicy())  # doctest: +SKIP
+
+    Concurrent reads of the same missing key (say, by a pool of workers that all start
+    with the same ticker) share one fetch (see ``invest.caching.SingleFlight``).
+    If several processes use the same ``ticker_data_dir``, use ``file_locks=True`` so
+    that they also wait for each other's fetches (and read the stored value), through
+    lock files next to the data files.
+
+    The ``source`` argument can be used to specify another source than Yahoo Finance
+    (for example, ``invest.fakes.FakeRemoteData()``).
     """
 
-    def __init__(self, ticker_data_dir=DFLT_TICKER_DATA_DIR):
+    def __init__(
+        self,
+        ticker_data_dir=DFLT_TICKER_DATA_DIR,
+        storage=DFLT_STORAGE,
+        tabular_fields=TABULAR_FIELDS,
+        *,
+        source=None,
+        freshness: Optional[FreshnessPolicy] = None,
+        memory_budget: Optional[int] = None,
+        negative_cache: Union[NegativeCache, bool, None] = None,
+        file_locks: bool = False,
+        compaction: Optional[CompactionPolicy] = None,
+    ):
         handle_missing_dir(ticker_data_dir)
-        super().__init__(ticker_data_dir=ensure_slash_suffix(ticker_data_dir))
+        super().__init__(
+            ticker_data_dir=ensure_slash_suffix(ticker_data_dir),
+            storage=storage,
+            tabular_fields=tabular_fields,
+            compaction=compaction,
+        )
+        if source is not None:
+            self._src = source
+        self.freshness = freshness
+        self.memory_tier = None
+        if memory_budget is not None:
+            self.memory_tier = MemoryTier(memory_budget)
+        if negative_cache is True:
+            negative_cache = NegativeCache(DFLT_NEGATIVE_CACHE_FILEPATH)
+        elif negative_cache is False:
+            negative_cache = None
+        self.negative_cache = negative_cache
+        lock_filepath_of_key = self._lock_filepath if file_locks else None
+        self.single_flight = SingleFlight(lock_filepath_of_key)
+        self.background_errors = dict()
+        self._background_refresher = None
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+
+    def _store_fetched(self, k, v, **params):
+        """Store a value fetched from the source, with its fetch metadata (and put it
+        in the memory tier, if any, so that the next read doesn't go to disk).
+
+        >>> import tempfile
+        >>> from invest.fakes import FakeRemoteData
+        >>> td = TickerData(tempfile.mkdtemp(), source=FakeRemoteData(), memory_budget=10**6)
+        >>> _ = td['NVDA/info']  # fetched...
+        >>> _ = td['NVDA/info']  # ... then served from memory
+        >>> td.memory_tier.stats()['hits']
+        1
+        """
+        meta = {'fetched_at': time.time(), 'source': type(self._src).__name__}
+        if params:
+            meta['params'] = params
+        self.write(k, v, meta)  # (which invalidates k in the memory tier)
+        if self.memory_tier is not None:
+            self.memory_tier.put(k, (v, meta), nbytes=approx_nbytes(v))
+        return v
+
+    def _from_source(self, k, fetch, *args, **kwargs):
+        """``fetch(*args, **kwargs)``, if the negative cache (if any) doesn't block ``k``,
+        recording the outcome in it."""
+        m = metrics.registry
+        if m is not None:
+            fetch = metrics.timed_fetch(m, fetch, k)
+        if self.negative_cache is None:
+            return fetch(*args, **kwargs)
+        self.negative_cache.check(k)
+        try:
+            v = fetch(*args, **kwargs)
+        except Exception as e:
+            self.negative_cache.record_failure(k, e)
+            raise
+        self.negative_cache.record_success(k)
+        return v
+
+    def _fetch(self, k):
+        return self._store_fetched(k, self._from_source(k, self._src.__getitem__, k))
+
+    def _lock_filepath(self, k):
+        ticker, field = split_key(k)
+        return os.path.join(self.rootdir, ticker, f'.{field}.lock')
+
+    def _fetch_missing(self, k):
+        try:  # another thread or process may have fetched it while we waited
+            return self.read(k)
+        except KeyError:
+            return self._fetch(k)
+
+    def __missing__(self, k):
+        return self.single_flight.do(k, lambda: self._fetch_missing(k))
+
+    def __getitem__(self, k):
+        m = metrics.registry
+        cached = None
+        result = 'memory_hit'
+        if self.memory_tier is not None:
+            cached = self.memory_tier.get(k)
+        if cached is None:
+            result = 'local_hit'
+            try:
+                cached = self.read_with_meta(k)
+            except KeyError:
+                if m is not None:
+                    field = metrics.field_of_key(k)
+                    m.inc('invest_cache_requests_total', field=field, result='miss')
+                return self.__missing__(k)
+            if self.memory_tier is not None:
+                self.memory_tier.put(k, cached, nbytes=approx_nbytes(cached[0]))
+        v, meta = cached
+        if self.is_stale(k, meta):
+            result = 'stale'
+        if m is not None:
+            m.inc('invest_cache_requests_total', field=metrics.field_of_key(k), result=result)
+        if result != 'stale':
+            return v
+        if self.freshness.mode == 'background':
+            self._refresh_in_background(k)
+            return v
+        return self._fetch(k)
+
+    async def aget(self, k, *, executor=None):
+        """Asynchronously get ``self[k]``.
+
+        A value found in the memory tier is returned right away. Otherwise, the
+        local store is checked, and the (blocking) local read, or remote fetch,
+        is run in ``executor`` (default: the event loop's).
+
+        >>> import asyncio, tempfile
+        >>> from invest.fakes import FakeRemoteData
+        >>> td = TickerData(tempfile.mkdtemp(), source=FakeRemoteData())
+        >>> asyncio.run(td.aget('NVDA/info'))['symbol']
+        'NVDA'
+        """
+        from invest.aio import run_blocking
+
+        k = normalize_key(k)
+        if self.memory_tier is not None and k in self.memory_tier:
+            v, meta = self.memory_tier.get(k, (None, None))
+            if meta is not None and not self.is_stale(k, meta):
+                return v
+        if k in self:
+            return await run_blocking(self.__getitem__, k, executor=executor)
+        return await run_blocking(self.__missing__, k, executor=executor)
+
+    async def aitems(
+        self, keys, *, max_concurrency=DFLT_MAX_CONCURRENCY, return_exceptions=False
+    ):
+        """Asynchronously iterate over ``(k, self[k])`` pairs for the given ``keys``,
+        in the order the values arrive, with at most ``max_concurrency`` reads (or
+        fetches) at a time.
+
+        :param return_exceptions: If ``True``, the exception raised for a key is
+            yielded as its value, instead of being raised.
+
+        >>> import asyncio, tempfile
+        >>> from invest.fakes import FakeRemoteData
+        >>> async def closes(td, keys):
+        ...     return {k: df['Close'].iloc[-1] async for k, df in td.aitems(keys)}
+        >>> td = TickerData(tempfile.mkdtemp(), source=FakeRemoteData())
+        >>> sorted(asyncio.run(closes(td, ['NVDA', 'AAPL'])))
+        ['AAPL', 'NVDA']
+        """
+        from invest.aio import amap_unordered
+
+        async for k, v in amap_unordered(
+            lambda k: self[normalize_key(k)],
+            keys,
+            max_concurrency=max_concurrency,
+            return_exceptions=return_exceptions,
+        ):
+            yield k, v
+
+    def is_stale(self, k, meta=None):
+        """Whether the cached value of ``k`` is stale, according to ``self.freshness``.
+
+        ``meta`` is the metadata of the cached value. If not given, it's read from
+        the store.
+        """
+        if self.freshness is None:
+            return False
+        if meta is None:
+            meta = self.read_with_meta(k)[1]
+        fetched_at = meta.get('fetched_at')
+        if fetched_at is None:  # written before fetch times were recorded
+            fetched_at = self.modified_time(k)
+        return self.freshness.is_stale(k, fetched_at)
+
+    def write(self, k, v, meta=None):
+        super().write(k, v, meta)
+        self.invalidate(k)
+
+    def __delitem__(self, k):
+        try:
+            super().__delitem__(k)
+        finally:
+            self.invalidate(k)
+
+    def invalidate(self, k):
+        """Drop ``k`` from the memory tier (if any), so that the next read of ``k``
+        gets it from the local store. Writes and deletes do this automatically."""
+        if self.memory_tier is not None:
+            self.memory_tier.invalidate(normalize_key(k))
+
+    def _refresh_in_background(self, k):
+        from concurrent.futures import ThreadPoolExecutor
+
+        with self._refreshing_lock:
+            if k in self._refreshing:
+                return  # already being refreshed
+            self._refreshing.add(k)
+            if self._background_refresher is None:
+                self._background_refresher = ThreadPoolExecutor(
+                    max_workers=4, thread_name_prefix='invest_refresh'
+                )
+
+        def refresh():
+            try:
+                self._fetch(k)
+                self.background_errors.pop(k, None)
+            except Exception as e:  # keep serving the stale value
+                self.background_errors[k] = e
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(k)
+
+        self._background_refresher.submit(refresh)
+
+    def refresh_history(self, ticker_symbol, **history_kwargs):
+        """Bring the cached history of ``ticker_symbol`` up to date, fetching only the
+        bars since the one before the last cached one (see ``merge_history_tail``).
+
+        Returns what was done: ``'fetched'`` (nothing was cached: the history was
+        fetched), ``'appended'`` (new bars were merged in), ``'unchanged'`` (no new
+        bars) or ``'refetched'`` (the cached history was restated, so was replaced
+        by a fresh one).
+        """
+        k = ticker_symbol + path_sep + 'history'
+        try:
+            cached = self.read(k)
+        except KeyError:
+            cached = None
+
+        def fetch_history(**kwargs):
+            return self._from_source(k, self._src.history, ticker_symbol, **kwargs)
+
+        if cached is None or len(cached) == 0:
+            v = fetch_history(**history_kwargs)
+            self._store_fetched(k, v, **history_kwargs)
+            return 'fetched'
+        # The last cached bar may be partial, so will be replaced: start a bar
+        # earlier, to have a complete one to check for restatements against.
+        start = cached.index[max(len(cached) - 2, 0)].strftime('%Y-%m-%d')
+        tail = fetch_history(start=start, **history_kwargs)
+        merged = merge_history_tail(cached, tail)
+        if merged is None:
+            v = fetch_history(**history_kwargs)
+            self._store_fetched(k, v, **history_kwargs)
+            return 'refetched'
+        if len(merged) == len(cached) and merged.equals(cached):
+            self._store_fetched(k, cached, **history_kwargs)  # it's fresh now
+            return 'unchanged'
+        self._store_fetched(k, merged, **history_kwargs)
+        return 'appended'
+
+
+def refresh_histories(ticker_data, ticker_symbols, *, max_workers=8, **history_kwargs):
+    """Refresh the histories of ``ticker_symbols`` (see ``TickerData.refresh_history``),
+    concurrently. Returns a ``{ticker_symbol: outcome, ...}`` dict, where the outcome
+    of tickers that failed is the exception raised.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def refresh(ticker_symbol):
+        try:
+            return ticker_data.refresh_history(ticker_symbol, **history_kwargs)
+        except Exception as e:
+            return e
+
+    ticker_symbols = list(ticker_symbols)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(ticker_symbols, executor.map(refresh, ticker_symbols)))
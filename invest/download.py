@@ -0,0 +1,265 @@
+"""
+Concurrent, resumable bulk download of ticker data into a local store.
+
+The fetches (the slow, network-bound part) are done by a bounded pool of
+worker threads, and every result is written to the local store as soon as it
+arrives. Progress is checkpointed to a file, so that an interrupted run can be
+resumed where it stopped.
+
+>>> from invest.fakes import FakeRemoteData
+>>> store = dict()
+>>> keys = ticker_field_keys(['AAPL', 'GOOG', 'BAD'], ['info', 'history'])
+>>> stats = bulk_download(
+...     keys, store=store, source=FakeRemoteData(fail_keys={'BAD/info'}),
+...     max_workers=4, verbose=False,
+... )
+>>> sorted(store)  # doctest: +NORMALIZE_WHITESPACE
+['AAPL/history', 'AAPL/info', 'BAD/history', 'GOOG/history', 'GOOG/info']
+>>> stats.n_done, stats.n_failed
+(5, 1)
+"""
+
+import os
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, Optional, Mapping, MutableMapping, Callable
+
+from invest import metrics
+from invest.util import approx_nbytes, bounded_thread_map, print_progress
+
+DFLT_MAX_WORKERS = 8
+DFLT_PROGRESS_EVERY = 100
+
+path_sep = os.path.sep
+
+
+def ticker_field_keys(ticker_symbols: Iterable[str], fields: Iterable[str]):
+    """Yield the ``'{ticker}/{field}'`` keys of ``fields`` by ``ticker_symbols``,
+    field by field (the order ``download_yf_data`` always used).
+
+    >>> list(ticker_field_keys(['A', 'B'], ['info', 'history']))
+    ['A/info', 'B/info', 'A/history', 'B/history']
+    """
+    ticker_symbols = list(ticker_symbols)
+    for field_ in fields:
+        for ticker_symbol in ticker_symbols:
+            yield f'{ticker_symbol}{path_sep}{field_}'
+
+
+class DownloadCheckpoint:
+    """A persistent record of the keys a bulk download has already handled.
+
+    Every handled key is appended (as a json line) to ``filepath``, so that a
+    crash loses at most the keys that were in flight.
+    Use ``filepath=None`` to only keep the record in memory.
+
+    >>> import tempfile
+    >>> filepath = os.path.join(tempfile.mkdtemp(), 'checkpoint.jsonl')
+    >>> checkpoint = DownloadCheckpoint(filepath)
+    >>> checkpoint.mark_done('AAPL/info')
+    >>> checkpoint.mark_failed('BAD/info', ValueError('no such ticker'))
+    >>> checkpoint.close()
+    >>> checkpoint = DownloadCheckpoint(filepath)  # reload it from file
+    >>> 'AAPL/info' in checkpoint, 'BAD/info' in checkpoint, 'GOOG/info' in checkpoint
+    (True, True, False)
+    >>> checkpoint.failed
+    {'BAD/info': 'ValueError: no such ticker'}
+    """
+
+    def __init__(self, filepath: Optional[str] = None):
+        self.filepath = filepath
+        self.done = set()
+        self.failed = dict()
+        if filepath is not None and os.path.isfile(filepath):
+            self._load()
+        self._fp = None
+
+    def _load(self):
+        with open(self.filepath) as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a partially written last line (the run was killed)
+                key = record['key']
+                if record.get('error') is None:
+                    self.done.add(key)
+                    self.failed.pop(key, None)
+                else:
+                    self.failed[key] = record['error']
+
+    def _append(self, record):
+        if self.filepath is None:
+            return
+        if self._fp is None:
+            self._fp = open(self.filepath, 'a')
+        self._fp.write(json.dumps(record) + '\n')
+        self._fp.flush()
+
+    def mark_done(self, key):
+        self.done.add(key)
+        self.failed.pop(key, None)
+        self._append({'key': key})
+
+    def mark_failed(self, key, error):
+        error = f'{type(error).__name__}: {error}'
+        self.failed[key] = error
+        self._append({'key': key, 'error': error})
+
+    def __contains__(self, key):
+        return key in self.done or key in self.failed
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@dataclass
+class DownloadStats:
+    """Counters (and throughput) of a bulk download."""
+
+    n_done: int = 0
+    n_failed: int = 0
+    n_skipped: int = 0
+    n_backed_off: int = 0
+    n_bytes: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    ended_at: Optional[float] = None
+    errors: dict = field(default_factory=dict, repr=False)
+
+    @property
+    def elapsed(self):
+        return (self.ended_at or time.perf_counter()) - self.started_at
+
+    @property
+    def keys_per_sec(self):
+        return (self.n_done + self.n_failed) / max(self.elapsed, 1e-9)
+
+    @property
+    def bytes_per_sec(self):
+        return self.n_bytes / max(self.elapsed, 1e-9)
+
+    def __str__(self):
+        return (
+            f'{self.n_done} done, {self.n_failed} failed, {self.n_skipped} skipped, '
+            f'{self.n_backed_off} backed off '
+            f'in {self.elapsed:.1f}s '
+            f'({self.keys_per_sec:.1f} keys/s, {self.bytes_per_sec / 1e6:.2f} MB/s)'
+        )
+
+
+def _mk_skip(store, checkpoint, except_keys, skip_existing):
+    def skip(key):
+        return (
+            key in except_keys
+            or key in checkpoint.done
+            or (skip_existing and key in store)
+        )
+
+    return skip
+
+
+def bulk_download(
+    keys: Iterable[str],
+    *,
+    store: MutableMapping,
+    source: Optional[Mapping] = None,
+    max_workers: int = DFLT_MAX_WORKERS,
+    checkpoint: Optional[DownloadCheckpoint] = None,
+    except_keys: Iterable[str] = (),
+    negative_cache=None,
+    skip_existing: bool = True,
+    sizeof: Callable = approx_nbytes,
+    progress_every: int = DFLT_PROGRESS_EVERY,
+    verbose: bool = True,
+) -> DownloadStats:
+    """Fetch ``source[k]`` for all ``keys``, concurrently, writing into ``store[k]``.
+
+    :param keys: The ``'{ticker}/{field}'`` keys to download (see ``ticker_field_keys``)
+    :param store: Where to write the data (usually a ``dacc.LocalTickerData``)
+    :param source: Where to get the data from (default: ``dacc.remote_data``).
+        Anything with a ``__getitem__`` will do (see ``invest.fakes.FakeRemoteData``).
+    :param max_workers: The maximum number of concurrent fetches
+    :param checkpoint: A ``DownloadCheckpoint`` (or the filepath of one) recording
+        handled keys. Keys the checkpoint has as done are skipped (failed ones are
+        retried), so that giving the same checkpoint to a new run resumes the
+        interrupted one.
+    :param except_keys: Keys to skip
+    :param negative_cache: A ``dacc.NegativeCache`` of failing keys: the keys it blocks
+        (that failed recently) are not fetched (and are counted as ``n_backed_off``),
+        and the outcomes of the fetches are recorded in it.
+    :param skip_existing: Whether to skip keys that are already in ``store``
+    :param sizeof: The function used to count the bytes of the fetched values
+    :param progress_every: Print progress (and throughput) every that many keys
+    :param verbose: Whether to print progress and errors
+    :return: A ``DownloadStats`` of the run
+
+    Only the fetches are done in the worker threads: the writes to ``store`` are
+    done (in the calling thread) as each fetch completes. At most ``2 * max_workers``
+    keys are in flight at any time, so that ``keys`` can be a large (lazy) iterable.
+    """
+    if source is None:
+        from invest.dacc import remote_data as source
+    if checkpoint is None or isinstance(checkpoint, str):
+        checkpoint = DownloadCheckpoint(checkpoint)
+    skip = _mk_skip(store, checkpoint, set(except_keys), skip_existing)
+    stats = DownloadStats()
+    m = metrics.registry
+
+    def fetch(key):
+        if m is None:
+            return source[key]
+        return metrics.timed_fetch(m, source.__getitem__, key)(key)
+
+    def handle_failure(key, error, *, from_source):
+        stats.n_failed += 1
+        stats.errors[key] = error
+        checkpoint.mark_failed(key, error)
+        if from_source and negative_cache is not None:
+            negative_cache.record_failure(key, error)
+        if verbose:
+            print(f'Error with {key}: {error}')
+
+    def handle_done(key, future):
+        try:
+            v = future.result()
+        except Exception as error:
+            return handle_failure(key, error, from_source=True)
+        try:
+            store[key] = v
+        except Exception as error:  # e.g. disk full, or a value the store can't write
+            return handle_failure(key, error, from_source=False)
+        if negative_cache is not None:
+            negative_cache.record_success(key)
+        stats.n_done += 1
+        stats.n_bytes += sizeof(v)
+        checkpoint.mark_done(key)
+        n_handled = stats.n_done + stats.n_failed
+        if verbose and progress_every and n_handled % progress_every == 0:
+            print_progress(f'{n_handled}: {key} -- {stats}')
+
+    def keys_to_fetch():
+        for key in keys:
+            if skip(key):
+                stats.n_skipped += 1
+            elif negative_cache is not None and negative_cache.blocks(key):
+                stats.n_backed_off += 1
+            else:
+                yield key
+
+    try:
+        bounded_thread_map(fetch, keys_to_fetch(), handle_done, max_workers=max_workers)
+    finally:
+        checkpoint.close()
+        stats.ended_at = time.perf_counter()
+        if verbose:
+            print_progress(f'Bulk download: {stats}')
+    return stats
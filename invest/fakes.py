@@ -0,0 +1,487 @@
+"""
+Deterministic, offline stand-ins for the remote (Yahoo Finance) data sources.
+
+These let you exercise the data access layer (downloads, caches, stores...)
+without any network access. Everything is seeded by the ticker symbol, so the
+same key always gives the same data.
+
+>>> remote = FakeRemoteData()
+>>> df = remote['NVDA/history']
+>>> list(df.columns)
+['Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits']
+>>> df.equals(FakeRemoteData()['NVDA/history'])
+True
+>>> remote['NVDA/info']['symbol']
+'NVDA'
+>>> remote.n_calls
+2
+"""
+
+import os
+import time
+import zlib
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from collections.abc import Mapping
+from typing import Callable, Iterable, Optional, Union
+
+DFLT_N_DAYS = 250
+DFLT_END_DATE = '2025-01-31'
+
+path_sep = os.path.sep
+
+
+def _seed_of(*parts) -> int:
+    """A seed that is stable across processes (unlike ``hash``)."""
+    return zlib.crc32('/'.join(map(str, parts)).encode())
+
+
+_FAKE_CALENDAR = ('2015-01-01', '2030-12-31')
+
+
+@lru_cache(maxsize=1)
+def _fake_calendar():
+    import pandas as pd
+
+    return pd.bdate_range(*_FAKE_CALENDAR, name='Date')  # slow to make, so cached
+
+
+def fake_history(
+    ticker: str, start=None, end=DFLT_END_DATE, *, n_days: int = DFLT_N_DAYS
+):
+    """A synthetic daily OHLCV frame, shaped like ``yf.Ticker(...).history()``.
+
+    The bars of a ticker are fixed (whatever ``start`` and ``end`` are), so that
+    histories taken with different ends are consistent with each other.
+    If ``start`` is not given, the last ``n_days`` bars (up to ``end``) are returned.
+
+    >>> old = fake_history('NVDA', end='2025-01-31')
+    >>> new = fake_history('NVDA', start='2025-01-31', end='2025-02-07')
+    >>> len(new), old.loc['2025-01-31'].equals(new.loc['2025-01-31'])
+    (6, True)
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(_seed_of(ticker, 'history'))
+    index = _fake_calendar()
+    n = len(index)
+    close = 10 + rng.uniform(10, 200) * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    spread = np.abs(rng.normal(0, 0.01, n)) * close
+    open_ = close + rng.normal(0, 0.5, n) * spread
+    df = pd.DataFrame(
+        {
+            'Open': open_,
+            'High': np.maximum(open_, close) + spread,
+            'Low': np.minimum(open_, close) - spread,
+            'Close': close,
+            'Volume': rng.integers(10**5, 10**8, n),
+            'Dividends': np.where(rng.random(n) < 0.01, 0.2, 0.0),
+            'Stock Splits': np.zeros(n),
+        },
+        index=index,
+    )
+    df = df.loc[:end]
+    if start is None:
+        return df.iloc[-n_days:]
+    return df.loc[start:]
+
+
+def fake_bulk_history(ticker_symbols, start=None, end=DFLT_END_DATE, **history_kwargs):
+    """The fake histories of ``ticker_symbols``, with ``(ticker, price_field)`` columns,
+    like ``yf.Tickers(...).history(group_by='ticker')`` (other arguments are ignored).
+
+    >>> df = fake_bulk_history(['AAPL', 'NVDA'], start='2025-01-01')
+    >>> df['NVDA'].equals(fake_history('NVDA', start='2025-01-01'))
+    True
+    """
+    import pandas as pd
+
+    return pd.concat(
+        {ticker: fake_history(ticker, start, end) for ticker in ticker_symbols},
+        axis=1,
+        names=['Ticker', 'Price'],
+    )
+
+
+def fake_quarterly_statement(ticker: str, field: str, n_quarters: int = 4):
+    """A synthetic financial statement: line items (rows) by quarter end (columns)."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(_seed_of(ticker, field))
+    items = ['Total Revenue', 'Net Income', 'Total Assets', 'Cash']
+    columns = pd.date_range(end='2024-12-31', periods=n_quarters, freq='QE')
+    return pd.DataFrame(
+        rng.normal(1e9, 2e8, (len(items), n_quarters)), index=items, columns=columns
+    )
+
+
+def fake_info(ticker: str):
+    import numpy as np
+
+    rng = np.random.default_rng(_seed_of(ticker, 'info'))
+    return {
+        'symbol': ticker,
+        'shortName': f'{ticker} Inc.',
+        'marketCap': int(rng.integers(10**8, 10**12)),
+        'sector': str(rng.choice(['Technology', 'Energy', 'Healthcare'])),
+    }
+
+
+def fake_field_value(ticker: str, field: str):
+    """The synthetic value of ``field`` for ``ticker``."""
+    if field == 'history':
+        return fake_history(ticker)
+    elif field == 'info':
+        return fake_info(ticker)
+    elif field in {'dividends', 'splits'}:
+        column = 'Dividends' if field == 'dividends' else 'Stock Splits'
+        s = fake_history(ticker)[column]
+        return s[s != 0]
+    else:
+        return fake_quarterly_statement(ticker, field)
+
+
+class FakeRemoteError(RuntimeError):
+    """Raised by fakes to simulate a failing remote call."""
+
+
+class FakeRemoteData(Mapping):
+    """A deterministic, in-process stand-in for ``invest.dacc.remote_data``.
+
+    Keys are ``'{ticker}/{field}'`` strings, as for ``remote_data``.
+
+    :param latency: Seconds to sleep on every call (or a ``key -> seconds`` function)
+    :param fail_keys: Keys (or a ``key -> bool`` function) that should fail
+    :param error: The exception (class) raised for failing keys
+    :param value_of_key: The ``(ticker, field) -> value`` function to produce data
+
+    >>> remote = FakeRemoteData(fail_keys={'BAD/info'})
+    >>> remote['BAD/info']
+    Traceback (most recent call last):
+      ...
+    invest.fakes.FakeRemoteError: Simulated failure for BAD/info
+    >>> remote.n_calls, remote.n_errors
+    (1, 1)
+    """
+
+    def __init__(
+        self,
+        *,
+        latency: Union[float, Callable] = 0,
+        fail_keys: Union[Iterable, Callable] = (),
+        error=FakeRemoteError,
+        value_of_key: Callable = fake_field_value,
+    ):
+        self.latency = latency
+        if not callable(fail_keys):
+            fail_keys = set(fail_keys).__contains__
+        self.fail_keys = fail_keys
+        self.error = error
+        self.value_of_key = value_of_key
+        self.n_calls = 0
+        self.n_errors = 0
+        self._lock = threading.Lock()
+
+    def _simulate_call(self, k):
+        """Count, delay, and (maybe) fail, like a remote call would."""
+        with self._lock:
+            self.n_calls += 1
+        latency = self.latency(k) if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+        if self.fail_keys(k):
+            with self._lock:
+                self.n_errors += 1
+            raise self.error(f'Simulated failure for {k}')
+
+    def __getitem__(self, k):
+        self._simulate_call(k)
+        ticker, field = k.split(path_sep)
+        return self.value_of_key(ticker, field)
+
+    def history(self, ticker, **history_kwargs):
+        """The (synthetic) history of ``ticker``, taking ``start`` and ``end``
+        arguments, like ``remote_data.history``."""
+        self._simulate_call(ticker + path_sep + 'history')
+        return fake_history(ticker, **history_kwargs)
+
+    def __iter__(self):
+        # A remote has no listing: just like remote_data, it can only be queried
+        yield from ()
+
+    def __len__(self):
+        return 0
+
+
+def _as_predicate(x):
+    return x if callable(x) else set(x).__contains__
+
+
+def seeded_failures(rate: float, *, seed=0):
+    """A ``ticker -> bool`` function, true for a (deterministic) ``rate`` of tickers.
+
+    >>> fails = seeded_failures(0.1)
+    >>> sum(map(fails, (f'T{i}' for i in range(10000))))
+    1007
+    """
+    return lambda ticker: _seed_of(ticker, 'fails', seed) % 10000 < rate * 10000
+
+
+class FakeYfTicker:
+    """A stand-in for ``yfinance.Ticker``, serving (seeded) synthetic data.
+
+    Its (public) attributes are the ones of ``yfinance.Ticker`` (see
+    ``invest._prep``): properties give ``fake_field_value(ticker, name)``, and methods
+    return it (``history`` gives ``fake_history``).
+
+    >>> ticker = FakeYfTicker('NVDA')
+    >>> ticker.info['symbol'], len(ticker.history(start='2025-01-01'))
+    ('NVDA', 23)
+    """
+
+    def __init__(self, ticker, session=None, *, latency: float = 0, fails: bool = False):
+        self.ticker = ticker
+        self.session = session
+        self.latency = latency
+        self.fails = fails
+
+    def _simulate_call(self, field):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fails:
+            raise FakeRemoteError(f'Simulated failure for {self.ticker}{path_sep}{field}')
+
+    def history(self, start=None, end=DFLT_END_DATE, **history_kwargs):
+        self._simulate_call('history')
+        return fake_history(self.ticker, start, end)
+
+    def __getattr__(self, name):
+        from invest._prep import (
+            _ticker_attrs_that_are_properties,
+            _ticker_attrs_that_are_callable,
+        )
+
+        if name in _ticker_attrs_that_are_properties:
+            self._simulate_call(name)
+            return fake_field_value(self.ticker, name)
+        elif name in _ticker_attrs_that_are_callable:
+            field = name[4:] if name.startswith('get_') else name
+
+            def method(*args, **kwargs):
+                self._simulate_call(field)
+                return fake_field_value(self.ticker, field)
+
+            return method
+        raise AttributeError(name)
+
+    def __repr__(self):
+        return f"{type(self).__name__}('{self.ticker}')"
+
+
+class FakeYfTickers:
+    """A stand-in for ``yfinance.Tickers``: the ``FakeYfTicker`` of several tickers,
+    and their bulk ``history``, where failing tickers have NaN histories (as in
+    ``yfinance``)."""
+
+    def __init__(self, tickers, session=None, *, yf=None):
+        yf = yf or FakeYfinance()
+        if isinstance(tickers, str):
+            tickers = tickers.replace(',', ' ').split()
+        self.symbols = list(tickers)
+        self.tickers = {ticker: yf.Ticker(ticker, session) for ticker in self.symbols}
+        self.latency = yf.latency
+
+    def history(self, start=None, end=DFLT_END_DATE, group_by='ticker', **history_kwargs):
+        import pandas as pd
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        def history_of(ticker):
+            df = fake_history(ticker, start, end)
+            if self.tickers[ticker].fails:
+                return df.astype(float) * float('nan')
+            return df
+
+        df = pd.concat(
+            {ticker: history_of(ticker) for ticker in self.symbols},
+            axis=1,
+            names=['Ticker', 'Price'],
+        )
+        if group_by != 'ticker':
+            df = df.swaplevel(axis=1).sort_index(axis=1)
+        return df
+
+
+class FakeYfinance:
+    """A stand-in for the ``yfinance`` module: its ``Ticker`` and ``Tickers`` give
+    (seeded) synthetic data, with a simulated ``latency`` (per call), and failures.
+
+    :param latency: The seconds every data access (or bulk history) call takes
+    :param fail_tickers: Tickers (or a ``ticker -> bool`` function, e.g.
+        ``seeded_failures(0.01)``) whose data accesses fail with ``FakeRemoteError``
+
+    Use ``patch_yfinance`` to have ``invest`` use it.
+    """
+
+    def __init__(self, *, latency: float = 0, fail_tickers=()):
+        self.latency = latency
+        self.fail_tickers = _as_predicate(fail_tickers)
+        self.n_tickers = 0
+        self._lock = threading.Lock()
+
+    def Ticker(self, ticker, session=None):
+        with self._lock:
+            self.n_tickers += 1
+        return FakeYfTicker(
+            ticker, session, latency=self.latency, fails=self.fail_tickers(ticker)
+        )
+
+    def Tickers(self, tickers, session=None):
+        return FakeYfTickers(tickers, session, yf=self)
+
+
+@contextmanager
+def patch_yfinance(fake_yfinance=None):
+    """Have ``invest`` (``Ticker``, ``BulkHistory``, ``dacc.remote_data``...) use
+    ``fake_yfinance`` (default: a ``FakeYfinance()``) instead of ``yfinance``.
+
+    >>> from invest import Ticker
+    >>> with patch_yfinance(FakeYfinance(fail_tickers={'DEAD'})):
+    ...     Ticker('NVDA')['info']['shortName']
+    'NVDA Inc.'
+    """
+    from invest import base
+
+    fake_yfinance = fake_yfinance or FakeYfinance()
+    original_yf = base._yf
+    base._yf = lambda: fake_yfinance
+    try:
+        yield fake_yfinance
+    finally:
+        base._yf = original_yf
+
+
+class FakeHttpServer:
+    """A local HTTP server standing in for remote web services (in a thread).
+
+    :param respond: A ``(path, n) -> (status, body)`` function, where ``n`` is the
+        number of requests (to that path) so far, including this one.
+        By default, every request gets a ``200`` and a small html table.
+    :param latency: Seconds to wait before responding
+    :param max_rate: If given, the server throttles: requests beyond this rate
+        (per second, with bursts of up to ``max_rate`` requests) get a ``429``, with
+        a ``Retry-After: {retry_after}`` header (and are counted in ``n_throttled``)
+    :param retry_after: The ``Retry-After`` (seconds) of throttled requests
+
+    It speaks HTTP/1.1, so that clients can keep connections alive, and records
+    the (client) connections it served, to check that they were reused.
+
+    >>> import urllib.request
+    >>> flaky = lambda path, n: (503, 'try again') if n <= 2 else (200, 'ok')
+    >>> with FakeHttpServer(flaky) as server:
+    ...     urllib.request.urlopen(server.url('/x')).read()
+    Traceback (most recent call last):
+      ...
+    urllib.error.HTTPError: HTTP Error 503: Service Unavailable
+    """
+
+    default_body = '<table><tr><th>a</th></tr><tr><td>1</td></tr></table>'
+
+    def __init__(
+        self,
+        respond=None,
+        *,
+        latency: float = 0,
+        max_rate: Optional[float] = None,
+        retry_after: float = 1,
+    ):
+        self.respond = respond or (lambda path, n: (200, self.default_body))
+        self.latency = latency
+        self.max_rate = max_rate
+        self.retry_after = retry_after
+        self._tokens = max_rate
+        self._tokens_updated_at = time.monotonic()
+        self.n_requests = 0
+        self.n_throttled = 0
+        self.n_requests_of_path = dict()
+        self.client_addresses = set()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def url(self, path='/'):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}{path}'
+
+    def _throttles(self):
+        """Whether to throttle the current request (call with ``self._lock`` held)."""
+        if self.max_rate is None:
+            return False
+        now = time.monotonic()
+        elapsed, self._tokens_updated_at = now - self._tokens_updated_at, now
+        self._tokens = min(self.max_rate, self._tokens + elapsed * self.max_rate)
+        if self._tokens < 1:
+            self.n_throttled += 1
+            return True
+        self._tokens -= 1
+        return False
+
+    def _mk_handler(self):
+        from http.server import BaseHTTPRequestHandler
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.n_requests += 1
+                    n = fake.n_requests_of_path.get(self.path, 0) + 1
+                    fake.n_requests_of_path[self.path] = n
+                    fake.client_addresses.add(self.client_address)
+                    throttled = fake._throttles()
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if throttled:
+                    status, body = 429, 'Too Many Requests'
+                else:
+                    status, body = fake.respond(self.path, n)
+                body = body.encode() if isinstance(body, str) else body
+                self.send_response(status)
+                if throttled:
+                    self.send_header('Retry-After', str(fake.retry_after))
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        from http.server import ThreadingHTTPServer
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._mk_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
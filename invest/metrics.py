@@ -0,0 +1,270 @@
+"""
+Instrumentation of the invest data layer: latencies, cache hits and misses,
+bytes read and written, and remote errors, by field.
+
+Instrumentation is off by default (and then costs one attribute lookup per
+instrumented call). Turn it on with ``enable_metrics``:
+
+>>> import tempfile
+>>> from invest.dacc import TickerData
+>>> from invest.fakes import FakeRemoteData
+>>> metrics = enable_metrics()
+>>> td = TickerData(tempfile.mkdtemp(), source=FakeRemoteData())
+>>> _ = td['NVDA/info'], td['NVDA/info']  # a miss (fetched), then a local hit
+>>> snapshot = metrics.snapshot()
+>>> snapshot['counters']['invest_cache_requests_total{field="info",result="miss"}']
+1
+>>> snapshot['counters']['invest_cache_requests_total{field="info",result="local_hit"}']
+1
+>>> snapshot['histograms']['invest_remote_seconds{field="info"}']['count']
+1
+>>> disable_metrics()
+
+The metrics (all labeled by ``field``) are:
+
+- ``invest_ticker_seconds``: ``Ticker[field]`` (``yfinance``) call latencies
+- ``invest_remote_seconds``: latencies of the fetches of ``TickerData`` and ``bulk_download``
+  from their source (``dacc.remote_data``, by default)
+- ``invest_remote_errors_total``: failed fetches (also labeled by ``error`` class)
+- ``invest_cache_requests_total``: ``TickerData`` reads, by ``result``: ``memory_hit``,
+  ``local_hit``, ``stale`` or ``miss``
+- ``invest_local_read_seconds`` and ``invest_local_write_seconds``: local store latencies
+- ``invest_local_read_bytes_total`` and ``invest_local_write_bytes_total``
+
+Snapshots can be sent to sinks (any callable taking a snapshot), for example a
+``PrometheusTextFile`` (for the ``node_exporter`` textfile collector):
+
+>>> metrics = enable_metrics()  # doctest: +SKIP
+>>> metrics.add_sink(PrometheusTextFile('/var/lib/node_exporter/invest.prom'))  # doctest: +SKIP
+>>> metrics.flush()  # doctest: +SKIP
+"""
+
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+DFLT_LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 30,
+)
+
+
+class Histogram:
+    """Counts of observations in (cumulative, Prometheus style) buckets.
+
+    >>> h = Histogram(buckets=(0.1, 1))
+    >>> for v in (0.05, 0.5, 0.7, 3):
+    ...     h.observe(v)
+    >>> h.count, h.sum, h.cumulative_counts()
+    (4, 4.25, [(0.1, 1), (1, 3), (inf, 4)])
+    >>> h.quantile(0.5)  # the upper bound of the bucket of the median
+    1
+    """
+
+    def __init__(self, buckets=DFLT_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last is the +inf bucket
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self):
+        cumulative, total = [], 0
+        for le, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            cumulative.append((le, total))
+        return cumulative
+
+    def quantile(self, q):
+        """An upper bound of the ``q`` quantile (the upper bound of its bucket)."""
+        if not self.count:
+            return None
+        for le, total in self.cumulative_counts():
+            if total >= q * self.count:
+                return le
+
+    def to_dict(self):
+        return dict(
+            count=self.count,
+            sum=self.sum,
+            p50=self.quantile(0.5),
+            p99=self.quantile(0.99),
+            buckets=self.cumulative_counts(),
+        )
+
+
+def _labels_str(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+class Metrics:
+    """A thread-safe registry of counters and histograms, identified by a name and
+    labels (e.g. ``field='info'``).
+
+    >>> m = Metrics()
+    >>> m.inc('invest_cache_requests_total', field='info', result='miss')
+    >>> with m.timer('invest_remote_seconds', field='info'):
+    ...     pass
+    >>> m.snapshot()['counters']
+    {'invest_cache_requests_total{field="info",result="miss"}': 1}
+    >>> for line in prometheus_text(m.snapshot()).splitlines()[:2]:
+    ...     print(line)
+    # TYPE invest_cache_requests_total counter
+    invest_cache_requests_total{field="info",result="miss"} 1
+    """
+
+    def __init__(self, *, buckets=DFLT_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = dict()  # (name, labels) -> value
+        self._histograms = dict()  # (name, labels) -> Histogram
+        self._sinks = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, *, errors: Optional[str] = None, **labels):
+        """Observe the duration of the ``with`` block in the ``name`` histogram.
+        If the block raises, and ``errors`` is given, the ``errors`` counter (labeled
+        with the ``error`` class too) is incremented instead."""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            if errors is not None:
+                self.inc(errors, error=type(e).__name__, **labels)
+            raise
+        self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        """A ``{'counters': {...}, 'histograms': {...}}`` dict of the current values,
+        keyed by ``'name{label="value",...}'`` strings."""
+        with self._lock:
+            counters = {
+                f'{name}{{{_labels_str(labels)}}}': value
+                for (name, labels), value in sorted(self._counters.items())
+            }
+            histograms = {
+                f'{name}{{{_labels_str(labels)}}}': histogram.to_dict()
+                for (name, labels), histogram in sorted(
+                    self._histograms.items(), key=lambda x: x[0]
+                )
+            }
+        return dict(counters=counters, histograms=histograms)
+
+    def add_sink(self, sink: Callable):
+        """Add a ``snapshot -> None`` callable that ``flush`` sends snapshots to."""
+        self._sinks.append(sink)
+
+    def flush(self):
+        snapshot = self.snapshot()
+        for sink in self._sinks:
+            sink(snapshot)
+        return snapshot
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def _name_and_labels(key):
+    name, labels = key[:-1].split('{', 1)
+    return name, labels
+
+
+def _series(name, labels):
+    return f'{name}{{{labels}}}' if labels else name
+
+
+def prometheus_text(snapshot: dict) -> str:
+    """The Prometheus text exposition format of a ``Metrics.snapshot()``."""
+    lines, typed = [], set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {name} {kind}')
+
+    for key, value in snapshot['counters'].items():
+        name, labels = _name_and_labels(key)
+        declare(name, 'counter')
+        lines.append(f'{_series(name, labels)} {value}')
+    for key, histogram in snapshot['histograms'].items():
+        name, labels = _name_and_labels(key)
+        declare(name, 'histogram')
+        sep = ',' if labels else ''
+        for le, count in histogram['buckets']:
+            le = '+Inf' if le == float('inf') else le
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {count}')
+        lines.append(f'{_series(name + "_sum", labels)} {histogram["sum"]}')
+        lines.append(f'{_series(name + "_count", labels)} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+class PrometheusTextFile:
+    """A sink writing snapshots (atomically) to ``filepath``, in the Prometheus text
+    format (e.g. for the ``node_exporter`` textfile collector)."""
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+    def __call__(self, snapshot):
+        from invest.stores import _atomic_write
+
+        def write(filepath):
+            with open(filepath, 'w') as fp:
+                fp.write(prometheus_text(snapshot))
+
+        _atomic_write(self.filepath, write)
+
+
+registry: Optional[Metrics] = None  # the active metrics (None when instrumentation is off)
+
+
+def enable_metrics(metrics: Optional[Metrics] = None) -> Metrics:
+    """Turn instrumentation on, recording in ``metrics`` (default: a new ``Metrics``)."""
+    global registry
+    registry = metrics if metrics is not None else Metrics()
+    return registry
+
+
+def disable_metrics():
+    global registry
+    registry = None
+
+
+def field_of_key(k) -> str:
+    """The field of a ``'{ticker}/{field}'`` key (the key itself if it has no ``/``)."""
+    return k.rsplit(os.path.sep, 1)[-1] if isinstance(k, str) else str(k)
+
+
+def timed_fetch(m: Metrics, fetch: Callable, k):
+    """``fetch``, timed in ``invest_remote_seconds``, with its errors counted in
+    ``invest_remote_errors_total`` (both labeled by the field of ``k``)."""
+
+    def timed(*args, **kwargs):
+        with m.timer(
+            'invest_remote_seconds', errors='invest_remote_errors_total', field=field_of_key(k)
+        ):
+            return fetch(*args, **kwargs)
+
+    return timed
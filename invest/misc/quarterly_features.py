@@ -3,8 +3,11 @@ Module to extract, prepare, and produce feature vectors for quarterly stock data
 """
 from datetime import datetime as dt
 import itertools
+import os
+import pickle
 import re
 from collections import Counter
+from collections.abc import Mapping
 from operator import itemgetter
 
 import pandas as pd
@@ -17,6 +20,7 @@ from py2store import groupby
 from i2.deco import postprocess
 
 from invest.misc.yf_prep import DbDf
+from invest.util import DFLT_DATE_FORMAT
 
 qy_parser = StrTupleDict('{quarter}Q{year}',
                          {'quarter': '\d', 'year': '\d\d\d\d'},
@@ -51,7 +55,7 @@ def trans_quarter(string):
 
 def to_quarter_df(arr, cols=None):
     ser = pd.Series({trans_quarter(x['Quarter']): x for x in arr})
-    df = pd.DataFrame.from_records(ser, index=ser.index)
+    df = pd.DataFrame.from_records(ser.tolist(), index=ser.index)
     if cols:
         return df[cols]
     else:
@@ -75,6 +79,201 @@ def prep_quarterly_from_df(df: pd.DataFrame):
     return pd.Series(dict(gen()))
 
 
+# ---------------------------------------------------------------------------------------
+# Bulk prep: the collections as one long (ticker, period, item, value) table
+
+def parse_quarter_labels(labels):
+    """Vectorized ``trans_quarter``: ``{quarter}Q{year}`` labels to a ``DatetimeIndex``.
+
+    >>> parse_quarter_labels(['4Q2019', '1Q2020'])
+    DatetimeIndex(['2019-10-01', '2020-01-01'], dtype='datetime64[ns]', freq=None)
+    """
+    parts = pd.Series(labels, dtype=str).str.extract(r'^(\d)Q(\d{4})$').astype(int)
+    dates = pd.to_datetime(dict(year=parts[1], month=3 * parts[0] - 2, day=1))
+    return pd.DatetimeIndex(dates).as_unit('ns')
+
+
+def _long_from_records(records: pd.DataFrame, tickers, periods):
+    """The long format of ``records``, a frame of one row per ``(ticker, period)``."""
+    try:
+        values = records.to_numpy(dtype=float, na_value=np.nan)
+    except (TypeError, ValueError):  # some non-numerical items
+        values = records.to_numpy()
+    n_items = records.shape[1]
+    return pd.DataFrame({
+        'ticker': np.repeat(np.asarray(tickers), n_items),
+        'period': np.repeat(np.asarray(periods), n_items),
+        'item': np.tile(records.columns.to_numpy(), len(records)),
+        'value': values.ravel(),
+    })
+
+
+def long_quarterly_from_df(df: pd.DataFrame):
+    """The long (``ticker, period, item, value``) table of a collection of statements stored
+    with ``convert_df_with_timestamp_rows`` (the input of ``prep_quarterly_from_df``)."""
+    cells = df.sort_index(axis=1).stack().dropna()  # (ticker, date label) -> record
+    records = pd.DataFrame.from_records(cells.tolist()).drop(columns='Date', errors='ignore')
+    periods = pd.to_datetime(cells.index.get_level_values(1), format=DFLT_DATE_FORMAT)
+    return _long_from_records(records, cells.index.get_level_values(0), periods)
+
+
+def long_quarterly_earnings(quarterly_earnings: pd.DataFrame, cols=None):
+    """The long (``ticker, period, item, value``) table of the ``quarterly_earnings``
+    collection (the input of ``prep_quarterly_earnings``)."""
+    ticker_records = quarterly_earnings['records'].sort_index().explode().dropna()
+    records = pd.DataFrame.from_records(ticker_records.tolist())
+    periods = parse_quarter_labels(records['Quarter'])
+    tickers = ticker_records.index
+    # as in to_quarter_df, the last record of a quarter wins
+    keep = ~pd.DataFrame({'t': tickers, 'p': periods}).duplicated(keep='last').to_numpy()
+    if cols:
+        records = records[cols]
+    return _long_from_records(records[keep], tickers[keep], periods[keep])
+
+
+class QuarterlyViews(Mapping):
+    """A ``{ticker: quarterly_df, ...}`` mapping over a long (``ticker, period, item, value``)
+    table, whose frames (quarters x items, like those of ``prep_quarterly_*``) are only made
+    when asked for. Items that a ticker has no value for are not in its frame.
+
+    >>> long = pd.DataFrame({'ticker': ['A', 'A', 'B'], 'period': pd.to_datetime(['2020-01-01'] * 3),
+    ...                      'item': ['Cash', 'Debt', 'Cash'], 'value': [1., 2., 3.]})
+    >>> views = QuarterlyViews(long)
+    >>> list(views)
+    ['A', 'B']
+    >>> views['A']
+                Cash  Debt
+    2020-01-01   1.0   2.0
+    """
+
+    def __init__(self, long: pd.DataFrame):
+        tickers = long['ticker'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, tickers[1:] != tickers[:-1]])
+        if len(set(tickers[starts])) < len(starts):  # rows of a ticker are not contiguous
+            long = long.sort_values('ticker', kind='stable')
+            tickers = long['ticker'].to_numpy()
+            starts = np.flatnonzero(np.r_[True, tickers[1:] != tickers[:-1]])
+        stops = np.r_[starts[1:], len(tickers)]
+        self.long = long
+        self._slice_of_ticker = {
+            tickers[start]: slice(start, stop) for start, stop in zip(starts, stops)
+        }
+        # factorize once for all, so that making a view is only a few numpy operations
+        self._period_codes, self._periods = pd.factorize(long['period'])
+        self._item_codes, self._items = pd.factorize(long['item'])
+        self._values = long['value'].to_numpy()
+
+    @staticmethod
+    def _local_codes(codes):
+        """The distinct codes, in order of appearance, and the position of each code in them."""
+        distinct, first_idx, inverse = np.unique(codes, return_index=True, return_inverse=True)
+        order = np.argsort(first_idx)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        return distinct[order], rank[inverse]
+
+    def __getitem__(self, ticker):
+        rows = self._slice_of_ticker[ticker]
+        periods, period_idx = self._local_codes(self._period_codes[rows])
+        items, item_idx = self._local_codes(self._item_codes[rows])
+        values = self._values[rows]
+        arr = np.full((len(periods), len(items)), np.nan, dtype=values.dtype)
+        arr[period_idx, item_idx] = values
+        has_values = ~pd.isna(arr).all(axis=0)
+        return pd.DataFrame(
+            arr[:, has_values],
+            index=pd.DatetimeIndex(self._periods[periods]),
+            columns=self._items[items[has_values]],
+        )
+
+    def __iter__(self):
+        yield from self._slice_of_ticker
+
+    def __len__(self):
+        return len(self._slice_of_ticker)
+
+    def aligned(self, cols=None):
+        """What ``_aligned_quarterly_data(self.items(), cols)`` gives, computed on the long
+        table at once, instead of by making (and aligning) the frame of each ticker.
+        (With ``cols``, items a ticker doesn't have are NaN, instead of a ``KeyError``.)
+
+        >>> long = pd.DataFrame({'ticker': ['A', 'A', 'A', 'B'], 'item': ['x', 'y', 'x', 'y'],
+        ...                      'period': pd.to_datetime(['2020-01-01'] * 2 + ['2020-04-01'] * 2),
+        ...                      'value': [1., 2., 3., 4.]})
+        >>> views = QuarterlyViews(long)
+        >>> fast, slow = views.aligned(), _aligned_quarterly_data(list(views.items()))
+        >>> np.array_equal(fast[0], slow[0], equal_nan=True)
+        True
+        >>> all(np.array_equal(a, b) for a, b in zip(fast[1:], slow[1:]))
+        True
+        """
+        ticker_of_row = np.empty(len(self._values), dtype=np.int64)
+        for t, rows in enumerate(self._slice_of_ticker.values()):
+            ticker_of_row[rows] = t
+        n_tickers = len(self._slice_of_ticker)
+        # the quarter ordinal of each row: rank of its period (by first appearance) in the ticker
+        _, quarter_of_row, n_quarters = _ranks_in_ticker(
+            ticker_of_row, self._period_codes, n_tickers
+        )
+        item_codes = self._item_codes
+        # as in the views, the last of the rows of a (ticker, period, item) cell wins
+        cells = (ticker_of_row * len(self._periods) + self._period_codes) * len(
+            self._items
+        ) + item_codes
+        _, last_of_reversed, cell_of_row = np.unique(
+            cells[::-1], return_index=True, return_inverse=True
+        )
+        last_row_of_cell = len(cells) - 1 - last_of_reversed
+        values = self._values.astype(float)[last_row_of_cell[cell_of_row.ravel()[::-1]]]
+        if cols is None:
+            # items of a ticker, by first appearance, without those that have no value
+            pair_of_row = ticker_of_row * len(self._items) + item_codes
+            n_values = np.bincount(
+                pair_of_row, weights=~np.isnan(values), minlength=n_tickers * len(self._items)
+            )
+            kept = n_values[pair_of_row] > 0
+            first_rows, position_of_row, _ = _ranks_in_ticker(
+                ticker_of_row[kept], item_codes[kept], n_tickers
+            )
+            # items, by first appearance over the tickers (their columns, in order)
+            kept_codes = item_codes[kept][first_rows]
+            _, first = np.unique(kept_codes, return_index=True)
+            item_order = kept_codes[np.sort(first)]
+            items = list(self._items[item_order])
+        else:
+            items = list(cols)
+            code_of_item = {item: code for code, item in enumerate(self._items)}
+            item_order = np.array([code_of_item.get(item, -1) for item in items])
+            kept = np.isin(item_codes, item_order)
+            position_of_row = None
+        idx_of_code = np.full(len(self._items) + 1, -1)
+        idx_of_code[item_order] = np.arange(len(item_order))
+        item_of_row = idx_of_code[item_codes[kept]]
+        if position_of_row is None:
+            position_of_row = item_of_row
+        n_max = max(n_quarters.max(initial=0), 1)
+        arr = np.full((n_tickers, len(items), n_max), np.nan)
+        arr[ticker_of_row[kept], item_of_row, quarter_of_row[kept]] = values[kept]
+        positions = np.full((n_tickers, len(items)), -1)
+        positions[ticker_of_row[kept], item_of_row] = position_of_row
+        return arr, n_quarters, list(self._slice_of_ticker), items, positions
+
+
+def _ranks_in_ticker(ticker_of_row, codes, n_tickers):
+    """For rows (contiguous by ticker), the rank of each row's code among the distinct codes
+    of its ticker, in order of first appearance, along with the first row of each distinct
+    ``(ticker, code)`` (in order), and the number of distinct codes of each ticker."""
+    pairs = ticker_of_row * (codes.max(initial=0) + 1) + codes
+    _, first_rows, pair_of_row = np.unique(pairs, return_index=True, return_inverse=True)
+    order = np.argsort(first_rows, kind='stable')
+    tickers_in_order = ticker_of_row[first_rows[order]]
+    n_codes = np.bincount(tickers_in_order, minlength=n_tickers)
+    starts = np.r_[0, np.cumsum(n_codes)[:-1]]
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order)) - starts[tickers_in_order]
+    return first_rows[order], rank[pair_of_row.ravel()], n_codes
+
+
 def quarter_data_features(quarter_value_seq, n=2):
     """Quarterly data features. Assumes that quarter_value_seq has been sorted by time"""
     s = np.array(quarter_value_seq)  # copy and/or make into array
@@ -114,18 +313,259 @@ def ticker_featname_featval_iterable_to_df(triple_iterable):
     return pd.DataFrame(d).T
 
 
+def _aligned_quarterly_data(quarter_items, cols=None):
+    """Does the work of ``quarterly_array``, also returning the ``ticker x item`` array of the
+    positions of items in the columns of the ticker's frame (-1 if absent)."""
+    views = getattr(quarter_items, '_mapping', quarter_items)  # the mapping of an items view
+    if isinstance(views, QuarterlyViews):
+        return views.aligned(cols)
+    tickers, blocks, item_idxs = [], [], []
+    idx_of_item = dict()
+    for ticker, df in quarter_items:
+        if cols is not None:
+            df = df[cols]
+        tickers.append(ticker)
+        blocks.append(df.to_numpy(dtype=float, na_value=np.nan))
+        item_idxs.append(
+            [idx_of_item.setdefault(item, len(idx_of_item)) for item in df.columns]
+        )
+    n_quarters = np.array([len(block) for block in blocks], dtype=int)
+    n_max = max(n_quarters.max(initial=0), 1)
+    arr = np.full((len(tickers), len(idx_of_item), n_max), np.nan)
+    positions = np.full((len(tickers), len(idx_of_item)), -1)
+    for t, (block, idxs) in enumerate(zip(blocks, item_idxs)):
+        arr[t, idxs, : len(block)] = block.T
+        positions[t, idxs] = np.arange(len(idxs))
+    return arr, n_quarters, tickers, list(idx_of_item), positions
+
+
+def quarterly_array(quarter_items, cols=None):
+    """Align the quarterly frames of ``quarter_items`` (``(ticker, df)`` pairs, where ``df``
+    has one row per quarter, sorted by time, and one column per item) in one array.
+
+    Returns ``(arr, n_quarters, tickers, items)`` where ``arr`` is a ``ticker x item x quarter``
+    array whose quarter axis is the ordinal of the quarter for the ticker
+    (padded with NaNs, after the ``n_quarters[t]`` quarters of ticker ``t``).
+
+    >>> q = pd.DataFrame({'a': [1., 2., 3.], 'b': [4., 5., 6.]})
+    >>> arr, n_quarters, tickers, items = quarterly_array([('X', q), ('Y', q.iloc[:2, :1])])
+    >>> arr.shape, n_quarters.tolist(), tickers, items
+    ((2, 2, 3), [3, 2], ['X', 'Y'], ['a', 'b'])
+    >>> arr[1]
+    array([[ 1.,  2., nan],
+           [nan, nan, nan]])
+    """
+    return _aligned_quarterly_data(quarter_items, cols)[:4]
+
+
+def _mean_of_diffs(arr, n_quarters, order):
+    """The mean of the ``order``-th diffs of the (NaN padded) quarter sequences of ``arr``."""
+    diffs = np.diff(arr, order, axis=-1)
+    n_diffs = n_quarters - order
+    valid = np.arange(diffs.shape[-1]) < n_diffs[:, None, None]
+    n_diffs = np.where(n_diffs > 0, n_diffs, np.nan)[:, None]  # no diffs: nan (like np.mean([]))
+    return np.sum(diffs, axis=-1, where=valid) / n_diffs
+
+
+def batch_quarter_data_features(arr, n_quarters, n=2):
+    """The ``quarter_data_features`` of all the ``ticker x item`` sequences of ``arr``
+    (see ``quarterly_array``), computed at once.
+    Returns a ``ticker x item x n`` array of ``(m0, m1, m2)[:n]`` features.
+
+    >>> arr, n_quarters, *_ = quarterly_array([('X', pd.DataFrame({'a': [1., 2., 4.]}))])
+    >>> np.allclose(batch_quarter_data_features(arr, n_quarters, n=3)[0, 0],
+    ...             quarter_data_features([1., 2., 4.], n=3))
+    True
+    """
+    if n not in (1, 2, 3):
+        raise ValueError(f"n should be 1, 2 or 3 (was {n})")
+    present = np.arange(arr.shape[-1]) < n_quarters[:, None, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m0 = np.sum(arr, axis=-1, where=present) / n_quarters[:, None]
+        features = [m0]
+        if n >= 2:
+            arr = arr / np.abs(m0)[..., None]  # normalize out m0
+            m1 = _mean_of_diffs(arr, n_quarters, 1)
+            features.append(m1)
+        if n == 3:
+            arr = arr / np.abs(m1)[..., None]  # normalize out m1
+            features.append(_mean_of_diffs(arr, n_quarters, 2))
+    return np.stack(features, axis=-1)
+
+
+def _merge_same_named_items(features, names, positions):
+    """Merge the features of items that have the same (normalized) name, as
+    ``quarter_feature_gen`` would: for each ticker, the value of the item that comes
+    last in the ticker's columns (among those with a non-NaN value) is kept."""
+    idxs_of_name = dict()
+    for idx, name in enumerate(names):
+        idxs_of_name.setdefault(name, []).append(idx)
+    merged = np.empty((features.shape[0], len(idxs_of_name), features.shape[-1]))
+    for j, idxs in enumerate(idxs_of_name.values()):
+        group = features[:, idxs]
+        priority = np.where(np.isnan(group), -1, positions[:, idxs, None])
+        chosen = np.take_along_axis(group, priority.argmax(axis=1)[:, None], axis=1)[:, 0]
+        merged[:, j] = np.where(priority.max(axis=1) >= 0, chosen, np.nan)
+    return merged, list(idxs_of_name)
+
+
+def quarter_features_df(quarter_items, cols=None, n=2):
+    """The wide (ticker x feature) frame of the quarter features of ``quarter_items``.
+    Same as ``ticker_featname_featval_iterable_to_df(quarter_feature_gen(quarter_items, cols))``
+    (up to the order of rows and columns), but vectorized.
+
+    >>> q = pd.DataFrame({'Net Income': [1., 3.], 'Cash': [2., np.nan]})
+    >>> quarter_features_df([('X', q)])
+       q_net_income_0  q_net_income_1
+    X             2.0             1.0
+    """
+    arr, n_quarters, tickers, items, positions = _aligned_quarterly_data(quarter_items, cols)
+    if not tickers:
+        return pd.DataFrame()
+    features = batch_quarter_data_features(arr, n_quarters, n)
+    names = [normalize_str(k) for k in items]
+    if len(set(names)) < len(names):
+        features, names = _merge_same_named_items(features, names, positions)
+    columns = [f"q_{name}_{i}" for name in names for i in range(n)]
+    df = pd.DataFrame(features.reshape(len(tickers), -1), index=tickers, columns=columns)
+    return df.dropna(axis=1, how='all').dropna(axis=0, how='all')
+
+
+def concat_features_dfs(features_dfs):
+    """Concatenate feature frames (of different sources). Where several give the same
+    ``(ticker, feature)``, the last non-NaN value is kept."""
+    df = pd.concat(list(features_dfs), axis=1, sort=False)
+    if not df.columns.has_duplicates:
+        return df
+    return df.T.groupby(level=0, sort=False).last().T
+
+
+# ---------------------------------------------------------------------------------------
+# Incremental recomputation: a persistent feature table, with the fingerprints of its inputs
+
+FEATURES_VERSION = 1  # bump when the features computation changes, to invalidate caches
+
+
+def ticker_fingerprints(long: pd.DataFrame):
+    """A ``{ticker: fingerprint}`` Series, where the fingerprint is a hash of the
+    (ordered) ``(period, item, value)`` rows of the ticker in the ``long`` table."""
+    views = QuarterlyViews(long)  # makes the rows of each ticker contiguous
+    long = views.long
+    if not len(long):
+        return pd.Series(dtype='uint64')
+    ordinal = long.groupby('ticker', sort=False).cumcount()
+    rows = long[['period', 'item', 'value']].assign(ordinal=ordinal.to_numpy())
+    row_hashes = pd.util.hash_pandas_object(rows, index=False).to_numpy()
+    starts = [s.start for s in views._slice_of_ticker.values()]
+    return pd.Series(np.bitwise_xor.reduceat(row_hashes, starts), index=list(views))
+
+
+class FeatureCache:
+    """A persistent (pickled) feature table, along with the fingerprints of the inputs
+    (per ticker and kind of quarterly data) it was computed from, so that only the features
+    of tickers whose inputs changed need to be recomputed (see ``update``).
+
+    :param filepath: Where to keep the cache. Default: ``feature_cache.p`` in the invest
+        root directory.
+    """
+
+    def __init__(self, filepath=None):
+        if filepath is None:
+            from invest.dacc import proj_file
+
+            filepath = proj_file('feature_cache.p')
+        self.filepath = filepath
+        self.fingerprints = pd.DataFrame()  # ticker x kind
+        self.features = pd.DataFrame()  # ticker x feature
+        self.last_report = None
+        if os.path.isfile(filepath):
+            with open(filepath, 'rb') as fp:
+                saved = pickle.load(fp)
+            if saved.get('version') == FEATURES_VERSION:
+                self.fingerprints, self.features = saved['fingerprints'], saved['features']
+
+    def save(self):
+        from invest.stores import _atomic_write
+
+        saved = dict(version=FEATURES_VERSION, fingerprints=self.fingerprints, features=self.features)
+
+        def write(filepath):
+            with open(filepath, 'wb') as fp:
+                pickle.dump(saved, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+        _atomic_write(self.filepath, write)
+
+    def update(self, long_of_kind: dict):
+        """Bring the features up to date with the ``{kind: long_table, ...}`` inputs,
+        recomputing only the tickers whose inputs changed (or are new), and dropping the
+        tickers that are gone. Saves the cache, and returns (and keeps, in
+        ``last_report``) the numbers of tickers reused, recomputed and removed.
+        """
+        fingerprint_of_kind = {kind: ticker_fingerprints(long) for kind, long in long_of_kind.items()}
+        tickers = pd.Index([]).append([s.index for s in fingerprint_of_kind.values()]).unique()
+        fingerprints = pd.DataFrame(  # (reindexing each, so that hashes don't go through floats)
+            {kind: s.reindex(tickers, fill_value=0) for kind, s in fingerprint_of_kind.items()},
+            index=tickers,
+        )
+        old = self.fingerprints.reindex(index=fingerprints.index, columns=fingerprints.columns)
+        changed = (old != fingerprints).any(axis=1)
+        recompute = list(fingerprints.index[changed.to_numpy()])
+        removed = self.fingerprints.index.difference(fingerprints.index)
+
+        def items(kind):
+            views = QuarterlyViews(long_of_kind[kind])
+            return ((ticker, views[ticker]) for ticker in recompute if ticker in views)
+
+        new_features = concat_features_dfs(
+            quarter_features_df(items(kind)) for kind in long_of_kind
+        )
+        kept = self.features.drop(index=removed.union(recompute), errors='ignore')
+        features = pd.concat([kept, new_features], axis=0, sort=False)
+        self.features = features.dropna(axis=1, how='all')
+        self.fingerprints = fingerprints
+        self.save()
+        self.last_report = dict(
+            n_reused=len(fingerprints) - len(recompute),
+            n_recomputed=len(recompute),
+            n_removed=len(removed),
+        )
+        return self.last_report
+
+
 class Dacc:
     quarterly_earnings_cols = ['Revenue', 'Earnings']
-
-    def __init__(self):
+    quarterly_kinds = (
+        'quarterly_earnings', 'quarterly_balance_sheet', 'quarterly_cashflow', 'quarterly_financials'
+    )
+
+    def __init__(self, *, feature_cache=None):
+        """
+        :param feature_cache: The ``FeatureCache`` (or its filepath, or ``True`` for the
+            default ``FeatureCache()``) that ``features_df`` uses to only recompute the
+            features of tickers whose inputs changed. By default (``None``), there's no
+            cache (nothing is written to disk), and all features are computed.
+        """
         self.db = DbDf()
+        if feature_cache is True:
+            feature_cache = FeatureCache()
+        elif isinstance(feature_cache, str):
+            feature_cache = FeatureCache(feature_cache)
+        elif feature_cache is False:
+            feature_cache = None
+        self.feature_cache = feature_cache
+        self._long_quarterly = dict()
 
     def __iter__(self):
         yield from self.db
 
+    def _quarterly_earnings_data(self):
+        # only read the fields of the records that are used
+        fields = ['Quarter', *self.quarterly_earnings_cols]
+        return self.db.frame('quarterly_earnings', fields=[f'records.{f}' for f in fields])
+
     @lazyprop
     def quarterly_earnings(self):
-        data = self.db['quarterly_earnings']
+        data = self._quarterly_earnings_data()
         return prep_quarterly_earnings(data, self.quarterly_earnings_cols)
 
     @lazyprop
@@ -140,6 +580,24 @@ class Dacc:
     def quarterly_financials(self):
         return prep_quarterly_from_df(self.db['quarterly_financials'])
 
+    def long_quarterly(self, kind):
+        """The long (``ticker, period, item, value``) table of the ``kind`` collection
+        (e.g. ``'quarterly_balance_sheet'``), made in bulk, and cached."""
+        if kind not in self._long_quarterly:
+            if kind == 'quarterly_earnings':
+                long = long_quarterly_earnings(
+                    self._quarterly_earnings_data(), self.quarterly_earnings_cols
+                )
+            else:
+                long = long_quarterly_from_df(self.db[kind])
+            self._long_quarterly[kind] = long
+        return self._long_quarterly[kind]
+
+    def quarterly_views(self, kind):
+        """A ``{ticker: quarterly_df, ...}`` mapping (like ``self.quarterly_balance_sheet``, etc.)
+        whose frames are made on demand, from ``self.long_quarterly(kind)``."""
+        return QuarterlyViews(self.long_quarterly(kind))
+
     def features_gen(self):
         yield from quarter_feature_gen(self.quarterly_earnings.items(), self.quarterly_earnings_cols)
         yield from quarter_feature_gen(self.quarterly_balance_sheet.items())
@@ -148,4 +606,18 @@ class Dacc:
 
     @lazyprop
     def features_df(self):
-        return ticker_featname_featval_iterable_to_df(self.features_gen())
+        """The ticker x feature frame of all quarterly features (vectorized).
+        ``ticker_featname_featval_iterable_to_df(self.features_gen())`` gives the same
+        (up to the order of rows and columns), one value at a time.
+
+        If there's a ``feature_cache``, only the features of tickers whose inputs changed
+        are recomputed (see ``self.feature_cache.last_report`` for how many).
+        """
+        if self.feature_cache is not None:
+            long_of_kind = {kind: self.long_quarterly(kind) for kind in self.quarterly_kinds}
+            self.feature_cache.update(long_of_kind)
+            return self.feature_cache.features
+        return concat_features_dfs(
+            quarter_features_df(self.quarterly_views(kind).items())
+            for kind in self.quarterly_kinds
+        )
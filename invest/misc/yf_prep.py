@@ -1,13 +1,17 @@
 import re
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
 import pandas as pd
-from py2store import cache_iter, filt_iter, wrap_kvs, kvhead, groupby, ihead, lazyprop
+from py2store import filt_iter, wrap_kvs, kvhead, groupby, ihead, lazyprop
 from py2store import KvReader
 
 from invest.dacc import TickerData
 from invest.dacc import proj_file
-from invest.util import print_progress
+from invest.util import print_progress, bounded_thread_map
 
-from invest.util import is_bsonizable, DFLT_DATE_FORMAT
+from invest.util import is_bsonizable, is_bson_compatible, DFLT_DATE_FORMAT
 
 
 def asis(x):
@@ -34,25 +38,107 @@ def convert_df_as_dict_list_without_index(df):
     return {'records': df.to_dict(orient='records')}
 
 
+DFLT_TRY_CONVERTERS = (
+    asis, df_to_dict, convert_df_with_timestamp_rows, convert_df_as_dict_list_with_index
+)
+
+
+def dtype_signature(v):
+    """A (cheap) description of the "shape" of ``v``: what a converter's success depends on.
+
+    String labels are ``'str'``, whatever their dtype (``object``, or ``str`` in pandas 3).
+
+    >>> dtype_signature(pd.DataFrame({'a': [1, 2], 'b': [.5, .1]}))
+    ('DataFrame', 'int64', 'str', ('float64', 'int64'))
+    >>> dtype_signature({'name': 'NVDA', 'price': 118.5})
+    ('dict', ('float', 'str'))
+    """
+    if isinstance(v, pd.DataFrame):
+        return (
+            'DataFrame', _labels_dtype(v.index), _labels_dtype(v.columns),
+            tuple(sorted(set(map(str, v.dtypes))))
+        )
+    elif isinstance(v, pd.Series):
+        return 'Series', _labels_dtype(v.index), str(v.dtype)
+    elif isinstance(v, dict):
+        return 'dict', tuple(sorted({type(x).__name__ for x in v.values()}))
+    elif isinstance(v, (list, tuple)):
+        return type(v).__name__, tuple(sorted({type(x).__name__ for x in v}))
+    return (type(v).__name__,)
+
+
+def _labels_dtype(labels):
+    if pd.api.types.is_string_dtype(labels):  # (infers it, for object labels)
+        return 'str'
+    return str(labels.dtype)
+
+
+class ConverterCache:
+    """Finds the first of ``try_converters`` that makes a value BSON compatible, and remembers
+    it for the ``(data_kind, dtype_signature(value))`` of the value, so that values of the same
+    kind and shape don't need to be checked again.
+
+    Candidates are checked with the (fast, structural) ``is_bson_compatible``. If
+    ``confirm_with_slow_check``, the winner is then confirmed (once per signature) with the
+    (slow, serializing) ``is_bsonizable``.
+
+    >>> converter_for = ConverterCache(confirm_with_slow_check=False)
+    >>> df = pd.DataFrame({'Open': [1.0, 2.0]}, index=pd.to_datetime(['2020-01-01', '2020-01-02']))
+    >>> converter_for('actions', df).__name__
+    'convert_df_as_dict_list_with_index'
+    >>> converter_for('actions', df * 2).__name__  # same kind and signature: no checks
+    'convert_df_as_dict_list_with_index'
+    >>> converter_for.n_hits, converter_for.n_misses
+    (1, 1)
+    """
+
+    def __init__(self, try_converters=DFLT_TRY_CONVERTERS, *, confirm_with_slow_check=True):
+        self.try_converters = try_converters
+        self.confirm_with_slow_check = confirm_with_slow_check
+        self.converter_of_signature = dict()
+        self.n_hits = self.n_misses = 0
+
+    def __call__(self, data_kind, v):
+        """The converter for value ``v`` of kind ``data_kind`` (``None`` if none works)"""
+        signature = (data_kind, dtype_signature(v))
+        if signature in self.converter_of_signature:
+            self.n_hits += 1
+            return self.converter_of_signature[signature]
+        self.n_misses += 1
+        converter = self._find_converter(v)
+        self.converter_of_signature[signature] = converter
+        return converter
+
+    def _find_converter(self, v):
+        for converter in self.try_converters:
+            try:
+                converted = converter(v)
+            except Exception:
+                continue
+            if is_bson_compatible(converted) and (
+                not self.confirm_with_slow_check or is_bsonizable(converted)
+            ):
+                return converter
+
+
 def conversion_scanner(data_store,
                        try_keys,
-                       try_converters=(
-                               asis, df_to_dict, convert_df_with_timestamp_rows, convert_df_as_dict_list_with_index),
-                       if_not_found='print_key'):
+                       try_converters=DFLT_TRY_CONVERTERS,
+                       if_not_found='print_key',
+                       converter_cache=None):
     """
     # >>> dict(conversion_scanner(data_store=ldata, try_keys=map(ihead, keys_by_kind.values())))
+
+    Converters are found (and remembered) by ``converter_cache`` (by default, a new
+    ``ConverterCache(try_converters)``), so values whose kind and dtype signature were
+    already seen are not checked again.
     """
+    if converter_cache is None:
+        converter_cache = ConverterCache(try_converters)
     for k in try_keys:
         v = data_store[k]
         ticker_symbol, data_kind = k
-        working_converter = None
-        for converter in try_converters:
-            try:
-                if is_bsonizable(converter(v)):
-                    working_converter = converter
-                    break
-            except Exception as e:
-                pass
+        working_converter = converter_cache(data_kind, v)
         if working_converter is not None:
             yield data_kind, working_converter
         else:
@@ -80,36 +166,188 @@ key_wrap = wrap_kvs(key_of_id=lambda x: tuple(x.split('/')),
                     id_of_key='/'.join)
 
 
+# keys are listed from the store's manifest, so they don't need to be cached (cache_iter)
 @key_wrap
-@cache_iter
 class LocalData(TickerData):
     pass
 
 
-def copy_local_to_mongo():
-    keys_that_had_empty_vals = set()
-    malformed_val_record = dict()
-
+DFLT_EXPORT_BATCH_SIZE = 500
+DFLT_EXPORT_MAX_WORKERS = 8
+
+
+@dataclass
+class ExportStats:
+    """Counters (and throughput) of a bulk export."""
+
+    n_written: int = 0
+    n_empty: int = 0
+    n_failed: int = 0
+    n_batches: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    ended_at: Optional[float] = None
+    empty_keys: list = field(default_factory=list, repr=False)
+    errors: dict = field(default_factory=dict, repr=False)
+
+    @property
+    def elapsed(self):
+        return (self.ended_at or time.perf_counter()) - self.started_at
+
+    @property
+    def docs_per_sec(self):
+        return self.n_written / max(self.elapsed, 1e-9)
+
+    def __str__(self):
+        return (
+            f'{self.n_written} written, {self.n_empty} empty, {self.n_failed} failed '
+            f'in {self.n_batches} batches, {self.elapsed:.1f}s ({self.docs_per_sec:.1f} docs/s)'
+        )
+
+
+def _ticker_and_kind(k):
+    if isinstance(k, str):
+        return tuple(k.split('/'))
+    return tuple(k)
+
+
+def bulk_export_to_mongo(
+    local_data,
+    db,
+    *,
+    keys=None,
+    converters=converter_for_data_kind,
+    batch_size=DFLT_EXPORT_BATCH_SIZE,
+    max_workers=DFLT_EXPORT_MAX_WORKERS,
+    progress_every=1000,
+    verbose=True,
+) -> ExportStats:
+    """Export the ``(ticker_symbol, data_kind)`` values of ``local_data`` to the
+    ``data_kind`` collections of the Mongo database ``db``, as ``{'_id': ticker_symbol, ...}``
+    documents (replacing existing ones).
+
+    Values are read and converted (see ``converter_for_data_kind``) by ``max_workers``
+    threads, and the documents are written with one unordered ``bulk_write`` of upserts per
+    ``batch_size`` documents of a collection (instead of three round trips per document).
+
+    :param local_data: The store to export (keys can be ``(ticker, kind)`` or ``'ticker/kind'``)
+    :param db: A ``pymongo`` (or ``mongomock``) database
+    :param keys: The keys to export (default: all keys of ``local_data``)
+    :param converters: A ``{data_kind: converter}`` dict. A ``ConverterCache`` finds the
+        converters of kinds that are not in it.
+    :return: An ``ExportStats``. Keys of empty values are not exported, but listed in
+        its ``empty_keys``, and failed keys are in its ``errors``.
+
+    Documents that are not BSON compatible (see ``is_bson_compatible``) fail on their own
+    (before batching), and if a batch write fails as a whole, its documents are written
+    one by one, so that one bad document doesn't fail the others.
+
+    >>> import mongomock
+    >>> db = mongomock.MongoClient()['yf']
+    >>> local_data = {
+    ...     ('NVDA', 'info'): {'shortName': 'NVIDIA'},
+    ...     ('NVDA', 'actions'): [],
+    ...     ('AAPL', 'info'): {'shortName': 'Apple', 'bad': {1: 'non str key'}},
+    ... }
+    >>> stats = bulk_export_to_mongo(local_data, db, verbose=False)
+    >>> stats.n_written, stats.empty_keys, list(stats.errors)
+    (1, [('NVDA', 'actions')], [('AAPL', 'info')])
+    >>> db['info'].find_one({'_id': 'NVDA'})
+    {'_id': 'NVDA', 'shortName': 'NVIDIA'}
+    """
+    from pymongo import ReplaceOne
+    from pymongo.errors import BulkWriteError
+
+    find_converter = ConverterCache()
+    stats = ExportStats()
+    batches = dict()  # data_kind -> [(key, doc), ...]
+
+    def prepare(key):
+        v = local_data[key]
+        if v is None or len(v) == 0:
+            return None
+        ticker_symbol, data_kind = _ticker_and_kind(key)
+        converter = converters.get(data_kind) or find_converter(data_kind, v)
+        if converter is None:
+            raise ValueError(f"No converter makes {key} BSON compatible")
+        doc = dict(converter(v), _id=ticker_symbol)
+        if not is_bson_compatible(doc):
+            raise ValueError(f"The document of {key} is not BSON compatible")
+        return doc
+
+    def write_one_by_one(collection, requests):
+        failed = dict()
+        for i, request in enumerate(requests):
+            try:
+                collection.bulk_write([request])
+            except Exception as e:
+                failed[i] = e
+        return failed
+
+    def flush(data_kind):
+        batch = batches.pop(data_kind, [])
+        if not batch:
+            return
+        requests = [ReplaceOne({'_id': doc['_id']}, doc, upsert=True) for _, doc in batch]
+        failed = dict()
+        try:
+            db[data_kind].bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            failed = {err['index']: err.get('errmsg') for err in e.details.get('writeErrors', [])}
+        except Exception:  # the whole batch failed: find the culprits
+            failed = write_one_by_one(db[data_kind], requests)
+        stats.n_batches += 1
+        stats.n_written += len(batch) - len(failed)
+        for i, error in failed.items():
+            stats.n_failed += 1
+            stats.errors[batch[i][0]] = error
+
+    def handle_done(key, future):
+        try:
+            doc = future.result()
+        except Exception as error:
+            stats.n_failed += 1
+            stats.errors[key] = error
+            if verbose:
+                print(f"!!! Error with {key}: {error}")
+            return
+        if doc is None:
+            stats.n_empty += 1
+            stats.empty_keys.append(key)
+            return
+        data_kind = _ticker_and_kind(key)[1]
+        batches.setdefault(data_kind, []).append((key, doc))
+        if len(batches[data_kind]) >= batch_size:
+            flush(data_kind)
+        n_handled = stats.n_written + stats.n_empty + stats.n_failed
+        if verbose and progress_every and n_handled and n_handled % progress_every == 0:
+            print_progress(f"{n_handled}: {key} -- {stats}")
+
+    try:
+        keys = local_data if keys is None else keys
+        bounded_thread_map(prepare, keys, handle_done, max_workers=max_workers)
+        for data_kind in list(batches):
+            flush(data_kind)
+    finally:
+        stats.ended_at = time.perf_counter()
+        if verbose:
+            print_progress(f"Export to mongo: {stats}")
+    return stats
+
+
+def copy_local_to_mongo(db=None, *, delete_empty=True, **export_kwargs):
+    """Export all the local data (``LocalData``) to the ``yf`` Mongo database (or ``db``),
+    with ``bulk_export_to_mongo``, then delete the local keys that had empty values."""
     ldata = LocalData()
+    if db is None:
+        from pymongo import MongoClient
 
-    for i, (k, v) in enumerate(ldata.items()):
-        try:
-            print_progress(f"{i=}: {k}")
-            if v is not None and len(v) > 0:
-                ticker_symbol, data_kind = k
-                mongo_key = {'_id': ticker_symbol}
-                if mongo_key in yf[data_kind]:
-                    del yf[data_kind][mongo_key]
-                if mongo_key not in yf[data_kind]:
-                    converter = converter_for_data_kind[data_kind]
-                    yf[data_kind][mongo_key] = converter(v)
-            else:
-                print(f"--> Empty value, deleting ldata[{k}]...")
-                keys_that_had_empty_vals.add(k)
-                del ldata[k]
-        except Exception as e:
-            malformed_val_record[k] = e
-            print(f"!!! Error with {k}: {e}")
+        db = MongoClient()['yf']
+    stats = bulk_export_to_mongo(ldata, db, **export_kwargs)
+    if delete_empty:
+        for k in stats.empty_keys:
+            print(f"--> Empty value, deleting ldata[{k}]...")
+            del ldata[k]
+    return stats
 
 
 def mgc_to_df(mgc):
@@ -124,16 +362,110 @@ def mgc_to_prepped_data(mgc):
 
 
 from mongodol import MongoDbReader, MongoCollectionPersister
-from py2store.caching import mk_cached_store
 
 yf = MongoDbReader('yf', mk_collection_store=MongoCollectionPersister)
 
+DFLT_CURSOR_BATCH_SIZE = 1000
+
+
+def _frame_of_cursor(cursor):
+    """The ``ticker`` indexed frame of the documents of ``cursor`` (as ``mgc_to_df``
+    makes), accumulated column by column as the documents arrive (in cursor batches)."""
+    index, columns = [], dict()
+    for i, doc in enumerate(cursor):
+        index.append(doc.pop('_id'))
+        for k, v in doc.items():
+            if k not in columns:
+                columns[k] = [float('nan')] * i
+            columns[k].append(v)
+        if len(doc) < len(columns):  # pad the columns this document doesn't have
+            for column in columns.values():
+                if len(column) == i:
+                    column.append(float('nan'))
+    return pd.DataFrame(columns, index=pd.Index(index, name='ticker'))
+
+
+def _as_key_part(x):
+    return None if x is None else tuple(sorted(set(x)))
+
+
+class DbDf(KvReader):
+    """The collections of a Mongo database (default: ``yf``), as (cached) ticker-indexed
+    frames.
+
+    ``self[kind]`` is the frame of the whole ``kind`` collection, and the keys are the
+    collection names. Use ``self.frame`` to only read some tickers and/or fields (the
+    filter and projection are done by Mongo).
+
+    :param mongo_db: The (``pymongo``) database to read (default: ``yf`` on the local server)
+    :param batch_size: The number of documents a cursor batch fetches
+
+    >>> import mongomock
+    >>> mongo_db = mongomock.MongoClient()['yf']
+    >>> _ = mongo_db['info'].insert_many([
+    ...     {'_id': 'AAPL', 'sector': 'Tech', 'marketCap': 3},
+    ...     {'_id': 'XOM', 'sector': 'Energy', 'marketCap': 1},
+    ... ])
+    >>> dbdf = DbDf(mongo_db)
+    >>> list(dbdf)
+    ['info']
+    >>> dbdf.frame('info', tickers=['XOM'], fields=['sector'])  # doctest: +NORMALIZE_WHITESPACE
+            sector
+    ticker
+    XOM     Energy
+    >>> dbdf['info']['marketCap'].to_dict()
+    {'AAPL': 3, 'XOM': 1}
+    """
+
+    def __init__(self, mongo_db=None, *, batch_size=DFLT_CURSOR_BATCH_SIZE):
+        self._mongo_db = mongo_db
+        self.batch_size = batch_size
+        self._frames = dict()  # (kind, tickers, fields) -> frame
+
+    @property
+    def mongo_db(self):
+        if self._mongo_db is None:
+            from pymongo import MongoClient
+
+            self._mongo_db = MongoClient()['yf']
+        return self._mongo_db
+
+    def frame(self, kind, tickers=None, fields=None):
+        """The frame of the ``kind`` collection, for ``tickers`` only (default: all),
+        with ``fields`` only (default: all).
+
+        ``fields`` are Mongo field paths, so can reach into documents: the
+        ``quarterly_earnings`` frame with only the ``Quarter`` and ``Revenue`` of its records
+        is ``self.frame('quarterly_earnings', fields=['records.Quarter', 'records.Revenue'])``.
+
+        Frames are cached by ``(kind, tickers, fields)``, so narrow and wide reads of a
+        collection are kept side by side.
+        """
+        key = (kind, _as_key_part(tickers), _as_key_part(fields))
+        if key not in self._frames:
+            self._frames[key] = self._read_frame(*key)
+        return self._frames[key]
+
+    def _read_frame(self, kind, tickers, fields):
+        query = {} if tickers is None else {'_id': {'$in': list(tickers)}}
+        projection = None if fields is None else dict.fromkeys(fields, 1)
+        cursor = self.mongo_db[kind].find(query, projection, batch_size=self.batch_size)
+        return _frame_of_cursor(cursor)
+
+    def __getitem__(self, kind):
+        return self.frame(kind)
+
+    def __iter__(self):
+        yield from sorted(self.mongo_db.list_collection_names())
+
+    def __len__(self):
+        return len(self.mongo_db.list_collection_names())
+
+    def __contains__(self, kind):
+        return kind in self.mongo_db.list_collection_names()
 
-@mk_cached_store
-@wrap_kvs(obj_of_data=mgc_to_df)
-class DbDf(MongoDbReader):
-    def __init__(self):
-        super().__init__('yf', mk_collection_store=MongoCollectionPersister)
+    def clear_cache(self):
+        self._frames.clear()
 
 
 def file_to_field_groups(file=proj_file('misc', 'field_groups_01.xlsx')):
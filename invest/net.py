@@ -0,0 +1,320 @@
+"""
+The shared HTTP session layer of invest.
+
+All the HTTP requests of invest (``util.requests_get``, ``util.read_html``, and,
+through ``yfinance``, ``Ticker`` and ``BulkHistory``) go through one
+``requests.Session``, so that connections are kept alive and reused (no new
+TCP/TLS handshake per request), in a bounded pool, and failed requests (429s and
+5xxs) are retried with exponential backoff (with jitter).
+
+Requests are also governed by an adaptive, per host, rate limiter
+(``rate_limiter``, see ``invest.ratelimit``): it slows down when a host throttles
+(``429``s, timeouts) and speeds up again as requests succeed. Its current state
+(rates, requests in flight and waiting) is in ``pool_stats()['rate_limits']``.
+
+>>> configure_http(pool_maxsize=4, max_retries=3)  # doctest: +SKIP
+>>> requests_get('https://example.com')  # doctest: +SKIP
+>>> pool_stats()  # doctest: +SKIP
+{'n_requests': 1, 'n_retries': 0, 'n_errors': 0,
+ 'rate_limits': {'example.com': {'rate': 5.2, 'concurrency': 4.25, 'in_flight': 0,
+                                 'queue_depth': 0, 'n_requests': 1, 'n_throttled': 0}},
+ 'pools': [{'host': 'example.com', 'port': 443, 'scheme': 'https', 'maxsize': 4,
+            'num_connections': 1, 'num_requests': 1, 'idle_connections': 1}]}
+"""
+
+import threading
+from dataclasses import dataclass, field, replace
+from typing import Optional
+
+from invest.ratelimit import HostLimits, RateLimiter, retry_after_seconds
+
+DFLT_REQUEST_HEADER = {'User-Agent': 'Mozilla/5.0'}
+DFLT_RETRY_STATUSES = (429, 500, 502, 503, 504)
+DFLT_YAHOO_HOST_LIMITS = HostLimits(rate=2, burst=5, max_rate=20, max_concurrency=8)
+DFLT_LIMITS_OF_HOST = {
+    'query1.finance.yahoo.com': DFLT_YAHOO_HOST_LIMITS,
+    'query2.finance.yahoo.com': DFLT_YAHOO_HOST_LIMITS,
+}
+
+
+@dataclass(frozen=True)
+class HttpConfig:
+    """The configuration of the shared session (see ``configure_http``).
+
+    :param pool_connections: The number of hosts to keep a connection pool for
+    :param pool_maxsize: The maximum number of connections kept (per host)
+    :param max_retries: The maximum number of retries of a request
+    :param backoff_factor: The retry delays are ``backoff_factor * 2 ** (retry - 1)``...
+    :param backoff_jitter: ... plus a random delay of up to this many seconds...
+    :param backoff_max: ... capped to this many seconds
+    :param retry_statuses: The HTTP statuses to retry on
+    :param timeout: The default timeout (in seconds) of ``requests_get``
+    :param headers: The default headers of requests
+    :param share_with_yfinance: Whether to give the session to ``yfinance`` too
+        (otherwise, ``yfinance`` uses its own, which ``rate_limiter`` doesn't govern)
+    :param rate_limit: Whether requests go through ``rate_limiter``
+    """
+
+    pool_connections: int = 10
+    pool_maxsize: int = 20
+    max_retries: int = 5
+    backoff_factor: float = 0.5
+    backoff_jitter: float = 0.5
+    backoff_max: float = 30
+    retry_statuses: tuple = DFLT_RETRY_STATUSES
+    timeout: Optional[float] = 30
+    headers: dict = field(default_factory=lambda: dict(DFLT_REQUEST_HEADER))
+    share_with_yfinance: bool = True
+    rate_limit: bool = True
+
+
+class _Counters:
+    def __init__(self):
+        self.n_requests = 0
+        self.n_retries = 0
+        self.n_errors = 0
+        self._lock = threading.Lock()
+
+    def count_response(self, response, *args, **kwargs):
+        retries = getattr(response.raw, 'retries', None)
+        n_retries = len(retries.history) if retries is not None else 0
+        with self._lock:
+            self.n_requests += 1
+            self.n_retries += n_retries
+            self.n_errors += not response.ok
+
+
+config = HttpConfig()
+rate_limiter = RateLimiter(limits_of_host=DFLT_LIMITS_OF_HOST)
+_session = None
+_counters = _Counters()
+_session_lock = threading.Lock()
+
+
+def _mk_retry(http_config: HttpConfig):
+    from urllib3.util.retry import Retry
+
+    return Retry(
+        total=http_config.max_retries,
+        backoff_factor=http_config.backoff_factor,
+        backoff_jitter=http_config.backoff_jitter,
+        backoff_max=http_config.backoff_max,
+        status_forcelist=http_config.retry_statuses,
+        respect_retry_after_header=True,
+        raise_on_status=False,  # so that the last response can be counted and raised
+    )
+
+
+def _was_throttled(response, throttle_statuses):
+    """Whether the host throttled the request (in its response, or in its retries)."""
+    if response.status_code in throttle_statuses:
+        return True
+    retries = getattr(response.raw, 'retries', None)
+    history = retries.history if retries is not None else ()
+    return any(attempt.status in throttle_statuses for attempt in history)
+
+
+def _is_timeout(error):
+    """Whether ``error`` (raised by ``requests``) comes from a timeout. Note that when
+    the retries are exhausted on timeouts, ``requests`` raises a ``ConnectionError``
+    (wrapping urllib3's ``MaxRetryError``), not a ``Timeout``."""
+    from requests.exceptions import Timeout
+    from urllib3.exceptions import NewConnectionError
+    from urllib3.exceptions import TimeoutError as Urllib3TimeoutError
+
+    if isinstance(error, (Timeout, TimeoutError)):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    # (urllib3's NewConnectionError, e.g. a refused connection, is a ConnectTimeoutError)
+    if isinstance(reason, NewConnectionError):
+        return False
+    return isinstance(reason, (Urllib3TimeoutError, TimeoutError))
+
+
+def _rate_limited_adapter_class():
+    from requests.adapters import HTTPAdapter
+    from urllib.parse import urlsplit
+
+    class RateLimitedHTTPAdapter(HTTPAdapter):
+        """An ``HTTPAdapter`` whose requests (and their retries) go through
+        ``limiter``."""
+
+        def __init__(self, limiter: RateLimiter, **kwargs):
+            self.limiter = limiter
+            super().__init__(**kwargs)
+
+        def send(self, request, **kwargs):
+            limiter = self.limiter
+            with limiter.request(urlsplit(request.url).hostname) as outcome:
+                try:
+                    response = super().send(request, **kwargs)
+                except Exception as e:
+                    if _is_timeout(e):
+                        outcome.set_throttled()
+                    raise  # (other errors leave the limits as they are)
+                if _was_throttled(response, limiter.throttle_statuses):
+                    outcome.set_throttled(retry_after_seconds(response.headers))
+                else:
+                    outcome.set(response.status_code)
+            return response
+
+    return RateLimitedHTTPAdapter
+
+
+def mk_session(
+    http_config: Optional[HttpConfig] = None, *, limiter: Optional[RateLimiter] = None
+):
+    """Make a ``requests.Session`` configured according to ``http_config``
+    (default: the current ``config``), and rate limited by ``limiter`` (default:
+    ``rate_limiter``), if ``http_config.rate_limit``.
+
+    >>> from invest.fakes import FakeHttpServer
+    >>> limiter = RateLimiter(HostLimits(rate=10))
+    >>> session = mk_session(HttpConfig(max_retries=0), limiter=limiter)
+    >>> respond = lambda path, n: (429, 'slow down') if path == '/busy' else (200, 'ok')
+    >>> with FakeHttpServer(respond) as server:
+    ...     [session.get(server.url(path)).status_code for path in ('/a', '/busy')]
+    [200, 429]
+    >>> stats = limiter.stats()['127.0.0.1']
+    >>> stats['n_requests'], stats['n_throttled'], stats['rate']  # 10 + 1/10, then halved
+    (2, 1, 5.05)
+
+    Timeouts count as throttling too (while other errors, like refused connections,
+    leave the limits as they are):
+
+    >>> import requests
+    >>> limiter = RateLimiter(HostLimits(rate=10))
+    >>> session = mk_session(HttpConfig(max_retries=0), limiter=limiter)
+    >>> with FakeHttpServer(latency=1) as server:
+    ...     try:
+    ...         session.get(server.url('/slow'), timeout=0.1)
+    ...     except requests.exceptions.RequestException as e:
+    ...         print(_is_timeout(e))
+    True
+    >>> stats = limiter.stats()['127.0.0.1']
+    >>> stats['n_throttled'], stats['rate']
+    (1, 5.0)
+
+    Under load, the rate converges to what the host tolerates. For example (how many
+    requests get throttled depends on timing, so this isn't checked):
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> limiter = RateLimiter(HostLimits(rate=100, burst=10, max_rate=200, concurrency=8))
+    >>> session = mk_session(HttpConfig(max_retries=0), limiter=limiter)
+    >>> with FakeHttpServer(max_rate=50, retry_after=0.2) as server:  # doctest: +SKIP
+    ...     with ThreadPoolExecutor(8) as executor:  # (throttles beyond 50/s)
+    ...         statuses = list(executor.map(
+    ...             lambda i: session.get(server.url(f'/{i}')).status_code, range(150)
+    ...         ))
+    >>> statuses.count(429), limiter.stats()['127.0.0.1']['rate']  # doctest: +SKIP
+    (2, 26.1...)
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    http_config = http_config or config
+    session = requests.Session()
+    adapter_kwargs = dict(
+        pool_connections=http_config.pool_connections,
+        pool_maxsize=http_config.pool_maxsize,
+        max_retries=_mk_retry(http_config),
+    )
+    if http_config.rate_limit:
+        adapter_class = _rate_limited_adapter_class()
+        adapter = adapter_class(limiter or rate_limiter, **adapter_kwargs)
+    else:
+        adapter = HTTPAdapter(**adapter_kwargs)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(http_config.headers)
+    session.hooks['response'].append(_counters.count_response)
+    return session
+
+
+def get_session():
+    """The shared session (made on first use)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = mk_session(config)
+    return _session
+
+
+def yfinance_session():
+    """The session to give ``yfinance`` (``None`` to let it use its own)."""
+    if config.share_with_yfinance:
+        return get_session()
+    return None
+
+
+def configure_http(**config_changes):
+    """Change the configuration of the shared session (see ``HttpConfig``).
+
+    The current session is closed: the next request will make a new one.
+    """
+    global config, _session
+    with _session_lock:
+        config = replace(config, **config_changes)
+        if _session is not None:
+            _session.close()
+            _session = None
+    return config
+
+
+def configure_rate_limits(
+    limits_of_host: Optional[dict] = None, *, default: Optional[HostLimits] = None
+):
+    """Change the ``HostLimits`` of some hosts (a ``{host: HostLimits, ...}`` dict),
+    and/or the default ones, of ``rate_limiter``.
+
+    >>> configure_rate_limits({'example.com': HostLimits(rate=1, max_rate=5)})  # doctest: +SKIP
+    """
+    rate_limiter.configure(limits_of_host, default=default)
+
+
+def requests_get(url, *, headers=None, timeout=None, **kwargs):
+    """``GET`` ``url`` through the shared session, raising on HTTP errors."""
+    if timeout is None:
+        timeout = config.timeout
+    response = get_session().get(url, headers=headers, timeout=timeout, **kwargs)
+    if not response.ok:
+        response.raise_for_status()
+    return response
+
+
+def pool_stats():
+    """Statistics on the requests, the rate limits and the connection pools of the
+    shared session."""
+    stats = dict(
+        n_requests=_counters.n_requests,
+        n_retries=_counters.n_retries,
+        n_errors=_counters.n_errors,
+        rate_limits=rate_limiter.stats(),
+        pools=[],
+    )
+    if _session is None:
+        return stats
+    adapters = {id(a): a for a in _session.adapters.values()}.values()
+    for adapter in adapters:
+        pools = adapter.poolmanager.pools
+        for pool_key in pools.keys():
+            pool = pools[pool_key]
+            idle_connections = [c for c in list(pool.pool.queue) if c is not None]
+            stats['pools'].append(
+                dict(
+                    host=pool.host,
+                    port=pool.port,
+                    scheme=pool.scheme,
+                    maxsize=pool.pool.maxsize,
+                    num_connections=pool.num_connections,
+                    num_requests=pool.num_requests,
+                    idle_connections=len(idle_connections),
+                )
+            )
+    return stats
+
+
+def reset_pool_stats():
+    with _counters._lock:
+        _counters.n_requests = _counters.n_retries = _counters.n_errors = 0
@@ -0,0 +1,364 @@
+"""
+A memory-mapped price panel: the histories of many tickers in one dense array.
+
+Cross-sectional questions ("the close of every ticker on date X") would otherwise
+need reading thousands of ``history`` files. A ``PricePanel`` consolidates the
+cached histories into a single ``numpy`` array of ``ticker x date x field``
+values, memory-mapped from disk, so that only the pages that are actually
+looked at are read.
+
+A panel is a directory with:
+
+- ``values.bin``: The raw values, laid out ``date x ticker x field`` on disk, so
+  that appending new dates is appending to the file (and a cross section is
+  contiguous). ``PricePanel.values`` is the (zero-copy) ``ticker x date x field``
+  view of it.
+- ``dates.npy``: The (sorted) dates
+- ``meta.json``: The tickers, fields, dtype and number of dates
+
+>>> import tempfile
+>>> from invest.fakes import fake_history
+>>> histories = {t: fake_history(t, end='2025-01-31') for t in ['AAPL', 'NVDA']}
+>>> panel = PricePanel.build(tempfile.mkdtemp(), histories)
+>>> panel.shape
+(2, 250, 5)
+>>> panel.values.dtype
+dtype('float32')
+>>> closes = panel.cross_section('2025-01-31')
+>>> list(closes.index)
+['AAPL', 'NVDA']
+>>> panel.get('NVDA', start='2025-01-27', fields='Close').shape  # 5 business days
+(5,)
+
+New dates are appended in place:
+
+>>> new_bars = {t: fake_history(t, start='2025-02-01', end='2025-02-07') for t in histories}
+>>> panel.append(new_bars)
+5
+>>> panel.shape
+(2, 255, 5)
+"""
+
+import os
+import json
+from collections.abc import Mapping
+from typing import Iterable, Optional, Union
+
+from invest.stores import _atomic_write
+
+DFLT_PANEL_FIELDS = ('Open', 'High', 'Low', 'Close', 'Volume')
+DFLT_PANEL_DTYPE = 'float32'
+DFLT_BUILD_BATCH_SIZE = 256
+
+_VALUES_FILENAME = 'values.bin'
+_DATES_FILENAME = 'dates.npy'
+_META_FILENAME = 'meta.json'
+
+
+def _naive_dates(index):
+    """The dates of a history index, as tz-naive (wall clock) ``datetime64[ns]``."""
+    import pandas as pd
+
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.as_unit('ns').values
+
+
+class CachedHistories(Mapping):
+    """A ``{ticker: history, ...}`` view of the histories cached in a local store
+    (e.g. ``LocalTickerData``), to build or update a ``PricePanel`` with.
+
+    Only the tickers that have a cached history are listed, so a read-through store
+    (like ``TickerData``) will not go fetch anything.
+    """
+
+    def __init__(self, store, ticker_symbols: Optional[Iterable] = None):
+        self.store = store
+        self.ticker_symbols = ticker_symbols
+
+    def _key(self, ticker):
+        return ticker + os.path.sep + 'history'
+
+    def __getitem__(self, ticker):
+        return self.store[self._key(ticker)]
+
+    def __iter__(self):
+        if self.ticker_symbols is not None:
+            yield from (t for t in self.ticker_symbols if self._key(t) in self.store)
+        else:  # sorted, so that panels built from the same store are the same
+            yield from sorted(
+                k.split(os.path.sep)[0]
+                for k in self.store
+                if k.split(os.path.sep)[1] == 'history'
+            )
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class PricePanel:
+    """A ``ticker x date x field`` array of prices, memory-mapped from ``rootdir``
+    (see the module docs, and ``PricePanel.build`` to make one).
+
+    :param rootdir: The directory of the panel
+    :param mode: ``'r'`` (read-only) or ``'r+'`` (to be able to ``append``)
+    """
+
+    def __init__(self, rootdir, mode='r+'):
+        import numpy as np
+
+        self.rootdir = rootdir
+        self.mode = mode
+        with open(os.path.join(rootdir, _META_FILENAME)) as fp:
+            meta = json.load(fp)
+        self.tickers = meta['tickers']
+        self.fields = meta['fields']
+        self.dtype = np.dtype(meta['dtype'])
+        self.row_of_ticker = {t: i for i, t in enumerate(self.tickers)}
+        self.idx_of_field = {f: i for i, f in enumerate(self.fields)}
+        self._dates = np.load(os.path.join(rootdir, _DATES_FILENAME))[: meta['n_dates']]
+        self._open_values()
+
+    def _open_values(self):
+        import numpy as np
+
+        shape = (len(self._dates), len(self.tickers), len(self.fields))
+        if shape[0] == 0:
+            self._values = np.empty(shape, dtype=self.dtype)
+        else:
+            self._values = np.memmap(
+                os.path.join(self.rootdir, _VALUES_FILENAME),
+                dtype=self.dtype,
+                mode=self.mode,
+                shape=shape,
+            )
+
+    @property
+    def dates(self):
+        import pandas as pd
+
+        return pd.DatetimeIndex(self._dates, name='Date')
+
+    @property
+    def values(self):
+        """The ``ticker x date x field`` (memory-mapped) array."""
+        return self._values.transpose(1, 0, 2)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def _date_slice(self, start=None, end=None):
+        import numpy as np
+
+        lo, hi = 0, len(self._dates)
+        if start is not None:
+            lo = np.searchsorted(self._dates, np.datetime64(start, 'ns'), 'left')
+        if end is not None:
+            hi = np.searchsorted(self._dates, np.datetime64(end, 'ns'), 'right')
+        return slice(lo, hi)
+
+    def _selector(self, idx_of, keys, kind):
+        """Index ``keys`` (one key, a list of keys, or ``None`` for all). A single
+        key or a contiguous run of keys gives a slice (so the result is a view)."""
+        if keys is None:
+            return slice(None)
+        if isinstance(keys, str):
+            return idx_of[keys]
+        try:
+            idxs = [idx_of[k] for k in keys]
+        except KeyError as e:
+            raise KeyError(f'Not a {kind} of this panel: {e.args[0]}')
+        if idxs and idxs == list(range(idxs[0], idxs[-1] + 1)):
+            return slice(idxs[0], idxs[-1] + 1)
+        return idxs
+
+    def get(
+        self,
+        tickers: Union[str, Iterable, None] = None,
+        start=None,
+        end=None,
+        fields: Union[str, Iterable, None] = None,
+    ):
+        """The ``ticker x date x field`` values of ``tickers`` (default: all), from
+        ``start`` to ``end`` (inclusive), for ``fields`` (default: all).
+
+        A single ticker (or field) drops the corresponding dimension.
+        The result is a view on the memory map (no copy) unless the tickers (or
+        fields) asked for are not contiguous in the panel (then numpy has to copy).
+        """
+        ticker_sel = self._selector(self.row_of_ticker, tickers, 'ticker')
+        field_sel = self._selector(self.idx_of_field, fields, 'field')
+        date_sel = self._date_slice(start, end)
+        if isinstance(ticker_sel, list) and isinstance(field_sel, list):
+            return self.values[ticker_sel][:, date_sel][..., field_sel]
+        return self.values[ticker_sel, date_sel, field_sel]
+
+    def history(self, ticker, start=None, end=None):
+        """The history of ``ticker``, as a (``Date`` indexed) ``DataFrame``."""
+        import pandas as pd
+
+        date_sel = self._date_slice(start, end)
+        return pd.DataFrame(
+            self.values[self.row_of_ticker[ticker], date_sel],
+            index=self.dates[date_sel],
+            columns=self.fields,
+        )
+
+    def cross_section(self, date, field='Close'):
+        """The ``field`` value of every ticker on ``date``, as a ``Series``."""
+        import numpy as np
+        import pandas as pd
+
+        date_idx = np.searchsorted(self._dates, np.datetime64(date, 'ns'))
+        if date_idx == len(self._dates) or self._dates[date_idx] != np.datetime64(
+            date, 'ns'
+        ):
+            raise KeyError(f'Not a date of this panel: {date}')
+        return pd.Series(
+            self._values[date_idx, :, self.idx_of_field[field]],
+            index=self.tickers,
+            name=field,
+        )
+
+    def __repr__(self):
+        return f"{type(self).__name__}('{self.rootdir}', shape={self.shape})"
+
+    # ----------------------------------------------------------------------------
+    # Writing
+
+    def _write_meta_and_dates(self, dates):
+        _write_meta_and_dates(
+            self.rootdir, self.tickers, self.fields, self.dtype, dates
+        )
+
+    def append(self, histories: Mapping):
+        """Append the dates of ``histories`` (a ``{ticker: history, ...}`` mapping)
+        that are after the last date of the panel. Returns the number of dates added.
+
+        Tickers that are not in the panel are ignored (rebuild the panel to add
+        tickers), and the tickers that have no value for a new date get ``NaN``.
+        The new values are written first, and the dates last, so readers never see
+        a half-written append.
+        """
+        import numpy as np
+
+        if self.mode == 'r':
+            raise PermissionError("Panel was opened read-only (mode='r')")
+        last_date = self._dates[-1] if len(self._dates) else None
+        tails = dict()
+        for ticker in histories:
+            if ticker not in self.row_of_ticker:
+                continue
+            history = histories[ticker]
+            dates = _naive_dates(history.index)
+            if last_date is not None:
+                history, dates = history[dates > last_date], dates[dates > last_date]
+            if len(history):
+                tails[ticker] = (history, dates)
+        if not tails:
+            return 0
+        new_dates = np.unique(np.concatenate([dates for _, dates in tails.values()]))
+        n_tickers, n_fields = len(self.tickers), len(self.fields)
+        block = np.full((len(new_dates), n_tickers, n_fields), np.nan, self.dtype)
+        for ticker, (history, dates) in tails.items():
+            _fill(block, self.row_of_ticker[ticker], history, dates, new_dates, self.fields)
+        values_path = os.path.join(self.rootdir, _VALUES_FILENAME)
+        n_bytes = len(self._dates) * n_tickers * n_fields * self.dtype.itemsize
+        with open(values_path, 'r+b') as fp:
+            fp.truncate(n_bytes)  # drop the leftovers of an interrupted append
+            fp.seek(n_bytes)
+            fp.write(block.tobytes())
+        all_dates = np.concatenate([self._dates, new_dates])
+        self._write_meta_and_dates(all_dates)
+        self._dates = all_dates
+        self._open_values()
+        return len(new_dates)
+
+    @classmethod
+    def build(
+        cls,
+        rootdir,
+        histories: Mapping,
+        *,
+        tickers: Optional[Iterable] = None,
+        fields=DFLT_PANEL_FIELDS,
+        dtype=DFLT_PANEL_DTYPE,
+        dates=None,
+        batch_size: int = DFLT_BUILD_BATCH_SIZE,
+    ):
+        """Build a panel in ``rootdir`` from ``histories``, a ``{ticker: history, ...}``
+        mapping (for example, ``CachedHistories(LocalTickerData())``).
+
+        Histories are streamed in: only ``batch_size`` of them are in memory at a time.
+        Unless ``dates`` are given, ``histories`` is read twice: once to collect
+        the dates, once to write the values.
+
+        :param tickers: The tickers to include, in that order (default: all of
+            ``histories``). Tickers that are often used together should be next
+            to each other, so that getting them gives a view (not a copy).
+        :param fields: The history columns to include
+        :param dtype: The dtype of the values (``'float32'`` or ``'float64'``)
+        :param dates: The dates of the panel (default: all the dates of ``histories``)
+        """
+        import numpy as np
+
+        os.makedirs(rootdir, exist_ok=True)
+        tickers = list(histories if tickers is None else tickers)
+        fields = list(fields)
+        dtype = np.dtype(dtype)
+        if dates is None:
+            all_dates = set()
+            for ticker in tickers:
+                all_dates.update(_naive_dates(histories[ticker].index).tolist())
+            dates = np.array(sorted(all_dates), dtype='datetime64[ns]')
+        else:
+            dates = np.unique(_naive_dates(dates))
+        shape = (len(dates), len(tickers), len(fields))
+        values_path = os.path.join(rootdir, _VALUES_FILENAME)
+        with open(values_path, 'wb') as fp:
+            fp.truncate(int(np.prod(shape)) * dtype.itemsize)
+        if len(dates):
+            values = np.memmap(values_path, dtype=dtype, mode='r+', shape=shape)
+            for i in range(0, len(tickers), batch_size):
+                batch_tickers = tickers[i : i + batch_size]
+                block = np.full((len(dates), len(batch_tickers), len(fields)), np.nan, dtype)
+                for j, ticker in enumerate(batch_tickers):
+                    history = histories[ticker]
+                    _fill(block, j, history, _naive_dates(history.index), dates, fields)
+                values[:, i : i + len(batch_tickers)] = block
+            values.flush()
+            del values
+        _write_meta_and_dates(rootdir, tickers, fields, dtype, dates)
+        return cls(rootdir)
+
+
+def _fill(block, row, history, history_dates, dates, fields):
+    """Write the ``fields`` of ``history`` in ``block[:, row]`` (a ``date x ticker x
+    field`` array whose dates are ``dates``)."""
+    import numpy as np
+
+    date_idxs = np.searchsorted(dates, history_dates)
+    in_dates = date_idxs < len(dates)
+    in_dates[in_dates] = dates[date_idxs[in_dates]] == history_dates[in_dates]
+    for field_idx, field in enumerate(fields):
+        if field in history.columns:
+            column = history[field].to_numpy(dtype='float64', na_value=np.nan)
+            block[date_idxs[in_dates], row, field_idx] = column[in_dates]
+
+
+def _write_meta_and_dates(rootdir, tickers, fields, dtype, dates):
+    import numpy as np
+
+    def write_dates(filepath):
+        with open(filepath, 'wb') as fp:
+            np.save(fp, dates)
+
+    def write_meta(filepath):
+        meta = dict(tickers=tickers, fields=fields, dtype=str(dtype), n_dates=len(dates))
+        with open(filepath, 'w') as fp:
+            json.dump(meta, fp)
+
+    _atomic_write(os.path.join(rootdir, _DATES_FILENAME), write_dates)
+    _atomic_write(os.path.join(rootdir, _META_FILENAME), write_meta)
@@ -0,0 +1,306 @@
+"""
+An adaptive, per host, rate limiter for the outbound HTTP requests of invest.
+
+Each host has a token bucket (a request takes a token, tokens come back at
+``rate`` per second, up to ``burst``) and a limit on the number of requests in
+flight. Both adapt, AIMD style: they grow additively as requests succeed, and are
+cut multiplicatively when the host throttles (a ``429``, or a timeout), so that
+the request rate converges to what the host tolerates.
+
+The shared session of ``invest.net`` (so ``requests_get``, and, through
+``yfinance``, ``Ticker``, ``BulkHistory`` and ``dacc.remote_data``) goes through
+``invest.net.rate_limiter``, configured with ``invest.net.configure_rate_limits``.
+
+>>> limiter = RateLimiter(HostLimits(rate=100, burst=2))
+>>> with limiter.request('example.com') as outcome:
+...     outcome.set(429, retry_after=None)  # the host throttled us
+>>> stats = limiter.stats()['example.com']
+>>> stats['rate'], stats['n_requests'], stats['n_throttled']
+(50.0, 1, 1)
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+DFLT_THROTTLE_STATUSES = (429,)
+
+
+@dataclass(frozen=True)
+class HostLimits:
+    """The rate limits of a host.
+
+    :param rate: The initial rate (requests per second)
+    :param burst: The maximum number of tokens (requests that can start at once)
+    :param min_rate: The rate is never cut below this...
+    :param max_rate: ... and never grows beyond this
+    :param concurrency: The initial maximum number of requests in flight...
+    :param max_concurrency: ... which grows up to this
+    :param increase: On success, the rate grows by ``increase / rate`` (so by about
+        ``increase`` per second), and the concurrency by ``1 / concurrency``
+    :param decrease: On throttling, the rate and concurrency are multiplied by this
+    """
+
+    rate: float = 5
+    burst: float = 10
+    min_rate: float = 0.1
+    max_rate: float = 50
+    concurrency: float = 4
+    max_concurrency: float = 16
+    increase: float = 1
+    decrease: float = 0.5
+
+
+class _HostState:
+    """The (adaptive) limits of a host, and its requests. The times (``now``,
+    ``started_at``) are given, so it doesn't depend on any clock.
+
+    >>> state = _HostState(HostLimits(rate=4, burst=2, concurrency=2), now=0)
+    >>> state.seconds_to_wait(0)
+    0
+    >>> state.tokens = 0  # (two requests took the two tokens)
+    >>> state.seconds_to_wait(0)  # the next token comes back in 1/4 second
+    0.25
+    >>> state.refill(0.1)
+    >>> round(state.tokens, 6), round(state.seconds_to_wait(0.1), 6)
+    (0.4, 0.15)
+
+    Successes grow the rate by about ``increase`` per second, and the concurrency by
+    about one per "round" of requests...
+
+    >>> state.succeeded()
+    >>> state.rate, state.concurrency
+    (4.25, 2.5)
+
+    ... and throttling cuts them (by ``decrease``), once per episode: requests that
+    started before the last cut don't cut again.
+
+    >>> state.throttled(started_at=0.5, now=1, retry_after=2)
+    >>> state.rate, state.concurrency, state.seconds_to_wait(1.5)  # (resumes at 3)
+    (2.125, 1.25, 1.5)
+    >>> state.throttled(started_at=0.8, now=1.2)
+    >>> state.rate, state.n_throttled
+    (2.125, 2)
+    >>> state.in_flight = 1
+    >>> state.seconds_to_wait(3) is None  # wait for a request to end (concurrency 1)
+    True
+    """
+
+    def __init__(self, limits: HostLimits, now):
+        self.limits = limits
+        self.rate = limits.rate
+        self.concurrency = limits.concurrency
+        self.tokens = limits.burst
+        self.updated_at = now
+        self.resume_at = now  # no request starts before (set by Retry-After headers)
+        self.last_decrease_at = -float('inf')
+        self.in_flight = 0
+        self.n_waiting = 0
+        self.n_requests = 0
+        self.n_throttled = 0
+
+    def refill(self, now):
+        self.tokens = min(
+            self.limits.burst, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def seconds_to_wait(self, now):
+        """``0`` if a request can start now, ``None`` if it has to wait for a request
+        to end, else the seconds to wait for a token (or the resume time)."""
+        if now < self.resume_at:
+            return self.resume_at - now
+        if self.in_flight >= max(1, int(self.concurrency)):
+            return None
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        return 0
+
+    def succeeded(self):
+        limits = self.limits
+        self.rate = min(limits.max_rate, self.rate + limits.increase / self.rate)
+        self.concurrency = min(
+            limits.max_concurrency, self.concurrency + 1 / self.concurrency
+        )
+
+    def throttled(self, started_at, now, retry_after=None):
+        self.n_throttled += 1
+        if retry_after:
+            self.resume_at = max(self.resume_at, now + retry_after)
+        if started_at < self.last_decrease_at:
+            return  # started before the last cut: don't cut again for the same episode
+        limits = self.limits
+        self.rate = max(limits.min_rate, self.rate * limits.decrease)
+        self.concurrency = max(1, self.concurrency * limits.decrease)
+        self.tokens = min(self.tokens, 0)
+        self.last_decrease_at = now
+
+
+class Outcome:
+    """What happened to a request (set it in a ``RateLimiter.request`` block).
+    A request that raises is counted as throttled if the error is one of the
+    ``throttling_errors`` of the limiter (default: ``TimeoutError``)."""
+
+    def __init__(self):
+        self.status = None
+        self.retry_after = None
+        self.throttled = None  # None: decided by the status
+
+    def set(self, status, retry_after=None):
+        self.status = status
+        self.retry_after = retry_after
+
+    def set_throttled(self, retry_after=None):
+        """Count the request as throttled, whatever its status (e.g. on a timeout)."""
+        self.throttled = True
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Adaptive token buckets (and concurrency limits), per host.
+
+    :param default: The ``HostLimits`` of hosts that have none in ``limits_of_host``
+    :param limits_of_host: A ``{host: HostLimits, ...}`` dict
+    :param throttle_statuses: The HTTP statuses that mean "slow down"
+    """
+
+    def __init__(
+        self,
+        default: Optional[HostLimits] = None,
+        limits_of_host: Optional[dict] = None,
+        *,
+        throttle_statuses=DFLT_THROTTLE_STATUSES,
+        throttling_errors=(TimeoutError,),
+        clock=time.monotonic,
+    ):
+        self.default = default or HostLimits()
+        self.limits_of_host = dict(limits_of_host or {})
+        self.throttle_statuses = frozenset(throttle_statuses)
+        self.throttling_errors = tuple(throttling_errors)
+        self.clock = clock
+        self._states = dict()
+        self._condition = threading.Condition()
+
+    def _state(self, host) -> _HostState:
+        state = self._states.get(host)
+        if state is None:
+            limits = self.limits_of_host.get(host, self.default)
+            state = self._states[host] = _HostState(limits, self.clock())
+        return state
+
+    def acquire(self, host):
+        """Wait until a request to ``host`` can start. Returns its start time."""
+        with self._condition:
+            state = self._state(host)
+            state.n_waiting += 1
+            try:
+                while True:
+                    now = self.clock()
+                    state.refill(now)
+                    wait = state.seconds_to_wait(now)
+                    if wait == 0:
+                        state.tokens -= 1
+                        state.in_flight += 1
+                        state.n_requests += 1
+                        return now
+                    self._condition.wait(wait)
+            finally:
+                state.n_waiting -= 1
+
+    def release(self, host, started_at, *, throttled: Optional[bool], retry_after=None):
+        """Tell the limiter that the request (started at ``started_at``) ended,
+        and if it was ``throttled`` (in which case, ``retry_after`` seconds can be given).
+        ``throttled=None`` means neither (e.g. a connection error): the limits don't change."""
+        with self._condition:
+            state = self._state(host)
+            state.in_flight -= 1
+            if throttled:
+                state.throttled(started_at, self.clock(), retry_after)
+            elif throttled is not None:
+                state.succeeded()
+            self._condition.notify_all()
+
+    @contextmanager
+    def request(self, host):
+        """Hold a "request slot" for ``host`` during the ``with`` block, which should
+        set the yielded ``Outcome``'s status (without it, the request counts as a
+        success, unless it raises).
+
+        A block that raises counts as throttled if the error is one of the
+        ``throttling_errors``, or if it called ``outcome.set_throttled()`` first.
+        Other errors leave the limits as they are.
+
+        >>> limiter = RateLimiter(HostLimits(rate=10))
+        >>> try:
+        ...     with limiter.request('example.com') as outcome:
+        ...         outcome.set_throttled()  # e.g. the request timed out...
+        ...         raise OSError('timed out')  # ... with an error of the http library
+        ... except OSError:
+        ...     pass
+        >>> try:
+        ...     with limiter.request('example.com') as outcome:
+        ...         raise ConnectionError('refused')
+        ... except ConnectionError:
+        ...     pass
+        >>> stats = limiter.stats()['example.com']
+        >>> stats['rate'], stats['n_requests'], stats['n_throttled']
+        (5.0, 2, 1)
+        """
+        started_at = self.acquire(host)
+        outcome = Outcome()
+        throttled = None
+        try:
+            yield outcome
+            throttled = outcome.throttled
+            if throttled is None:
+                throttled = outcome.status in self.throttle_statuses
+        except self.throttling_errors:
+            throttled = True
+            raise
+        except BaseException:
+            throttled = outcome.throttled  # None (neutral), unless set_throttled was called
+            raise
+        finally:
+            self.release(
+                host, started_at, throttled=throttled, retry_after=outcome.retry_after
+            )
+
+    def configure(
+        self, limits_of_host: Optional[dict] = None, *, default: Optional[HostLimits] = None
+    ):
+        """Change the limits of some hosts (a ``{host: HostLimits, ...}`` dict) and/or
+        the default limits. The current state (the adapted rates) of those hosts is reset."""
+        with self._condition:
+            if default is not None:
+                self.default = default
+                self._states.clear()
+            for host, limits in (limits_of_host or {}).items():
+                self.limits_of_host[host] = limits
+                self._states.pop(host, None)
+
+    def stats(self):
+        """The current ``rate``, ``concurrency`` limit, ``in_flight`` and waiting
+        (``queue_depth``) requests, and counts, of each host."""
+        with self._condition:
+            return {
+                host: dict(
+                    rate=state.rate,
+                    concurrency=state.concurrency,
+                    in_flight=state.in_flight,
+                    queue_depth=state.n_waiting,
+                    n_requests=state.n_requests,
+                    n_throttled=state.n_throttled,
+                )
+                for host, state in self._states.items()
+            }
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """The (numeric) ``Retry-After`` header of a response, if any."""
+    value = headers.get('Retry-After')
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None  # an HTTP date: let the retry logic deal with it
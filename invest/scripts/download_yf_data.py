@@ -1,9 +1,16 @@
-import pickle
 import os
+import math
+import pickle
+import warnings
 
 from invest import dacc
 from invest import get_local_ticker_set
-from invest.util import print_progress
+from invest.download import (
+    bulk_download,
+    ticker_field_keys,
+    DownloadCheckpoint,
+    DFLT_MAX_WORKERS,
+)
 
 DFLT_FIELDS = (
     #     'info',
@@ -21,52 +28,121 @@ DFLT_FIELDS = (
     'cashflow',
     'history',
 )
+DFLT_CHECKPOINT_FILEPATH = 'download_checkpoint.jsonl'
+# where older versions of this script kept the keys that failed
+DFLT_ERROR_TICKERS_FILEPATH = os.path.join(os.path.dirname(__file__), 'bad_ticker_info')
 
 
-def download_yf_data(local_ticker_data=dacc.LocalTickerData(),
-                     ticker_symbols=tuple(sorted(get_local_ticker_set())),
-                     fields=DFLT_FIELDS,
-                     except_keys=None,
-                     error_tickers_save_filepath='bad_ticker_info',
-                     on_error_add_to_except_keys=True,
-                     ):
-    # handle except_keys
-    if except_keys is None and os.path.isfile(error_tickers_save_filepath):
-        with open(error_tickers_save_filepath, 'rb') as fp:
-            except_keys = pickle.load(fp)
-    elif isinstance(except_keys, str):
+def _load_except_keys(except_keys):
+    if isinstance(except_keys, str):
         try:
             with open(except_keys, 'rb') as fp:
                 except_keys = pickle.load(fp)
         except FileNotFoundError as e:
             print(f"FileNotFoundError: {e}")
             except_keys = {}
-    else:
+    elif except_keys is None:
         except_keys = {}
+    # (the pickles of older versions of this script also hold a stray ``True``)
+    return {k for k in except_keys if isinstance(k, str)}
+
+
+def seed_negative_cache(negative_cache, error_tickers_filepath=DFLT_ERROR_TICKERS_FILEPATH):
+    """Record the keys of ``error_tickers_filepath`` (the pickle of failing keys of older
+    versions of this script) in ``negative_cache``, if it's new (empty, and without a file
+    yet: so, only once), as having failed enough times to not be retried before the
+    ``max_delay`` of the cache. Returns the number of keys recorded.
+
+    >>> import tempfile
+    >>> filepath = os.path.join(tempfile.mkdtemp(), 'bad_ticker_info')
+    >>> with open(filepath, 'wb') as fp:
+    ...     pickle.dump({True, 'BAD/info', 'GONE/history'}, fp)
+    >>> negative_cache = dacc.NegativeCache()
+    >>> seed_negative_cache(negative_cache, filepath), seed_negative_cache(negative_cache, filepath)
+    (2, 0)
+    >>> negative_cache.blocks('BAD/info')
+    True
+    """
+    cache_filepath = negative_cache.filepath
+    is_new = len(negative_cache) == 0 and not (cache_filepath and os.path.isfile(cache_filepath))
+    if not is_new or not os.path.isfile(error_tickers_filepath):
+        return 0
+    keys = _load_except_keys(error_tickers_filepath)
+    n_failures = 1 + math.ceil(
+        math.log(
+            negative_cache.max_delay / negative_cache.base_delay,
+            negative_cache.backoff_factor,
+        )
+    )
+    error = KeyError(f'listed in {error_tickers_filepath}')
+    negative_cache.record_failures(keys, error, n_failures=max(n_failures, 1))
+    return len(keys)
+
+
+def download_yf_data(
+    local_ticker_data=None,
+    ticker_symbols=None,
+    fields=DFLT_FIELDS,
+    except_keys=None,
+    error_tickers_save_filepath=None,
+    on_error_add_to_except_keys=None,
+    *,
+    negative_cache=None,
+    source=None,
+    max_workers=DFLT_MAX_WORKERS,
+    checkpoint_filepath=DFLT_CHECKPOINT_FILEPATH,
+):
+    """Download ``fields`` of ``ticker_symbols`` into ``local_ticker_data``.
+
+    The download is concurrent (``max_workers`` fetches at a time) and resumable:
+    handled keys are recorded in ``checkpoint_filepath``, so running this again
+    (with the same checkpoint) continues where an interrupted run stopped.
+    Delete the checkpoint file to start afresh.
 
-    except_keys = set(except_keys)
+    Failing keys are recorded in ``negative_cache`` (a ``dacc.NegativeCache``, by default
+    the one in ``dacc.DFLT_NEGATIVE_CACHE_FILEPATH``, which ``TickerData`` can use too),
+    and not fetched again until their (exponentially backed off) retry time.
+    ``except_keys`` (keys, or the filepath of a pickle of them) are always skipped.
 
-    # and now do the thing
-    def handle_key_exception(key, error, except_keys):
-        print(f"Error with {key}: {error}")
-        except_keys.add(on_error_add_to_except_keys)
+    ``error_tickers_save_filepath`` and ``on_error_add_to_except_keys`` are deprecated:
+    failing keys go to ``negative_cache`` instead. The keys of the
+    ``error_tickers_save_filepath`` (default: ``DFLT_ERROR_TICKERS_FILEPATH``) pickle that
+    older versions kept are used, once, to seed an empty ``negative_cache``
+    (see ``seed_negative_cache``).
+    """
+    if error_tickers_save_filepath is not None or on_error_add_to_except_keys is not None:
+        warnings.warn(
+            "error_tickers_save_filepath and on_error_add_to_except_keys are deprecated: "
+            "failing keys are recorded in negative_cache (which error_tickers_save_filepath "
+            "is only used to seed, if it's empty).",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+    if local_ticker_data is None:
+        local_ticker_data = dacc.LocalTickerData()
+    if ticker_symbols is None:
+        ticker_symbols = tuple(sorted(get_local_ticker_set()))
+    if negative_cache is None:
+        negative_cache = dacc.NegativeCache(dacc.DFLT_NEGATIVE_CACHE_FILEPATH)
+    n_seeded = seed_negative_cache(
+        negative_cache, error_tickers_save_filepath or DFLT_ERROR_TICKERS_FILEPATH
+    )
+    if n_seeded:
+        print(f"Seeded the negative cache with the {n_seeded} keys of the error tickers file")
+    except_keys = _load_except_keys(except_keys)
 
-    key = None  # to define and appease linter
-    try:
-        for field in fields:
-            for i, ticker_symbol in enumerate(ticker_symbols, 1):
-                try:
-                    key = f"{ticker_symbol}/{field}"
-                    if key not in except_keys and key not in local_ticker_data:
-                        print_progress(f"{i}: {key}")
-                        local_ticker_data[key] = dacc.remote_data[key]
-                except Exception as e:
-                    handle_key_exception(key, e, except_keys)
-    finally:
-        print(f"Current key is {key}")
-        print(f"Saving {len(except_keys)} except_keys tickers to on_error_add_to_except_keys file")
-        with open(error_tickers_save_filepath, 'wb') as fp:
-            pickle.dump(except_keys, fp)
+    stats = bulk_download(
+        ticker_field_keys(ticker_symbols, fields),
+        store=local_ticker_data,
+        source=source,
+        max_workers=max_workers,
+        checkpoint=DownloadCheckpoint(checkpoint_filepath),
+        except_keys=except_keys,
+        negative_cache=negative_cache,
+    )
+    print(f"{len(negative_cache)} failing keys in the negative cache")
+    return stats
 
 
-download_yf_data()
\ No newline at end of file
+if __name__ == '__main__':
+    download_yf_data()
@@ -0,0 +1,805 @@
+"""
+Storage backends for local ticker data.
+
+Ticker data is stored in files ``{rootdir}/{ticker}/{field}{ext}``, where the
+file format (and extension) is given by a "codec":
+
+- ``'pickle'`` (``.p``): Works for any value. The historical format.
+- ``'parquet'`` (``.parquet``): Compressed, columnar. Good disk footprint.
+- ``'arrow'`` (``.arrow``): Arrow IPC (a.k.a. Feather v2) files. Uncompressed, so
+  they can be memory-mapped and read with no copy (fastest reads).
+
+All of them can also be written ``zstd`` or ``lz4`` compressed (see
+``invest.compaction.CompactionPolicy``, which also downcasts the dtypes of frames).
+
+The columnar codecs (which need ``pyarrow``) are only used for tabular fields
+(see ``TABULAR_FIELDS``); everything else (e.g. ``info``) is still pickled.
+
+>>> import tempfile
+>>> import pandas as pd
+>>> s = TickerFiles(tempfile.mkdtemp(), storage='parquet')
+>>> s['NVDA/history'] = pd.DataFrame({'Open': [1.0, 2.0], 'Close': [1.5, 2.5]})
+>>> s['NVDA/info'] = {'shortName': 'NVIDIA Corporation'}
+>>> sorted(os.listdir(os.path.join(s.rootdir, 'NVDA')))
+['history.parquet', 'info.p']
+>>> s.read('NVDA/history', columns=['Close'])
+   Close
+0    1.5
+1    2.5
+"""
+
+import os
+import json
+import base64
+import pickle
+import hashlib
+import time
+import tempfile
+import threading
+
+from dol import KvPersister
+from dol.filesys import ensure_slash_suffix
+
+path_sep = os.path.sep
+
+TABULAR_FIELDS = frozenset(
+    {
+        'history',
+        'actions',
+        'dividends',
+        'splits',
+        'capital_gains',
+        'balance_sheet',
+        'quarterly_balance_sheet',
+        'cashflow',
+        'quarterly_cashflow',
+        'cash_flow',
+        'quarterly_cash_flow',
+        'financials',
+        'quarterly_financials',
+        'income_stmt',
+        'quarterly_income_stmt',
+        'earnings',
+        'quarterly_earnings',
+        'earnings_dates',
+        'recommendations',
+        'upgrades_downgrades',
+        'institutional_holders',
+        'mutualfund_holders',
+        'shares',
+    }
+)
+
+_INVEST_META_KEY = b'invest'
+COMPACTION_META_KEY = 'compaction'  # the key of the compaction info in the meta
+_COMPRESSION_OF_MAGIC = {b'\x28\xb5\x2f\xfd': 'zstd', b'\x04\x22\x4d\x18': 'lz4'}
+
+
+def split_key(k):
+    ticker, field = k.split(path_sep)
+    return ticker, field
+
+
+def is_hidden_key(k):
+    """Whether ``k`` is "hidden": its ticker part starts with a dot (which no ticker
+    symbol does). A ``TickerFiles`` store reads and writes hidden keys like any other,
+    but keeps them out of its listing and manifest, so they can hold other things than
+    ticker data (e.g. the chunks of ``invest.base.BulkHistory``).
+
+    >>> is_hidden_key('.bulk_history' + path_sep + '00000_c0ffee'), is_hidden_key('NVDA/info')
+    (True, False)
+    """
+    return k.startswith('.')
+
+
+def _atomic_write(filepath, write):
+    """Call ``write(tmp_filepath)`` and move the result to ``filepath``, so that
+    readers never see a partially written file."""
+    dirpath = os.path.dirname(filepath)
+    os.makedirs(dirpath, exist_ok=True)
+    fd, tmp_filepath = tempfile.mkstemp(dir=dirpath, prefix='.tmp_')
+    os.close(fd)
+    try:
+        write(tmp_filepath)
+        os.replace(tmp_filepath, filepath)
+    except BaseException:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+
+
+class PickleCodec:
+    """Pickle files. The metadata, if any, is a second pickle, after the value's,
+    so that a plain ``pickle.load`` of the file still gives the value.
+
+    Compressed files (``zstd`` or ``lz4`` frames, written with ``pyarrow``) are
+    recognized by their first bytes."""
+
+    name = 'pickle'
+    extension = '.p'
+
+    @staticmethod
+    def can_write(v):
+        return True
+
+    @staticmethod
+    def write(filepath, v, meta=None, compression=None):
+        if compression is None:
+            with open(filepath, 'wb') as fp:
+                pickle.dump(v, fp)
+                if meta:
+                    pickle.dump(meta, fp)
+            return
+        import pyarrow as pa
+
+        with pa.CompressedOutputStream(filepath, compression) as fp:
+            fp.write(pickle.dumps(v))
+            if meta:
+                fp.write(pickle.dumps(meta))
+
+    @staticmethod
+    def _open(filepath):
+        fp = open(filepath, 'rb')
+        compression = _COMPRESSION_OF_MAGIC.get(fp.peek(4)[:4])
+        if compression is None:
+            return fp
+        import io
+        import pyarrow as pa
+
+        with fp:
+            stream = pa.CompressedInputStream(pa.PythonFile(fp, mode='r'), compression)
+            return io.BytesIO(stream.read())
+
+    @classmethod
+    def read(cls, filepath, columns=None, memory_map=False):
+        with cls._open(filepath) as fp:
+            v = pickle.load(fp)
+            try:
+                meta = pickle.load(fp)
+            except EOFError:
+                meta = {}
+        if columns is not None:
+            v = v[columns]
+        return v, meta
+
+
+class _ArrowTableCodec:
+    """Base for the codecs writing pandas objects as arrow tables.
+
+    Arrow needs string column names, so other column labels (e.g. the quarter
+    dates of balance sheets) are stringified, and the original labels are kept
+    (pickled) in the table's metadata to be restored on read.
+    Series are written as one-column tables.
+    """
+
+    name = extension = None
+
+    @staticmethod
+    def can_write(v):
+        import pandas as pd
+
+        if isinstance(v, pd.Series):
+            return True
+        return isinstance(v, pd.DataFrame) and v.columns.nlevels == 1
+
+    @staticmethod
+    def _to_table(v, meta=None):
+        import pandas as pd
+        import pyarrow as pa
+
+        invest_meta = {'meta': meta or {}}
+        if isinstance(v, pd.Series):
+            invest_meta['series_name'] = v.name
+            v = v.to_frame(name='__series__')
+        sparse_dtypes = {
+            c: dtype.subtype
+            for c, dtype in v.dtypes.items()
+            if isinstance(dtype, pd.SparseDtype)
+        }
+        if sparse_dtypes:  # arrow has no sparse arrays (its encodings handle the zeros)
+            v = v.astype(sparse_dtypes)
+        if not all(isinstance(c, str) for c in v.columns):
+            invest_meta['columns'] = v.columns
+            v = v.set_axis([str(c) for c in v.columns], axis=1)
+        table = pa.Table.from_pandas(v)
+        schema_meta = dict(table.schema.metadata or {})
+        schema_meta[_INVEST_META_KEY] = base64.b64encode(pickle.dumps(invest_meta))
+        return table.replace_schema_metadata(schema_meta)
+
+    @staticmethod
+    def _from_table(table, columns=None):
+        invest_meta = (table.schema.metadata or {}).get(_INVEST_META_KEY)
+        invest_meta = pickle.loads(base64.b64decode(invest_meta)) if invest_meta else {}
+        v = table.to_pandas()
+        if 'columns' in invest_meta:
+            label_of_str = {str(c): c for c in invest_meta['columns']}
+            v = v.set_axis([label_of_str[c] for c in v.columns], axis=1)
+        if 'series_name' in invest_meta:
+            v = v['__series__'].rename(invest_meta['series_name'])
+        return v, invest_meta.get('meta', {})
+
+    @staticmethod
+    def _str_columns(columns):
+        if columns is None:
+            return None
+        return [str(c) for c in columns]
+
+
+class ParquetCodec(_ArrowTableCodec):
+    name = 'parquet'
+    extension = '.parquet'
+    compression = 'snappy'
+
+    @classmethod
+    def write(cls, filepath, v, meta=None, compression=None):
+        import pyarrow.parquet as pq
+
+        pq.write_table(
+            cls._to_table(v, meta), filepath, compression=compression or cls.compression
+        )
+
+    @classmethod
+    def read(cls, filepath, columns=None, memory_map=True):
+        import pyarrow.parquet as pq
+
+        # read_pandas adds the (pandas) index columns to the projection
+        table = pq.read_pandas(
+            filepath, columns=cls._str_columns(columns), memory_map=memory_map
+        )
+        return cls._from_table(table, columns)
+
+
+class ArrowCodec(_ArrowTableCodec):
+    name = 'arrow'
+    extension = '.arrow'
+    compression = 'uncompressed'  # compressed buffers can't be used in place
+
+    @classmethod
+    def write(cls, filepath, v, meta=None, compression=None):
+        import pyarrow.feather as feather
+
+        # (compressed files can still be memory-mapped, but are decompressed on read)
+        feather.write_feather(
+            cls._to_table(v, meta), filepath, compression=compression or cls.compression
+        )
+
+    @classmethod
+    def read(cls, filepath, columns=None, memory_map=True):
+        """Read the ``(value, meta)`` stored in ``filepath``.
+
+        With ``memory_map``, nothing is copied: the arrays of the table (and so of
+        the returned frame, where pandas doesn't copy them) reference the file's
+        mapped pages, which stay mapped (and, on Windows, the file can't be
+        replaced or deleted) until they're garbage collected. The file itself is
+        closed on return. Use ``memory_map=False`` to read into memory instead.
+        """
+        import pyarrow as pa
+
+        open_source = pa.memory_map if memory_map else pa.OSFile
+        with open_source(filepath) as source:
+            table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(
+                cls._str_columns(columns) + _index_columns(table.schema)
+            )
+        return cls._from_table(table, columns)
+
+
+def _index_columns(schema):
+    """The names of the columns that hold the pandas index of an arrow table."""
+    pandas_meta = json.loads((schema.metadata or {}).get(b'pandas', b'{}'))
+    return [c for c in pandas_meta.get('index_columns', []) if isinstance(c, str)]
+
+
+def _record_io(m, op, k, filepath, started):
+    """Record the latency and bytes of a local ``op`` (``'read'`` or ``'write'``)."""
+    field = split_key(k)[1]
+    m.observe(f'invest_local_{op}_seconds', time.perf_counter() - started, field=field)
+    m.inc(f'invest_local_{op}_bytes_total', os.path.getsize(filepath), field=field)
+
+
+codec_of_storage = {
+    codec.name: codec for codec in (PickleCodec, ParquetCodec, ArrowCodec)
+}
+
+
+MANIFEST_FILENAME = '.manifest.jsonl'
+
+
+def file_hash(filepath, chunk_size=1 << 20):
+    """The (hex) ``blake2b`` hash of the contents of ``filepath``."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class KeyManifest:
+    """An on-disk index of the keys of a ``TickerFiles`` store, with the ``size``,
+    ``mtime``, content ``hash`` (``None`` unless the store has ``manifest_hashes``)
+    and ``storage`` format of their files.
+
+    Changes are appended (as json lines, under a file lock) to ``filepath``, so
+    an update is atomic, and other processes see it: ``sync`` reads the lines that
+    were appended since the last ``sync`` (costing one ``stat`` when there are none).
+    When most lines are obsolete, the file is compacted (atomically replaced).
+
+    >>> filepath = os.path.join(tempfile.mkdtemp(), MANIFEST_FILENAME)
+    >>> manifest = KeyManifest(filepath)
+    >>> manifest.record('NVDA/info', {'size': 3, 'mtime': 0, 'hash': 'x', 'storage': 'pickle'})
+    >>> manifest.record('AAPL/info', {'size': 5, 'mtime': 0, 'hash': 'y', 'storage': 'pickle'})
+    >>> manifest.forget('NVDA/info')
+    >>> sorted(KeyManifest(filepath).entries)  # another instance (or process) sees it
+    ['AAPL/info']
+    """
+
+    def __init__(self, filepath, *, compact_after=1000):
+        self.filepath = filepath
+        self.lock_filepath = filepath + '.lock'
+        self.compact_after = compact_after
+        self.entries = dict()
+        self._lock = threading.Lock()
+        self._reset()
+        self.sync()
+
+    def _reset(self, inode=None):
+        self.entries.clear()
+        self._offset = 0
+        self._inode = inode
+        self._n_lines = 0
+
+    def exists(self):
+        return os.path.isfile(self.filepath)
+
+    def sync(self):
+        """Read the changes that were appended (by any process) since the last sync."""
+        try:
+            stat = os.stat(self.filepath)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                self._reset(stat.st_ino)  # the file was replaced (compacted, or rebuilt)
+            if stat.st_size == self._offset:
+                return
+            with open(self.filepath, 'rb') as fp:
+                fp.seek(self._offset)
+                data = fp.read()
+            complete = data[: data.rfind(b'\n') + 1]  # the last line may be half written
+            for line in complete.splitlines():
+                self._n_lines += 1
+                record = json.loads(line)
+                key = record.pop('key')
+                if record.get('deleted'):
+                    self.entries.pop(key, None)
+                else:
+                    self.entries[key] = record
+            self._offset += len(complete)
+
+    def _append(self, record):
+        from invest.caching import file_lock
+
+        with file_lock(self.lock_filepath):
+            with open(self.filepath, 'a') as fp:
+                fp.write(json.dumps(record) + '\n')
+        self.sync()
+        if self._n_lines > 2 * len(self.entries) + self.compact_after:
+            self.compact()
+
+    def record(self, k, entry: dict):
+        self._append(dict(entry, key=k))
+
+    def forget(self, k):
+        self._append({'key': k, 'deleted': True})
+
+    def _write_file(self, entries: dict):
+        def write(filepath):
+            with open(filepath, 'w') as fp:
+                for key, entry in entries.items():
+                    fp.write(json.dumps(dict(entry, key=key)) + '\n')
+
+        _atomic_write(self.filepath, write)
+
+    def rewrite(self, entries: dict):
+        """Replace the contents of the manifest by ``entries`` (atomically)."""
+        from invest.caching import file_lock
+
+        with file_lock(self.lock_filepath):
+            self._write_file(entries)
+        self.sync()
+
+    def compact(self):
+        """Rewrite the file with only the current entries (one line per key)."""
+        from invest.caching import file_lock
+
+        with file_lock(self.lock_filepath):
+            self.sync()  # no one can append while we hold the lock
+            self._write_file(dict(self.entries))
+        self.sync()
+
+
+class TickerFiles(KvPersister):
+    """A store of ``'{ticker}/{field}'`` keys, persisted in ``{rootdir}/{ticker}/{field}{ext}``
+    files.
+
+    :param rootdir: The root directory of the files
+    :param storage: The format to write tabular fields with:
+        ``'pickle'``, ``'parquet'`` or ``'arrow'`` (see ``codec_of_storage``)
+    :param tabular_fields: The fields to write with the ``storage`` format
+        (as long as the value is a ``DataFrame`` or ``Series``). Other values are pickled.
+
+    :param manifest: Whether to keep a ``KeyManifest`` of the keys in
+        ``{rootdir}/.manifest.jsonl``, which then serves ``__iter__``, ``__len__`` and
+        ``__contains__`` (instead of directory scans and ``stat`` calls).
+        If ``None`` (default), the manifest is used (and kept up to date) if the
+        tree already has one. If the files are changed by something else than the
+        store, call ``rebuild_manifest``. A missing manifest is made (from a scan of
+        the files) on the first use of the store, not when it's made.
+    :param manifest_hashes: Whether the manifest entries also hold the (``blake2b``)
+        hash of the files, which costs reading each file back after writing it
+        (``False`` by default: the entries then only hold what ``stat`` gives)
+    :param compaction: An ``invest.compaction.CompactionPolicy`` to compact (downcast,
+        sparsify, compress) values with on write. Compacted values are expanded back on
+        read (whatever the ``compaction`` of the reading store).
+
+    Reads don't depend on ``storage``: a key is read from whatever format it was
+    written in, so a store can hold a mix of pickle and columnar files (for example,
+    while it is being migrated, see ``migrate_storage``).
+
+    Note that a write (or delete) changes the file first, and the manifest next, so a
+    process dying in between leaves the manifest behind the files. Reads don't depend
+    on the manifest, and fix it: a key that is read, but missing from the manifest, is
+    added to it, and a key of the manifest that has no file is removed from it.
+
+    >>> rootdir = tempfile.mkdtemp()
+    >>> s = TickerFiles(rootdir)
+    >>> s['NVDA/info'] = {'sector': 'Technology'}
+    >>> s = TickerFiles(rootdir, manifest=True)  # no manifest is made yet...
+    >>> os.path.isfile(os.path.join(rootdir, MANIFEST_FILENAME))
+    False
+    >>> list(s)  # ... until it's needed
+    ['NVDA/info']
+    >>> os.remove(os.path.join(rootdir, 'NVDA', 'info.p'))  # as if a delete was cut short
+    >>> 'NVDA/info' in s
+    True
+    >>> s.get('NVDA/info') is None, 'NVDA/info' in s
+    (True, False)
+    """
+
+    def __init__(
+        self,
+        rootdir,
+        storage='pickle',
+        tabular_fields=TABULAR_FIELDS,
+        *,
+        manifest=None,
+        manifest_hashes=False,
+        compaction=None,
+    ):
+        if storage not in codec_of_storage:
+            raise ValueError(
+                f"storage should be one of {list(codec_of_storage)}. Was {storage}"
+            )
+        if storage != 'pickle':
+            import pyarrow  # columnar storage formats need pyarrow
+
+        self.rootdir = ensure_slash_suffix(rootdir)
+        self.storage = storage
+        self.codec = codec_of_storage[storage]
+        self.tabular_fields = frozenset(tabular_fields)
+        if compaction is not None and compaction.compression is not None:
+            import pyarrow  # compression is done with pyarrow
+        self.compaction = compaction
+        self.manifest = None
+        self.manifest_hashes = manifest_hashes
+        self._manifest_is_built = False
+        manifest_filepath = os.path.join(self.rootdir, MANIFEST_FILENAME)
+        if manifest or (manifest is None and os.path.isfile(manifest_filepath)):
+            self.manifest = KeyManifest(manifest_filepath)
+
+    def _synced_manifest(self):
+        """The (synced) manifest, built first if there's none yet (``None`` if the store
+        doesn't keep one)."""
+        if self.manifest is None:
+            return None
+        if not self._manifest_is_built:
+            if not self.manifest.exists():
+                self.rebuild_manifest()
+            self._manifest_is_built = True
+        self.manifest.sync()
+        return self.manifest
+
+    def _manifest_entry(self, k, codec, with_hash=None):
+        if with_hash is None:
+            with_hash = self.manifest_hashes
+        filepath = self._filepath(k, codec)
+        stat = os.stat(filepath)
+        return {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'hash': file_hash(filepath) if with_hash else None,
+            'storage': codec.name,
+        }
+
+    def rebuild_manifest(self, *, with_hashes=None):
+        """(Re)make the manifest from the files (e.g. after they were changed by something
+        else than the store). Returns the number of keys.
+
+        Only the files' ``stat`` is needed, unless ``with_hashes`` (default: the store's
+        ``manifest_hashes``), in which case all the files are also read, to hash them.
+        """
+        if self.manifest is None:
+            self.manifest = KeyManifest(os.path.join(self.rootdir, MANIFEST_FILENAME))
+        entries = dict()
+        for k in self._scan_keys():
+            codec, _ = self._existing_filepath(k)
+            entries[k] = self._manifest_entry(k, codec, with_hash=with_hashes)
+        self.manifest.rewrite(entries)
+        self._manifest_is_built = True
+        return len(entries)
+
+    def _filepath(self, k, codec):
+        return self.rootdir + k + codec.extension
+
+    def _codecs_to_read(self, k):
+        """The codecs to try, in order, to read ``k``: most likely first."""
+        field = split_key(k)[1]
+        if field in self.tabular_fields and self.codec is not PickleCodec:
+            yield self.codec
+        yield PickleCodec
+        for codec in codec_of_storage.values():
+            if codec is not PickleCodec and codec is not self.codec:
+                yield codec
+        if field not in self.tabular_fields and self.codec is not PickleCodec:
+            yield self.codec
+
+    def _codec_of_field(self, k):
+        if split_key(k)[1] in self.tabular_fields:
+            return self.codec
+        return PickleCodec
+
+    def _codec_to_write(self, k, v):
+        codec = self._codec_of_field(k)
+        if codec.can_write(v):
+            return codec
+        return PickleCodec
+
+    def read(self, k, columns=None, memory_map=True):
+        """Read the value of ``k``, only loading the given ``columns`` (if
+        given, and the storage format allows it).
+
+        Memory-mapping (for columnar formats) avoids copying the file contents
+        into memory before decoding them.
+        """
+        return self.read_with_meta(k, columns, memory_map)[0]
+
+    def read_with_meta(self, k, columns=None, memory_map=True, *, restore_dtypes=None):
+        """Read the ``(value, meta)`` pair of ``k``, where ``meta`` is the dict of
+        metadata that was written with the value (see ``write``), if any.
+
+        A compacted value gets its original dtypes back if ``restore_dtypes`` (default:
+        as the store's ``compaction`` says, or ``True`` if it has none)."""
+        from invest import metrics
+
+        m = metrics.registry
+        started = time.perf_counter() if m is not None else None
+        for codec in self._codecs_to_read(k):
+            filepath = self._filepath(k, codec)
+            try:
+                value_and_meta = codec.read(
+                    filepath, columns=columns, memory_map=memory_map
+                )
+            except FileNotFoundError:
+                continue
+            if m is not None:
+                _record_io(m, 'read', k, filepath, started)
+            self._fix_manifest(k, codec)
+            if COMPACTION_META_KEY in value_and_meta[1]:
+                return self._expand(*value_and_meta, restore_dtypes)
+            return value_and_meta
+        self._fix_manifest(k, None)
+        raise KeyError(k)
+
+    def _fix_manifest(self, k, codec):
+        """Make the manifest agree with a read of ``k`` (found with ``codec``, or not
+        found if ``codec`` is ``None``), in case a write or delete was cut short."""
+        if self.manifest is None or not self._manifest_is_built or is_hidden_key(k):
+            return
+        if (k in self.manifest.entries) == (codec is not None):
+            return
+        self.manifest.sync()  # maybe another process already fixed it
+        if codec is not None and k not in self.manifest.entries:
+            self.manifest.record(k, self._manifest_entry(k, codec))
+        elif codec is None and k in self.manifest.entries:
+            self.manifest.forget(k)
+
+    def _expand(self, v, meta, restore_dtypes=None):
+        from invest.compaction import CompactionPolicy
+
+        meta = dict(meta)
+        info = meta.pop(COMPACTION_META_KEY)
+        policy = self.compaction or CompactionPolicy()
+        return policy.expand(v, info, restore_dtypes=restore_dtypes), meta
+
+    def _compact(self, k, v, meta):
+        """The ``(v, meta)`` to write, compacted according to ``self.compaction``."""
+        if self.compaction is None or not self.compaction.applies_to(split_key(k)[1]):
+            return v, meta
+        v, info = self.compaction.compact(v)
+        if info is not None:
+            meta = dict(meta or {}, **{COMPACTION_META_KEY: info})
+        return v, meta
+
+    def __getitem__(self, k):
+        try:
+            return self.read(k)
+        except KeyError:
+            if hasattr(self, '__missing__'):
+                return self.__missing__(k)
+            raise
+
+    def write(self, k, v, meta=None):
+        """Write ``v`` under key ``k``, along with a ``meta`` dict of metadata
+        (stored in the same file, so reading it back costs no extra I/O)."""
+        from invest import metrics
+
+        m = metrics.registry
+        started = time.perf_counter() if m is not None else None
+        split_key(k)  # validate the key
+        codec = self._codec_to_write(k, v)
+        v, meta = self._compact(k, v, meta)
+        compression = self.compaction.compression if self.compaction else None
+
+        def write(filepath):
+            codec.write(filepath, v, meta, compression=compression)
+
+        try:
+            _atomic_write(self._filepath(k, codec), write)
+        except (TypeError, ValueError, _arrow_errors()):
+            if codec is PickleCodec:
+                raise
+            # arrow couldn't convert this value: fall back to pickle
+            codec = PickleCodec
+            _atomic_write(self._filepath(k, codec), write)
+        self._remove_other_formats(k, codec)
+        if m is not None:
+            _record_io(m, 'write', k, self._filepath(k, codec), started)
+        manifest = self._synced_manifest() if not is_hidden_key(k) else None
+        if manifest is not None:
+            manifest.record(k, self._manifest_entry(k, codec))
+
+    def __setitem__(self, k, v):
+        self.write(k, v)
+
+    def _remove_other_formats(self, k, keep_codec):
+        removed = False
+        for codec in codec_of_storage.values():
+            if codec is not keep_codec:
+                try:
+                    os.remove(self._filepath(k, codec))
+                    removed = True
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def __delitem__(self, k):
+        if not self._remove_other_formats(k, keep_codec=None):
+            self._fix_manifest(k, None)
+            raise KeyError(k)
+        manifest = self._synced_manifest() if not is_hidden_key(k) else None
+        if manifest is not None:
+            manifest.forget(k)
+
+    def __contains__(self, k):
+        try:
+            split_key(k)
+        except (ValueError, AttributeError):
+            return False
+        manifest = self._synced_manifest() if not is_hidden_key(k) else None
+        if manifest is not None:
+            return k in manifest.entries
+        return any(
+            os.path.isfile(self._filepath(k, codec)) for codec in self._codecs_to_read(k)
+        )
+
+    def __iter__(self):
+        manifest = self._synced_manifest()
+        if manifest is not None:
+            yield from sorted(manifest.entries)
+        else:
+            yield from self._scan_keys()
+
+    def _scan_keys(self):
+        extensions = tuple(codec.extension for codec in codec_of_storage.values())
+        if not os.path.isdir(self.rootdir):
+            return
+        for ticker_entry in os.scandir(self.rootdir):
+            if not ticker_entry.is_dir() or ticker_entry.name.startswith('.'):
+                continue  # (hidden keys are not listed)
+            fields = set()
+            for entry in os.scandir(ticker_entry.path):
+                name = entry.name
+                if name.startswith('.tmp_'):
+                    continue
+                for extension in extensions:
+                    if name.endswith(extension):
+                        fields.add(name[: -len(extension)])
+                        break
+            for field in sorted(fields):
+                yield ticker_entry.name + path_sep + field
+
+    def __len__(self):
+        manifest = self._synced_manifest()
+        if manifest is not None:
+            return len(manifest.entries)
+        return sum(1 for _ in self)
+
+    def _existing_filepath(self, k):
+        for codec in self._codecs_to_read(k):
+            filepath = self._filepath(k, codec)
+            if os.path.isfile(filepath):
+                return codec, filepath
+        raise KeyError(k)
+
+    def storage_of_key(self, k):
+        """The name of the storage format ``k`` is (currently) stored in."""
+        return self._existing_filepath(k)[0].name
+
+    def modified_time(self, k):
+        """The (unix) time the file of ``k`` was last modified."""
+        return os.path.getmtime(self._existing_filepath(k)[1])
+
+    def __repr__(self):
+        return f"{type(self).__name__}('{self.rootdir}', storage='{self.storage}')"
+
+
+def _arrow_errors():
+    try:
+        import pyarrow as pa
+
+        return pa.ArrowException
+    except ImportError:
+        return ImportError
+
+
+def migrate_storage(src, dst=None, *, storage='parquet', keys=None, verbose=True):
+    """Rewrite the data of a ``TickerFiles`` store (e.g. a pickle tree) with
+    another ``storage`` format.
+
+    :param src: The store (or the root directory of the store) to migrate
+    :param dst: The store (or root directory) to write to. If not given, the
+        migration is done in place: the old files are replaced by the new ones.
+    :param storage: The storage format to migrate to
+    :param keys: The keys to migrate (default: all the keys of ``src``)
+    :return: A dict of the number of keys per resulting storage format
+
+    The migration can be interrupted and restarted: keys that are already in the
+    target format are skipped.
+    """
+    if not isinstance(src, TickerFiles):
+        src = TickerFiles(src)
+    if dst is None:
+        dst = src.rootdir
+    if not isinstance(dst, TickerFiles):
+        dst = TickerFiles(dst, storage=storage)
+    in_place = dst.rootdir == src.rootdir
+    counts = dict()
+    for i, k in enumerate(src if keys is None else keys):
+        stored_as = src.storage_of_key(k)
+        if not in_place or stored_as != dst._codec_of_field(k).name:
+            dst.write(k, *src.read_with_meta(k))
+            stored_as = dst.storage_of_key(k)
+            if verbose and i % 1000 == 0:
+                print(f'{i}: {k} -> {stored_as}')
+        counts[stored_as] = counts.get(stored_as, 0) + 1
+    return counts
+
+
+def disk_usage(rootdir):
+    """The total number of bytes of the files under ``rootdir``."""
+    return sum(
+        os.path.getsize(os.path.join(dirpath, filename))
+        for dirpath, _, filenames in os.walk(rootdir)
+        for filename in filenames
+    )
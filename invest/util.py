@@ -7,8 +7,6 @@ import os
 from typing import Iterable
 from datetime import datetime
 
-import requests as _requests
-
 DFLT_TICKER = "GOOG"
 DFLT_DATE_FORMAT = '%Y-%m-%d:%H:%M:%S'
 
@@ -16,10 +14,10 @@ DFLT_REQUEST_HEADER = {'User-Agent': 'Mozilla/5.0'}
 
 
 def requests_get(*args, headers=DFLT_REQUEST_HEADER, **kwargs):
-    response = _requests.get(*args, headers=headers, **kwargs)
-    if not response.ok:
-        response.raise_for_status()
-    return response
+    """``GET`` through the shared, pooled, retrying session of ``invest.net``"""
+    from invest.net import requests_get as _requests_get
+
+    return _requests_get(*args, headers=headers, **kwargs)
 
 
 def read_html(url, **kwargs):
@@ -53,6 +51,68 @@ def print_progress(msg, refresh=None, display_time=True):
         print(msg)
 
 
+def approx_nbytes(obj):
+    """An estimate of the number of bytes ``obj`` takes.
+
+    Uses ``memory_usage(deep=True)`` for pandas objects (cheap, no serialization)
+    and the length of the pickle for anything else.
+
+    >>> approx_nbytes(b'12345')
+    20
+    """
+    memory_usage = getattr(obj, 'memory_usage', None)
+    if memory_usage is not None:
+        try:
+            nbytes = memory_usage(deep=True)
+            return int(getattr(nbytes, 'sum', lambda: nbytes)())
+        except TypeError:
+            pass
+    import pickle
+
+    try:
+        return len(pickle.dumps(obj))
+    except Exception:
+        import sys
+
+        return sys.getsizeof(obj)
+
+
+def bounded_thread_map(func, items: Iterable, handle_done, *, max_workers: int):
+    """Call ``func(item)`` for ``items``, in ``max_workers`` threads, calling
+    ``handle_done(item, future)`` (in the calling thread) as each call completes.
+
+    At most ``2 * max_workers`` calls are in flight at any time, so ``items`` can be a
+    large (lazy) iterable. If interrupted (e.g. by an error of ``handle_done``), the
+    calls that haven't started are cancelled.
+
+    >>> squares = dict()
+    >>> bounded_thread_map(
+    ...     lambda x: x * x, range(5), lambda x, f: squares.update({x: f.result()}),
+    ...     max_workers=2,
+    ... )
+    >>> sorted(squares.items())
+    [(0, 0), (1, 1), (2, 4), (3, 9), (4, 16)]
+    """
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+    max_in_flight = 2 * max_workers
+    in_flight = dict()  # future -> item
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for item in items:
+            if len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    handle_done(in_flight.pop(future), future)
+            in_flight[executor.submit(func, item)] = item
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                handle_done(in_flight.pop(future), future)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
 def all_info(ticker):
     for k, v in ticker.items():
         if hasattr(v, '__len__'):
@@ -103,7 +163,12 @@ def clog(condition, *args):
         print(*args)
 
 
-def handle_missing_dir(dirpath, prefix_msg='', ask_first=True, verbose=True):
+def handle_missing_dir(dirpath, prefix_msg='', ask_first=False, verbose=False):
+    """Make the ``dirpath`` directory (and its parents) if it doesn't exist.
+
+    Only asks for confirmation (with an ``input`` prompt) if ``ask_first=True``,
+    so it's safe to use in non-interactive processes.
+    """
     if not os.path.isdir(dirpath):
         if ask_first:
             clog(verbose, prefix_msg)
@@ -112,7 +177,7 @@ def handle_missing_dir(dirpath, prefix_msg='', ask_first=True, verbose=True):
             if next(iter(answer.strip().lower()), None) != 'y':
                 return
         clog(verbose, f"Making {dirpath}...")
-        os.mkdir(dirpath)
+        os.makedirs(dirpath, exist_ok=True)
 
 
 import json
@@ -156,3 +221,44 @@ def is_bsonizable(obj):
         return True
     except Exception:
         return False
+
+
+_BSON_SCALAR_TYPES = (type(None), bool, int, float, str, bytes, datetime)
+_INT64_MIN, _INT64_MAX = -(2**63), 2**63 - 1
+
+
+def is_bson_compatible(obj):
+    """Whether ``obj`` can be encoded as BSON, checked structurally: by looking at the
+    types of its contents, without serializing anything (so much faster than
+    ``is_bsonizable``, which does a full ``json_util`` round trip).
+
+    Containers must be dicts with string keys, lists or tuples, and the scalars must
+    be of BSON types (python, or subclasses, like ``numpy.float64`` or ``pd.Timestamp``,
+    or ``bson`` types). Note that ``numpy`` integers and booleans are not ``int`` or
+    ``bool`` subclasses, so are not BSON compatible.
+
+    >>> is_bson_compatible({"date": datetime.now(), "values": [1, 2.5, None]})
+    True
+    >>> is_bson_compatible({datetime.now(): "datetime objects allowed as values, not keys"})
+    False
+    >>> is_bson_compatible({"too_big": 2**64})
+    False
+    """
+    stack = [obj]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, dict):
+            for k, v in x.items():
+                if not isinstance(k, str):
+                    return False
+                stack.append(v)
+        elif isinstance(x, (list, tuple)):
+            stack.extend(x)
+        elif isinstance(x, _BSON_SCALAR_TYPES):
+            if isinstance(x, int) and not _INT64_MIN <= x <= _INT64_MAX:
+                return False
+            if type(x).__name__ == 'NaTType':  # a datetime subclass, but not a date
+                return False
+        elif not type(x).__module__.startswith('bson'):  # ObjectId, Decimal128...
+            return False
+    return True